@@ -16,11 +16,42 @@ Key Features:
 - Parses mathematical expressions using regular expressions
 - Comprehensive error checking of inputs to ensure integrity of mathematical expression
 - allows control of number of decimal points to display in output
+- integer-only arithmetic kept exact as Python int up to INTEGER_LIMIT_BITS
+- compile-once expressions (Calculator.compile) that can be evaluated repeatedly,
+  optionally as generated Python functions (backend='codegen')
+- named variables, evaluated for scalars or element-wise over NumPy arrays (optional)
+- optional LRU cache of compiled expressions and results for repeated inputs, optionally backed by
+  a persistent SQLite cache shared across processes and restarts (see "Calculator_cache.py")
+- single-pass tokenizer with fused validation that reports the position of input errors
+- incremental re-tokenization of edited expressions (IncrementalTokenizer)
+- compact opcode/float64 token streams (TokenStream) reduced in linear time for long expressions
+- lazy batch calculation of iterables and files, optionally across a process pool
+- optional per-stage timing and error metrics (see "Calculator_metrics.py")
+- resource limits (ResourceLimits) and cooperative cancellation (CancellationToken) for untrusted input
+- command line batch mode for pipelines (see main()), buffered plain, TSV or JSONL output
 - CLI interaction through this script and GUI interaction through accompanying "Calculator_GUI.py" script
 """
 
+import time
+#start of the module import, for the import time reported by the CLI
+_IMPORT_STARTED = time.perf_counter()
+
 import re
-from typing import List, Union, Tuple
+import os
+import sys
+import math
+import mmap
+import operator
+import threading
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from functools import lru_cache
+from itertools import islice, tee
+from typing import Callable, List, Union, Tuple, Optional, Iterable, Iterator, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    #concurrent.futures is only imported when a process pool is started, it dominates startup time
+    from concurrent.futures import Executor
 
 class CalculatorError:
     """Predefined error messages for calculator operations."""
@@ -37,25 +68,1017 @@ class CalculatorError:
         'CALCULATION_INCOMPLETE': 'Error: Calculation incomplete',
         'IMPROPER_PARENTHESIS': 'Invalid: Improperly paired parenthesis',
         'OVERFLOW': 'Error: Overflow due to large numbers',
+        'RESOURCE_LIMIT': 'Error: Resource limit exceeded',
+        'UNDEFINED_REFERENCE': 'Invalid: Undefined cell reference',
     }
+    #numeric error codes for array results, 0 means no error
+    ERROR_CODES = {key: code for code, key in enumerate(ERROR_TYPES, 1)}
+
     @classmethod
     def get_error_message(cls, error_key: str) -> str:
         """Retrieve standardized error message."""
         return cls.ERROR_TYPES.get(error_key, 'Unknown Error')
 
+    @classmethod
+    def get_error_code(cls, error_key: str) -> int:
+        """Retrieve the numeric code of an error key (0 for no error)."""
+        return cls.ERROR_CODES.get(error_key, 0)
+
+    @classmethod
+    def get_error_key(cls, error_message: str) -> str:
+        """Retrieve the error key for a standardized error message."""
+        for key, message in cls.ERROR_TYPES.items():
+            if message == error_message:
+                return key
+        return ''
+
+
+#regular expressions shared by every calculation
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_TOKEN_PATTERN = re.compile(r'\d+\.?\d*|\d*\.?\d+|[()*/+-^]')
+_NUMBER_PATTERN = re.compile(r'\d+\.?\d*|\d*\.?\d+')
+_IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_]\w*')
+
+#single-pass scanner: spaces may appear inside numbers because they are
+#ignored, any other character is scanned on its own
+_SCAN_PATTERN = re.compile(r'[0-9][0-9 ]*(?:\.[0-9 ]*)?|\.[ ]*[0-9][0-9 ]*|[ ]+|.', re.DOTALL)
+_SCAN_VARIABLE_PATTERN = re.compile(
+    r'[0-9][0-9 ]*(?:\.[0-9 ]*)?|\.[ ]*[0-9][0-9 ]*|[ ]+|[A-Za-z_]\w*|.', re.DOTALL)
+_DIGITS = frozenset('0123456789')
+_SYMBOLS = frozenset('+-*/^()')
+
+#read size for expression files
+FILE_BUFFER_SIZE = 1 << 20
+#integer literals and results are kept exact up to this many bits (at least 53);
+#larger ones are computed as floats like every other operand, where they overflow as before
+INTEGER_LIMIT_BITS = 1024
+#expressions sent to a worker process at a time
+BATCH_CHUNK_SIZE = 1000
+#result lines the CLI writes to its output at a time
+OUTPUT_BATCH_SIZE = 4096
+#scanned pieces between checkpoints of IncrementalTokenizer
+TOKENIZE_CHECKPOINT_INTERVAL = 64
+
+
+@lru_cache(maxsize=None)
+def _value_formatter(decimal_places: int) -> Callable[[object], str]:
+    """
+    Function formatting one result for display, built once per number of decimal places.
+
+    A float whose shortest representation has at least decimal_places digits
+    after the point (in the mantissa of the exponent form) is rounded to
+    decimal_places, and a whole float is shown as an integer. round() gives
+    the same correctly rounded value as formatting with '.{decimal_places}f'
+    and parsing it back, and a rounding that changes nothing is skipped
+    without looking at the representation.
+    """
+    def format_value(item) -> str:
+        if item.__class__ is float:
+            if item.is_integer():
+                return str(int(item))
+            if decimal_places < 0:
+                #no representation has a negative number of digits to round
+                return str(item)
+            rounded = round(item, decimal_places)
+            if rounded != item:
+                text = str(item)
+                point = text.find('.')
+                if point >= 0:
+                    exponent = text.find('e', point)
+                    if (len(text) if exponent < 0 else exponent) - point - 1 >= decimal_places:
+                        return str(int(rounded)) if rounded.is_integer() else str(rounded)
+            return str(item)
+        if isinstance(item, float):
+            #float subclasses such as numpy.float64 are formatted as floats
+            return format_value(float(item))
+        return str(item)
+    return format_value
+
+
+def _variable_names(variables: Iterable[str]) -> frozenset:
+    """Validate variable names for the tokenizer."""
+    names = frozenset(variables)
+    for name in names:
+        if not _IDENTIFIER_PATTERN.fullmatch(name):
+            raise ValueError(f'invalid variable name: {name!r}')
+    return names
+
+
+def _number(text: str) -> Union[int, float]:
+    """Convert a scanned number without spaces, keeping integers exact."""
+    #a literal of d digits has at least 3*(d-1) bits, so long ones are never parsed as int
+    if '.' in text or (len(text) - 1) * 3 > INTEGER_LIMIT_BITS:
+        return float(text)
+    value = int(text)
+    return value if value.bit_length() <= INTEGER_LIMIT_BITS else float(text)
+
+
+def _exact_multiply(left, right):
+    """
+    Multiplication that keeps an integer product exact when it fits INTEGER_LIMIT_BITS,
+    a larger one is computed from float operands as before integers were kept.
+
+    Sums and differences need no check, they grow by at most one bit.
+    """
+    result = left * right
+    if result.__class__ is int and result.bit_length() > INTEGER_LIMIT_BITS:
+        return float(left) * float(right)
+    return result
+
+
+def _exact_power(base, exponent):
+    """
+    Exponentiation that keeps an integer power exact when it fits INTEGER_LIMIT_BITS.
+
+    |base|^exponent has at least (bit_length - 1) * exponent bits, so powers that
+    can't fit are predicted from the operands and computed as floats (where they
+    raise OverflowError) without building the integer first. int.__pow__ itself
+    is exponentiation by squaring.
+    """
+    if base.__class__ is int and exponent.__class__ is int and exponent > 0:
+        if (abs(base).bit_length() - 1) * exponent > INTEGER_LIMIT_BITS:
+            return float(base) ** float(exponent)
+        result = base ** exponent
+        if result.bit_length() > INTEGER_LIMIT_BITS:
+            return float(base) ** float(exponent)
+        return result
+    return base ** exponent
+
+
+#binary operators in the order of the reduction passes
+_OPERATIONS = {
+    '^': operator.pow,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '+': operator.add,
+    '-': operator.sub,
+}
+_REDUCTION_PASSES = (frozenset('^'), frozenset('*/'), frozenset('+-'))
+
+
+def _real_operands(function):
+    """
+    Wrap an operator whose operands may come from an exponentiation.
+
+    The reduction passes convert every operand with float(), which rejects the
+    complex result of a negative base raised to a fractional exponent.
+    """
+    def checked(left, right):
+        if isinstance(left, complex) or isinstance(right, complex):
+            raise TypeError('complex value used as an operand')
+        return function(left, right)
+    return checked
+
+
+_CHECKED_OPERATIONS = {op: _real_operands(function) for op, function in _OPERATIONS.items()}
+#operators for operands that may both be integers
+_EXACT_OPERATIONS = {
+    '^': _exact_power,
+    '*': _exact_multiply,
+    '/': operator.truediv,
+    '+': operator.add,
+    '-': operator.sub,
+}
+
+
+class _Variable:
+    """Token for a named variable, optionally negated by a leading '-'."""
+
+    __slots__ = ('name', 'negative')
+
+    def __init__(self, name: str, negative: bool = False):
+        self.name = name
+        self.negative = negative
+
+    def __neg__(self) -> '_Variable':
+        return _Variable(self.name, not self.negative)
+
+
+#token types that hold a value
+_NUMBER_TYPES = (int, float)
+_NUMBER_CLASSES = frozenset(_NUMBER_TYPES)
+_OPERAND_TYPES = _NUMBER_TYPES + (_Variable,)
+_OPERAND_CLASSES = frozenset(_OPERAND_TYPES)
+
+#opcodes of TokenStream symbols are their index here, 0 marks an operand
+_STREAM_SYMBOLS = ('', '+', '-', '*', '/', '^', '(', ')', '.')
+_STREAM_OPCODES = {symbol: opcode for opcode, symbol in enumerate(_STREAM_SYMBOLS) if symbol}
+_STREAM_OPERAND = 0
+_STREAM_OPEN = _STREAM_OPCODES['(']
+_STREAM_OPERATIONS = tuple(_OPERATIONS.get(symbol) for symbol in _STREAM_SYMBOLS)
+
+
+def _opcode_pattern(symbols: Iterable[str]) -> 're.Pattern':
+    """Byte pattern matching the opcode of any of the symbols."""
+    return re.compile(b'[' + re.escape(bytes(_STREAM_OPCODES[symbol] for symbol in sorted(symbols))) + b']')
+
+
+#patterns finding the opcodes each stage acts on
+_STREAM_PASS_PATTERNS = {symbols: _opcode_pattern(symbols) for symbols in _REDUCTION_PASSES}
+_STREAM_PARENTHESIS_PATTERN = _opcode_pattern('()')
+_STREAM_MINUS_PATTERN = _opcode_pattern('-')
+#operators and parentheses, the tokens a "-" is merged after
+_STREAM_OPERATOR_OPCODES = range(_STREAM_OPCODES['+'], _STREAM_OPCODES[')'] + 1)
+#token count from which calculate() reduces a TokenStream instead of a list,
+#shorter lists are moved around faster than a stream is built
+STREAM_MIN_TOKENS = 4096
+#pieces tokenized or stream operations between checks of a cancellation token,
+#and pieces between token count checks of ResourceLimits
+LIMIT_CHECK_INTERVAL = 1024
+#2^53, from where float64 values no longer hold every integer
+_STREAM_EXACT_LIMIT = float(2 ** 53)
+
+
+class _InexactStreamError(TypeError):
+    """Raised by an exact TokenStream for a value float64 may not hold exactly."""
+
+
+class TokenStream:
+    """
+    Compact token list holding an opcode byte and a float64 value per token.
+
+    Operands have opcode 0 and their value in `values`. Symbols have the opcode
+    of their index in _STREAM_SYMBOLS and a value of 0. The stages of
+    Calculator accept a TokenStream in place of a list and update it in place,
+    moving runs of untouched tokens with slice copies instead of one by one.
+    Integers are stored as float64 too, so they are only exact up to 2^53 here.
+    An exact stream raises _InexactStreamError, a TypeError, for any value of
+    2^53 or more in magnitude, so callers can use the list stages instead.
+    """
+
+    __slots__ = ('opcodes', 'values', 'exact')
+
+    def __init__(self, opcodes: Optional[array] = None, values: Optional[array] = None, exact: bool = False):
+        self.opcodes = opcodes if opcodes is not None else array('B')
+        self.values = values if values is not None else array('d')
+        self.exact = exact
+
+    @classmethod
+    def from_tokens(cls, tokens: Iterable[Union[float, str]], exact: bool = False) -> 'TokenStream':
+        """
+        Build a stream from a token list of floats and symbol strings.
+
+        Args:
+            tokens (list): floats, integers and symbol strings
+            exact (bool): reject values float64 may not hold exactly, see TokenStream
+
+        Raises:
+            ValueError: for a string that is neither a symbol nor a number
+            TypeError: for a value of 2^53 or more in an exact stream
+        """
+        get_opcode = _STREAM_OPCODES.get
+        opcodes = array('B', [get_opcode(token, _STREAM_OPERAND) for token in tokens])
+        try:
+            values = array('d', [
+                0.0 if opcode else token if token.__class__ is float else float(token)
+                for token, opcode in zip(tokens, opcodes)
+                ])
+        except OverflowError:
+            if exact:
+                raise _InexactStreamError('integer too large for float64') from None
+            raise
+        if exact and values and (max(values) >= _STREAM_EXACT_LIMIT or min(values) <= -_STREAM_EXACT_LIMIT):
+            raise _InexactStreamError('value not exact in float64')
+        return cls(opcodes, values, exact)
+
+    def to_list(self) -> List[Union[float, str]]:
+        """Convert back to a list of floats and symbol strings."""
+        return [
+            value if not opcode else _STREAM_SYMBOLS[opcode]
+            for opcode, value in zip(self.opcodes, self.values)
+            ]
+
+    def truncate(self, length: int) -> 'TokenStream':
+        """Drop the tokens from length on and return the stream."""
+        del self.opcodes[length:]
+        del self.values[length:]
+        return self
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+
+def _move_stream_run(stream: TokenStream, write: int, read: int, end: int) -> int:
+    """Move the tokens read..end down to write, returning the new write index."""
+    if write != read:
+        stream.opcodes[write:write + end - read] = stream.opcodes[read:end]
+        stream.values[write:write + end - read] = stream.values[read:end]
+    return write + end - read
+
+
+def _reduce_stream_pass(
+        stream: TokenStream,
+        symbols: frozenset,
+        start: int,
+        end: int,
+        cancel: Optional['CancellationToken'] = None
+        ) -> int:
+    """
+    Apply the operators of one reduction pass to tokens start..end, left to right.
+
+    Raises the same errors as the list passes: ValueError for an operator
+    without a number on either side, ZeroDivisionError, OverflowError, and
+    TypeError for a complex power, which a float64 value can't hold, or for
+    a result of 2^53 or more in an exact stream. The cancellation token is
+    checked every LIMIT_CHECK_INTERVAL operations.
+
+    Returns:
+        int: end of the reduced range
+    """
+    opcodes = stream.opcodes
+    values = stream.values
+    operations = _STREAM_OPERATIONS
+    exact = stream.exact
+    write = read = start
+    for count, match in enumerate(_STREAM_PASS_PATTERNS[symbols].finditer(opcodes[start:end].tobytes()), 1):
+        if cancel is not None and not count % LIMIT_CHECK_INTERVAL:
+            cancel.check()
+        index = start + match.start()
+        if index != read:
+            if write != read:
+                opcodes[write:write + index - read] = opcodes[read:index]
+                values[write:write + index - read] = values[read:index]
+            write += index - read
+        if write == start or opcodes[write - 1] or index + 1 >= end or opcodes[index + 1]:
+            raise ValueError('operator without a number on both sides')
+        value = values[write - 1] = operations[opcodes[index]](values[write - 1], values[index + 1])
+        if exact and not -_STREAM_EXACT_LIMIT < value < _STREAM_EXACT_LIMIT:
+            raise _InexactStreamError('value not exact in float64')
+        read = index + 2
+    return _move_stream_run(stream, write, read, end)
+
+
+def _reduce_stream_range(
+        stream: TokenStream,
+        start: int,
+        end: int,
+        cancel: Optional['CancellationToken'] = None
+        ) -> int:
+    """Apply the three reduction passes to tokens start..end and return the new end."""
+    opcodes = stream.opcodes
+    #a single number or operation, the usual parenthetical group, needs no search
+    if end - start == 1 and not opcodes[start]:
+        return end
+    if end - start == 3 and not opcodes[start] and opcodes[start + 1] and not opcodes[start + 2]:
+        operation = _STREAM_OPERATIONS[opcodes[start + 1]]
+        if operation is not None:
+            values = stream.values
+            value = values[start] = operation(values[start], values[start + 2])
+            if stream.exact and not -_STREAM_EXACT_LIMIT < value < _STREAM_EXACT_LIMIT:
+                raise _InexactStreamError('value not exact in float64')
+            return start + 1
+    for symbols in _REDUCTION_PASSES:
+        end = _reduce_stream_pass(stream, symbols, start, end, cancel)
+    return end
+
+
+class _ProgramBuilder:
+    """Collects operands and operations of a compiled expression as numbered slots."""
+
+    __slots__ = ('constants', 'instructions', 'variables')
+
+    def __init__(self):
+        self.constants = []
+        self.instructions = []
+        self.variables = {}
+
+    def operand(self, value: float) -> int:
+        """Register a literal operand and return its slot."""
+        self.constants.append(value)
+        return len(self.constants) - 1
+
+    def variable(self, name: str, negative: bool) -> int:
+        """Register a variable operand and return its slot, shared by equal occurrences."""
+        key = (name, negative)
+        if key not in self.variables:
+            self.variables[key] = self.operand(None)
+        return self.variables[key]
+
+    def operation(self, operator_char: str, left: int, right: int) -> int:
+        """Register a binary operation on two slots and return the result slot."""
+        self.instructions.append((operator_char, left, right))
+        return len(self.constants) + len(self.instructions) - 1
+
+
+def _reduce_group(elements: list, builder: _ProgramBuilder) -> Optional[list]:
+    """
+    Apply the exponent, multiply/divide and add/subtract passes symbolically.
+
+    Mirrors Calculator.exponent/multi_divide/add_subtract, but builds a new list
+    per pass instead of deleting in place, so each pass is linear.
+
+    Args:
+        elements (list): slot numbers (int) and tokens (str)
+        builder (_ProgramBuilder): receives one operation per reduction
+
+    Returns:
+        list: reduced elements, or None if an operator has a non-numeric neighbour
+    """
+    for operators in _REDUCTION_PASSES:
+        reduced = []
+        i = 0
+        length = len(elements)
+        while i < length:
+            item = elements[i]
+            if item.__class__ is str and item in operators:
+                if not reduced or i + 1 >= length:
+                    return None
+                left = reduced.pop()
+                right = elements[i + 1]
+                if left.__class__ is not int or right.__class__ is not int:
+                    return None
+                reduced.append(builder.operation(item, left, right))
+                i += 2
+            else:
+                reduced.append(item)
+                i += 1
+        elements = reduced
+    return elements
+
+
+#evaluation backends of CompiledExpression
+BACKENDS = ('interpreter', 'codegen')
+#calculation engines of calculate(), all returning the same (result, error) tuples:
+#'reduction' reduces the token list pass by pass (exponent, multi_divide, add_subtract),
+#the others compile the expression and run it with that CompiledExpression backend
+ENGINES = ('reduction',) + BACKENDS
+#version of the results and compiled programs of every engine, part of the keys of
+#persistent caches; increase it whenever a result, error or program could change
+ENGINE_VERSION = 1
+#programs longer than this are interpreted even with the codegen backend,
+#compiling their source would cost more than the evaluations save
+CODEGEN_MAX_INSTRUCTIONS = 20000
+#generated functions kept, keyed by their source
+CODEGEN_CACHE_SIZE = 1024
+_CODEGEN_OPERATORS = {'^': '**', '*': '*', '/': '/', '+': '+', '-': '-'}
+#calls replacing the operators of _CODEGEN_OPERATORS for two integer operands
+_CODEGEN_EXACT_CALLS = {'^': '_exact_power', '*': '_exact_multiply'}
+_CODEGEN_GLOBALS = {
+    '__builtins__': {}, 'complex': complex, 'TypeError': TypeError, '_inf': float('inf'),
+    '_exact_power': _exact_power, '_exact_multiply': _exact_multiply,
+}
+
+
+def _integer_slots(constants: Tuple, instructions: Tuple) -> frozenset:
+    """
+    Slots of a compiled program that may hold an int.
+
+    Variables are bound as floats, so only integer literals and operations on
+    two such slots other than '/' can. Those operations need the _EXACT_OPERATIONS.
+    """
+    slots = {slot for slot, value in enumerate(constants) if value.__class__ is int}
+    first_slot = len(constants)
+    for index, (op, left, right) in enumerate(instructions):
+        if op != '/' and left in slots and right in slots:
+            slots.add(first_slot + index)
+    return frozenset(slots)
+
+
+def _source_literal(value: Union[int, float]) -> str:
+    """Python source evaluating to exactly the given number."""
+    text = repr(value)
+    if text == 'inf':
+        return '_inf'
+    if text == '-inf':
+        return '(-_inf)'
+    return f'({text})' if text.startswith('-') else text
+
+
+def _expression_source(
+        constants: Tuple,
+        instructions: Tuple,
+        result: Union[int, str, None],
+        variable_slots: Tuple,
+        variables: Tuple
+        ) -> str:
+    """
+    Generate the source of a function performing a compiled program.
+
+    Every instruction becomes one assignment, in program order, so errors are
+    raised in the same order as by the reduction passes. A '^' result is checked
+    for a complex value where it is used, where float() would reject it.
+
+    Returns:
+        str: source defining expression(v0, v1, ...), taking the variables in
+        the order of `variables` and returning the value of the result slot
+    """
+    parameters = {name: f'v{index}' for index, name in enumerate(variables)}
+    names = {slot: _source_literal(value) for slot, value in enumerate(constants) if value is not None}
+    lines = [f"def expression({', '.join(parameters.values())}):"]
+    for slot, name, negative in variable_slots:
+        if negative:
+            lines.append(f'    s{slot} = -1 * {parameters[name]}')
+            names[slot] = f's{slot}'
+        else:
+            names[slot] = parameters[name]
+
+    first_slot = len(constants)
+    integers = _integer_slots(constants, instructions)
+    powers = set()
+    for index, (op, left, right) in enumerate(instructions):
+        for operand in (left, right):
+            if operand in powers and operand not in integers:
+                lines.append(f'    if s{operand}.__class__ is complex: raise TypeError')
+        slot = first_slot + index
+        if slot in integers and op in _CODEGEN_EXACT_CALLS:
+            lines.append(f'    s{slot} = {_CODEGEN_EXACT_CALLS[op]}({names[left]}, {names[right]})')
+        else:
+            lines.append(f'    s{slot} = {names[left]} {_CODEGEN_OPERATORS[op]} {names[right]}')
+        names[slot] = f's{slot}'
+        if op == '^':
+            powers.add(slot)
+    lines.append(f'    return {names[result] if result.__class__ is int else None}')
+    return '\n'.join(lines) + '\n'
+
+
+@lru_cache(maxsize=CODEGEN_CACHE_SIZE)
+def _compile_expression_source(source: str):
+    """Compile generated source once and return its function."""
+    namespace = dict(_CODEGEN_GLOBALS)
+    exec(compile(source, '<calculator expression>', 'exec'), namespace)
+    return namespace['expression']
+
+
+class CompiledExpression:
+    """
+    Parsed form of an expression that can be evaluated any number of times.
+
+    Created by Calculator.compile(). The operations are stored as a flat
+    program in exactly the order the reduction passes of Calculator.calculate
+    perform them, so results and error messages are identical while each
+    evaluation is a single linear walk. With the 'codegen' backend the
+    program is turned into a Python function instead, so an evaluation runs
+    as plain bytecode. Instances are not modified after creation and can be
+    shared freely.
+    """
+
+    __slots__ = ('expression', 'variables', 'error_position', 'backend', '_calculator', '_constants',
+                 '_instructions', '_program', '_result', '_error', '_variable_slots', '_function')
+
+    def __init__(
+            self,
+            calculator: 'Calculator',
+            expression: str,
+            constants: Tuple = (),
+            instructions: Tuple = (),
+            result: Union[int, str, None] = None,
+            error: str = '',
+            variable_slots: Tuple = (),
+            error_position: int = -1,
+            backend: str = 'interpreter'
+            ):
+        """
+        Args:
+            calculator (Calculator): calculator used for output formatting
+            expression (str): original expression, returned with error messages
+            constants (tuple): literal operands, occupying the first slots
+            instructions (tuple): (operator, left slot, right slot) per operation
+            result (int or str): slot holding the final value, or a literal token
+            error (str): CalculatorError key reported after the program has run
+            variable_slots (tuple): (slot, name, negative) per bound variable slot
+            error_position (int): character offset of an input error, or -1
+            backend (str): 'interpreter' walks the program, 'codegen' runs it as a
+                generated Python function
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f'unknown backend: {backend!r}')
+        self.expression = expression
+        self.error_position = error_position
+        self._variable_slots = tuple(variable_slots)
+        self.variables = tuple(sorted({name for _, name, _ in self._variable_slots}))
+        self._calculator = calculator
+        self._constants = tuple(constants)
+        self._instructions = tuple(instructions)
+        self._result = result
+        self._error = error
+        #operations consuming an exponentiation result must reject complex values,
+        #an integer power is never complex
+        first_slot = len(self._constants)
+        powers = {first_slot + index for index, (op, _, _) in enumerate(self._instructions) if op == '^'}
+        integers = _integer_slots(self._constants, self._instructions)
+        self._program = tuple(
+            (_EXACT_OPERATIONS[op] if left in integers and right in integers
+             else _CHECKED_OPERATIONS[op] if left in powers or right in powers else _OPERATIONS[op],
+             left, right)
+            for op, left, right in self._instructions
+            )
+        self.backend = backend
+        self._function = None
+        if backend == 'codegen' and len(self._instructions) <= CODEGEN_MAX_INSTRUCTIONS:
+            self._function = _compile_expression_source(self.python_source())
+
+    def python_source(self) -> str:
+        """
+        Source of the function the codegen backend runs for this expression.
+
+        Returns:
+            str: definition of expression(v0, v1, ...), one parameter per name in
+            self.variables, returning the unformatted result
+        """
+        return _expression_source(
+            self._constants, self._instructions, self._result, self._variable_slots, self.variables)
+
+    def _bind(self, values: dict, convert) -> list:
+        """Build the initial slot list with variable values filled in."""
+        slots = list(self._constants)
+        for slot, name, negative in self._variable_slots:
+            try:
+                value = convert(values[name])
+            except KeyError:
+                raise TypeError(f"missing value for variable '{name}'") from None
+            slots[slot] = -1 * value if negative else value
+        return slots
+
+    def compute(self, **values: float) -> Tuple[Union[float, str, None], str]:
+        """
+        Run the compiled program.
+
+        Args:
+            **values (float): value of each variable of the expression
+
+        Returns:
+            Tuple of (unformatted result, CalculatorError key or empty string)
+        """
+        if self._function is not None:
+            return self._compute_function(values)
+        slots = self._bind(values, float) if self._variable_slots else list(self._constants)
+        append = slots.append
+        try:
+            for function, left, right in self._program:
+                append(function(slots[left], slots[right]))
+        except ZeroDivisionError:
+            return None, 'DIVISION_BY_ZERO'
+        except OverflowError:
+            return None, 'OVERFLOW'
+        except TypeError:
+            return None, 'CALCULATION_INCOMPLETE'
+        if self._error:
+            return None, self._error
+        result = self._result
+        if result.__class__ is int:
+            return slots[result], ''
+        return result, ''
+
+    def _compute_function(self, values: dict) -> Tuple[Union[float, str, None], str]:
+        """compute() through the generated function of the codegen backend."""
+        try:
+            arguments = [float(values[name]) for name in self.variables]
+        except KeyError as error:
+            raise TypeError(f"missing value for variable '{error.args[0]}'") from None
+        try:
+            value = self._function(*arguments)
+        except ZeroDivisionError:
+            return None, 'DIVISION_BY_ZERO'
+        except OverflowError:
+            return None, 'OVERFLOW'
+        except TypeError:
+            return None, 'CALCULATION_INCOMPLETE'
+        if self._error:
+            return None, self._error
+        return (value, '') if self._result.__class__ is int else (self._result, '')
+
+    def evaluate(self, decimal_places: int, **values: float) -> Tuple[str, str]:
+        """
+        Evaluate the expression.
+
+        Args:
+            decimal_places (int): number of decimal places to return
+            **values (float): value of each variable of the expression
+
+        Returns:
+            Tuple of (result, error_message), as returned by Calculator.calculate
+        """
+        value, error_key = self.compute(**values)
+        if error_key:
+            return self.expression, CalculatorError.get_error_message(error_key)
+        return self._calculator.output_clean_convert([value], decimal_places), ''
+
+    def evaluate_array(self, **values) -> Tuple['numpy.ndarray', 'numpy.ndarray']:
+        """
+        Evaluate the expression element-wise over NumPy arrays.
+
+        Variables may be given as arrays or scalars and are broadcast together.
+        Errors do not abort the evaluation; each element records the first
+        error it would have raised in calculate(): division by zero, overflow
+        of '^', or a complex value (which cannot be stored in a float array).
+
+        Args:
+            **values (array_like): value(s) of each variable of the expression
+
+        Returns:
+            Tuple of (float64 results, uint8 CalculatorError codes), where
+            results are NaN wherever the code is non-zero
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('NumPy is required for CompiledExpression.evaluate_array()') from None
+
+        float_array = lambda value: numpy.asarray(value, dtype=numpy.float64)
+        slots = self._bind(values, float_array)
+        for index, value in enumerate(slots):
+            if value.__class__ is not numpy.ndarray and value is not None:
+                slots[index] = float(value)
+        shape = numpy.broadcast_shapes(*(numpy.shape(value) for value in values.values()))
+        errors = numpy.zeros(shape, dtype=numpy.uint8)
+
+        def mark(condition, error_key):
+            errors[(errors == 0) & condition] = CalculatorError.get_error_code(error_key)
+
+        complex_slots = {}
+        with numpy.errstate(all='ignore'):
+            for op, left, right in self._instructions:
+                left_value = slots[left]
+                right_value = slots[right]
+                for slot in (left, right):
+                    if slot in complex_slots:
+                        mark(complex_slots[slot], 'CALCULATION_INCOMPLETE')
+                if op == '/':
+                    mark(right_value == 0, 'DIVISION_BY_ZERO')
+                elif op == '^':
+                    mark((left_value == 0) & (right_value < 0), 'DIVISION_BY_ZERO')
+                value = _OPERATIONS[op](float_array(left_value), right_value)
+                if op == '^':
+                    finite = numpy.isfinite(left_value) & numpy.isfinite(right_value)
+                    mark(numpy.isinf(value) & finite, 'OVERFLOW')
+                    complex_slots[len(slots)] = (left_value < 0) & (numpy.floor(right_value) != right_value)
+                slots.append(value)
+
+            result = self._result
+            if self._error:
+                mark(True, self._error)
+            elif result.__class__ is not int:
+                mark(True, 'CALCULATION_INCOMPLETE')
+            elif result in complex_slots:
+                mark(complex_slots[result], 'CALCULATION_INCOMPLETE')
+            results = numpy.empty(shape, dtype=numpy.float64)
+            results[...] = slots[result] if result.__class__ is int and not self._error else numpy.nan
+        results[errors != 0] = numpy.nan
+        return results, errors
+
+
+TokenizeResult = namedtuple('TokenizeResult', ['tokens', 'positions', 'error_key', 'error_position'])
+
+#limits of one calculate() call, None disables a limit: tokens after tokenizing,
+#parenthesis nesting depth, absolute value of any operation result, seconds,
+#and characters of the input, checked before tokenizing
+ResourceLimits = namedtuple(
+    'ResourceLimits', ['max_tokens', 'max_depth', 'max_magnitude', 'timeout', 'max_length'],
+    defaults=(None, None, None, None, None))
+
+
+class ResourceLimitError(Exception):
+    """Raised by the calculation stages when a resource limit is hit or the calculation is cancelled."""
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation flag checked by the reduction passes.
+
+    Another thread calls cancel() to stop calculations holding the token at
+    their next operation. A token with a timeout also cancels itself once the
+    deadline passes, and a token with a parent is cancelled with it.
+    """
+
+    __slots__ = ('deadline', 'parent', '_cancelled')
+
+    def __init__(self, timeout: Optional[float] = None, parent: Optional['CancellationToken'] = None):
+        """
+        Args:
+            timeout (float): seconds from now after which the token is cancelled
+            parent (CancellationToken): token whose cancellation also cancels this one
+        """
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.parent = parent
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        """Cancel every calculation holding this token."""
+        self._cancelled = True
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancel() was called, the deadline passed or the parent is cancelled."""
+        if self._cancelled:
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return self.parent is not None and self.parent.cancelled
+
+    def check(self) -> None:
+        """
+        Raises:
+            ResourceLimitError: when the token is cancelled
+        """
+        if self.cancelled:
+            raise ResourceLimitError('calculation cancelled')
+
+
+def _check_operation(value, cancel: Optional[CancellationToken], max_magnitude: Optional[float]) -> None:
+    """Check the result of one operation against the cancellation token and magnitude limit."""
+    if cancel is not None:
+        cancel.check()
+    if max_magnitude is not None and abs(value) > max_magnitude:
+        raise ResourceLimitError('result magnitude above the limit')
+
+
+def _check_power(base, exponent, max_magnitude: float) -> None:
+    """Predict from the operands whether base^exponent exceeds max_magnitude, before computing it."""
+    if base.__class__ is complex or exponent.__class__ is complex or not base:
+        return
+    #log2 of the result's magnitude, positive for a large base to a positive exponent
+    #and for a fractional base to a negative one
+    magnitude = exponent * math.log2(abs(base))
+    if magnitude > 0 and magnitude > math.log2(max_magnitude) + 1:
+        raise ResourceLimitError('result magnitude above the limit')
+
+
+def _check_stream(
+        stream: 'TokenStream',
+        start: int,
+        end: int,
+        cancel: Optional[CancellationToken],
+        max_magnitude: Optional[float]
+        ) -> None:
+    """Check the values of tokens start..end of a stream after a reduction step."""
+    if cancel is not None:
+        cancel.check()
+    if max_magnitude is not None and end > start:
+        values = stream.values[start:end]
+        if max(values) > max_magnitude or min(values) < -max_magnitude:
+            raise ResourceLimitError('result magnitude above the limit')
+
+
+def _nesting_depth(tokens: List[Union[float, str]]) -> int:
+    """Deepest parenthesis nesting of a token list."""
+    depth = deepest = 0
+    for token in tokens:
+        if token == '(':
+            depth += 1
+            if depth > deepest:
+                deepest = depth
+        elif token == ')':
+            depth -= 1
+    return deepest
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+SharedBatchResult = namedtuple('SharedBatchResult', ['results', 'operations', 'evaluations', 'saved'])
+
+#value of a shared operation that failed, or depends on one that did
+_FAILED = object()
+
+
+class ColumnarResults:
+    """
+    Results of Calculator.calculate_columns as two parallel columns.
+
+    `values` holds float64 results (NaN on errors) and `error_codes` uint8
+    CalculatorError.ERROR_CODES (0 for success). Both support the buffer
+    protocol, so numpy.frombuffer() or memoryview() wrap them without copying.
+    Results are only formatted as text when format() is called.
+    """
+
+    __slots__ = ('values', 'error_codes', '_calculator')
+
+    def __init__(self, calculator: 'Calculator', values, error_codes):
+        """
+        Args:
+            calculator (Calculator): calculator used for output formatting
+            values: float64 buffer of results
+            error_codes: uint8 buffer of error codes, as long as values
+        """
+        self._calculator = calculator
+        self.values = values
+        self.error_codes = error_codes
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def format(self, decimal_places: int) -> Iterator[Tuple[str, str]]:
+        """
+        Format the results like Calculator.calculate.
+
+        Integers above 2^53 are formatted from their float64 value here. The
+        result is empty on errors, the expressions are not kept.
+
+        Args:
+            decimal_places (int): number of decimal places to return
+
+        Yields:
+            Tuple of (result, error_message) per expression
+        """
+        format_value = _value_formatter(decimal_places)
+        error_keys = (None,) + tuple(CalculatorError.ERROR_CODES)
+        for value, code in zip(self.values, self.error_codes):
+            if code:
+                yield '', CalculatorError.get_error_message(error_keys[code])
+            else:
+                yield format_value(value), ''
+
+
+class _LRUCache:
+    """Bounded mapping that evicts the least recently used entry and counts its use, safe across threads."""
+
+    __slots__ = ('maxsize', 'hits', 'misses', 'evictions', '_entries', '_lock')
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        #a lookup reorders the entries, so reads are locked too
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None when it is not cached."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        """Cache a value, evicting the least recently used entry when full."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove all entries and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        """Return the cache statistics."""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._entries))
+
 
 class Calculator:
     """
     Comprehensive calculator class with advanced parsing and calculation capabilities.
+
+    One instance can be shared by any number of threads: the character tables
+    are immutable class attributes, every calculation keeps its state in local
+    variables, and the optional caches and metrics are locked.
     """
 
-    def __init__(self):
+    #immutable tables shared by every instance
+    OPERATOR_SET = frozenset({'*','/','+','-','^'})
+    ALL_OPERATOR_SET = frozenset({'(',')'})|OPERATOR_SET
+    ALL_CHARACTER_SET = frozenset({'0','1','2','3','4','5','6','7','8','9',' ','.'})|ALL_OPERATOR_SET
+
+    def __init__(
+            self,
+            cache_size: Optional[int] = None,
+            metrics=None,
+            backend: Optional[str] = None,
+            engine: str = 'reduction',
+            persistent_cache=None
+            ):
         """
-        Initialize calculator with predefined operator and character sets.
+        Initialize calculator with its optional caches and metrics.
+
+        Args:
+            cache_size (int): maximum number of entries in each of the compiled
+                expression and result caches used by calculate(); None disables caching
+            metrics (CalculatorMetrics): collector of calculate() stage timings and
+                error counts; None disables instrumentation
+            backend (str): default CompiledExpression backend of compile(), also
+                used for the compiled expression cache, see BACKENDS; defaults to
+                the engine when it is a backend, otherwise 'interpreter'
+            engine (str): engine calculating uncached expressions, see ENGINES;
+                limits, cancellation and metrics always use 'reduction', whose
+                stages they measure and interrupt
+            persistent_cache (PersistentCache): results and compiled expressions
+                shared with other processes and later runs (see "Calculator_cache.py"),
+                looked up after the in-memory caches, so cache_size is required
         """
-        self.OPERATOR_SET = {'*','/','+','-','^'}
-        self.ALL_OPERATOR_SET = {'(',')'}|self.OPERATOR_SET
-        self.ALL_CHARACTER_SET = {'0','1','2','3','4','5','6','7','8','9',' ','.'}|self.ALL_OPERATOR_SET
+        if engine not in ENGINES:
+            raise ValueError(f'unknown engine: {engine!r}')
+        backend = backend or (engine if engine in BACKENDS else 'interpreter')
+        if backend not in BACKENDS:
+            raise ValueError(f'unknown backend: {backend!r}')
+        if cache_size is not None and cache_size < 1:
+            raise ValueError('cache_size must be at least 1')
+        if persistent_cache is not None and cache_size is None:
+            raise ValueError('persistent_cache needs cache_size')
+        self._compiled_cache = _LRUCache(cache_size) if cache_size else None
+        self._result_cache = _LRUCache(cache_size) if cache_size else None
+        self.metrics = metrics
+        self.backend = backend
+        self.engine = engine
+        self.persistent_cache = persistent_cache
 
     def parse_input(
             self,
@@ -71,12 +1094,13 @@ class Calculator:
             List of tokens (numbers and operators)
         """
          #remove whitespaces and parse input
-        user_input_no_whitespace = re.sub(r'\s+', '', user_input)
-        output_list = re.findall(r'\d+\.?\d*|\d*\.?\d+|[()*/+-^]',user_input_no_whitespace)
+        user_input_no_whitespace = _WHITESPACE_PATTERN.sub('', user_input)
+        output_list = _TOKEN_PATTERN.findall(user_input_no_whitespace)
 
-        #convert numbers to float
+        #convert numbers to int, or float when they have a decimal point
+        number_search = _NUMBER_PATTERN.search
         output_list = [
-        float(token) if re.search(r'\d+\.?\d*|\d*\.?\d+',token)
+        _number(token) if number_search(token)
         else token for token in output_list
         ]
 
@@ -95,24 +1119,47 @@ class Calculator:
         Returns:
             list: Processed list with negative signs resolved
         """
+        if isinstance(express_list, TokenStream):
+            return self._merge_stream_negatives(express_list)
+        merged = []
+        last = len(express_list) - 1
         i=0
-        while i<len(express_list) - 1:
-            if express_list[i]=='-':
-                #check for "-" at beginning of the list
-                #check preceeding item for an operator and next item for a number
-                #combine "-" with number, append to new list, and skip number in sequence
-                if (i==0 or express_list[i-1] in self.ALL_OPERATOR_SET) \
-                    and isinstance(express_list[i+1],float):
-                    negative_val = express_list[i+1]
-                    express_list[i] = -1 * negative_val
-                    del express_list[i+1]
-                else: #"-" is an operator and will be skipped in the loop
-                    i+=1
-            #if '-' not found, continue loop on the next index
+        while i<=last:
+            item = express_list[i]
+            #check for "-" at beginning of the list
+            #check preceeding item for an operator and next item for a number
+            #combine "-" with number, append to new list, and skip number in sequence
+            if item=='-' and i<last \
+                and (not merged or merged[-1] in self.ALL_OPERATOR_SET) \
+                and isinstance(express_list[i+1],_OPERAND_TYPES):
+                merged.append(-express_list[i+1])
+                i+=2
+            #"-" is an operator or item is not "-", keep it and continue on the next index
             else:
+                merged.append(item)
                 i+=1
+        express_list[:] = merged
         return express_list
     
+    def _merge_stream_negatives(self, stream: TokenStream) -> TokenStream:
+        """merge_negatives for a TokenStream, moving the tokens between merges in slices."""
+        opcodes = stream.opcodes
+        values = stream.values
+        last = len(opcodes) - 1
+        write = read = 0
+        for match in _STREAM_MINUS_PATTERN.finditer(opcodes.tobytes()):
+            index = match.start()
+            #the token before "-" in the merged stream, None at its start
+            previous = opcodes[index - 1] if index > read else opcodes[write - 1] if write else None
+            if index < last and opcodes[index + 1] == _STREAM_OPERAND \
+                and (previous is None or previous in _STREAM_OPERATOR_OPCODES):
+                write = _move_stream_run(stream, write, read, index)
+                opcodes[write] = _STREAM_OPERAND
+                values[write] = -values[index + 1]
+                write += 1
+                read = index + 2
+        return stream.truncate(_move_stream_run(stream, write, read, len(opcodes)))
+
     def validate_input(
             self,
             output_list: List[Union[float, str]],
@@ -144,7 +1191,7 @@ class Calculator:
                 return CalculatorError.get_error_message('CONSECUTIVE_OPERATORS')
             if item == '.':
                 return CalculatorError.get_error_message('DECIMAL_ERROR')
-            if isinstance(item,float) and isinstance(prev_item,float):
+            if isinstance(item,_OPERAND_TYPES) and isinstance(prev_item,_OPERAND_TYPES):
                 return CalculatorError.get_error_message('CONSECUTIVE_NUMBERS')
 
         #check for equal brackets
@@ -182,24 +1229,142 @@ class Calculator:
         express_list[parenth_l]=parenth_slice[1]
         return express_list
 
+    def resolve_parentheses(
+            self,
+            output_list: List[Union[float, str]],
+            cancel: Optional[CancellationToken] = None,
+            max_magnitude: Optional[float] = None
+            ) -> Optional[List[Union[float, str]]]:
+        """
+        Calculate every parenthetical group, innermost first.
+
+        Groups are matched in one left to right pass with a stack of open
+        parenthesis positions, so each token is copied a constant number of
+        times however deep the nesting. A group is replaced by its first element
+        after calculation, an empty group by ')' which then closes the group
+        around it, as the original index based search did.
+
+        Args:
+            output_list (list): Validated expression list
+            cancel (CancellationToken): checked after every operation, see exponent()
+            max_magnitude (float): largest absolute value an operation may produce
+
+        Returns:
+            list: expression list without parentheses, or None if a ')' has no
+            matching '(' before it
+        """
+        if isinstance(output_list, TokenStream):
+            return self._resolve_stream_parentheses(output_list, cancel, max_magnitude)
+        reduced = []
+        open_indexes = []
+        for item in output_list:
+            if item == '(':
+                open_indexes.append(len(reduced))
+                reduced.append(item)
+                continue
+            while item == ')':
+                if not open_indexes:
+                    return None
+                parenth_l = open_indexes.pop()
+                #calculate the group including its parentheses, then replace it
+                parenth_slice = reduced[parenth_l:]
+                parenth_slice.append(item)
+                del reduced[parenth_l:]
+                parenth_slice = self.add_subtract(self.multi_divide(
+                    self.exponent(parenth_slice, cancel, max_magnitude), cancel, max_magnitude),
+                    cancel, max_magnitude)
+                item = parenth_slice[1]
+            reduced.append(item)
+        return reduced
+
+    def _resolve_stream_parentheses(
+            self,
+            stream: TokenStream,
+            cancel: Optional[CancellationToken] = None,
+            max_magnitude: Optional[float] = None
+            ) -> Optional[TokenStream]:
+        """
+        resolve_parentheses for a TokenStream, reducing each group in place.
+
+        Limits are checked once per group rather than per operation, the
+        cancellation token also every LIMIT_CHECK_INTERVAL operations of a group.
+        """
+        limited = cancel is not None or max_magnitude is not None
+        opcodes = stream.opcodes
+        values = stream.values
+        open_indexes = []
+        write = read = 0
+        for match in _STREAM_PARENTHESIS_PATTERN.finditer(opcodes.tobytes()):
+            index = match.start()
+            write = _move_stream_run(stream, write, read, index)
+            read = index + 1
+            if opcodes[index] == _STREAM_OPEN:
+                open_indexes.append(write)
+                opcodes[write] = _STREAM_OPEN
+                write += 1
+                continue
+            while True:
+                if not open_indexes:
+                    return None
+                parenth_l = open_indexes.pop()
+                #an empty group becomes a ')' closing the group around it
+                group_end = _reduce_stream_range(stream, parenth_l + 1, write, cancel)
+                if limited:
+                    _check_stream(stream, parenth_l + 1, group_end, cancel, max_magnitude)
+                if group_end == parenth_l + 1:
+                    write = parenth_l
+                    continue
+                opcodes[parenth_l] = opcodes[parenth_l + 1]
+                values[parenth_l] = values[parenth_l + 1]
+                write = parenth_l + 1
+                break
+        return stream.truncate(_move_stream_run(stream, write, read, len(opcodes)))
+
     def exponent(
             self,
-            express_list: List[Union[float, str]]
+            express_list: List[Union[float, str]],
+            cancel: Optional[CancellationToken] = None,
+            max_magnitude: Optional[float] = None
             ) -> List[Union[float, str]]:
-        """Perform exponentiation operations."""
+        """
+        Perform exponentiation operations.
+
+        Args:
+            express_list (list): expression list or TokenStream, reduced in place
+            cancel (CancellationToken): checked after every operation (every
+                LIMIT_CHECK_INTERVAL operations for a TokenStream)
+            max_magnitude (float): largest absolute value an operation may produce,
+                predicted from the operands for '^'
+
+        Raises:
+            ResourceLimitError: when cancelled or a result exceeds max_magnitude
+        """
+        limited = cancel is not None or max_magnitude is not None
+        if isinstance(express_list, TokenStream):
+            express_list.truncate(_reduce_stream_pass(
+                express_list, _REDUCTION_PASSES[0], 0, len(express_list), cancel))
+            if limited:
+                _check_stream(express_list, 0, len(express_list), cancel, max_magnitude)
+            return express_list
         i=0
         while i<=len(express_list)-1:
             #exponent 
             if express_list[i]=="^" or express_list[i]=='^':
                 #retrieve numbers to be operated
-                first_val = float(express_list[i-1])
-                second_val = float(express_list[i+1])
+                first_val = express_list[i-1]
+                second_val = express_list[i+1]
+                if first_val.__class__ is not int or second_val.__class__ is not int:
+                    first_val, second_val = float(first_val), float(second_val)
+                if max_magnitude is not None:
+                    _check_power(first_val, second_val, max_magnitude)
                 #replace operator with combined number
-                express_list[i]=first_val**second_val
+                express_list[i]=_exact_power(first_val, second_val)
             #if no operation happens, continue loop on the next index
             else:
                 i=i+1
                 continue
+            if limited:
+                _check_operation(express_list[i], cancel, max_magnitude)
             #remove numbers that have been operated on
             del express_list[i+1]
             del express_list[i-1]
@@ -208,29 +1373,44 @@ class Calculator:
 
     def multi_divide(
             self,
-            express_list: List[Union[float, str]]
+            express_list: List[Union[float, str]],
+            cancel: Optional[CancellationToken] = None,
+            max_magnitude: Optional[float] = None
             ) -> List[Union[float, str]]:
-        """Perform multiplication and division operations."""
+        """Perform multiplication and division operations, with limits as for exponent()."""
+        limited = cancel is not None or max_magnitude is not None
+        if isinstance(express_list, TokenStream):
+            express_list.truncate(_reduce_stream_pass(
+                express_list, _REDUCTION_PASSES[1], 0, len(express_list), cancel))
+            if limited:
+                _check_stream(express_list, 0, len(express_list), cancel, max_magnitude)
+            return express_list
         i=0
         while i<=len(express_list)-1:
             #multiplication 
             if express_list[i]=="*" or express_list[i]== '*':
                 #retrieve numbers to be operated
-                first_val = float(express_list[i-1])
-                second_val = float(express_list[i+1])
+                first_val = express_list[i-1]
+                second_val = express_list[i+1]
+                if first_val.__class__ is not int or second_val.__class__ is not int:
+                    first_val, second_val = float(first_val), float(second_val)
                 #replace operator with combined number
-                express_list[i]=first_val*second_val
+                express_list[i]=_exact_multiply(first_val, second_val)
             #division
             elif express_list[i]=="/" or express_list[i]== '/':
                 #retrieve numbers to be operated
-                first_val = float(express_list[i-1])
-                second_val = float(express_list[i+1])
+                first_val = express_list[i-1]
+                second_val = express_list[i+1]
+                if first_val.__class__ is not int or second_val.__class__ is not int:
+                    first_val, second_val = float(first_val), float(second_val)
                 #replace operator with combined number
                 express_list[i]=first_val/second_val
             #if no operation happens, continue loop on the next index
             else:
                 i=i+1
                 continue
+            if limited:
+                _check_operation(express_list[i], cancel, max_magnitude)
             #remove numbers that have been operated on
             del express_list[i+1]
             del express_list[i-1]
@@ -239,29 +1419,44 @@ class Calculator:
 
     def add_subtract(
             self,
-            express_list: List[Union[float, str]]
+            express_list: List[Union[float, str]],
+            cancel: Optional[CancellationToken] = None,
+            max_magnitude: Optional[float] = None
             ) -> List[Union[float, str]]:
-        """Perform addition and subtraction operations."""
+        """Perform addition and subtraction operations, with limits as for exponent()."""
+        limited = cancel is not None or max_magnitude is not None
+        if isinstance(express_list, TokenStream):
+            express_list.truncate(_reduce_stream_pass(
+                express_list, _REDUCTION_PASSES[2], 0, len(express_list), cancel))
+            if limited:
+                _check_stream(express_list, 0, len(express_list), cancel, max_magnitude)
+            return express_list
         i=0
         while i<=len(express_list)-1:
             #addition 
             if express_list[i]=="+" or express_list[i]== '+':
                 #retrieve numbers to be operated
-                first_val = float(express_list[i-1])
-                second_val = float(express_list[i+1])
+                first_val = express_list[i-1]
+                second_val = express_list[i+1]
+                if first_val.__class__ is not int or second_val.__class__ is not int:
+                    first_val, second_val = float(first_val), float(second_val)
                 #replace operator with combined number
                 express_list[i]=first_val+second_val
             #subtraction
             elif express_list[i]=="-" or express_list[i]== '-':
                 #retrieve numbers to be operated
-                first_val = float(express_list[i-1])
-                second_val = float(express_list[i+1])
+                first_val = express_list[i-1]
+                second_val = express_list[i+1]
+                if first_val.__class__ is not int or second_val.__class__ is not int:
+                    first_val, second_val = float(first_val), float(second_val)
                 #replace operator with combined number
                 express_list[i]=first_val-second_val
             #if no operation happens, continue loop on the next index
             else:
                 i=i+1
                 continue
+            if limited:
+                _check_operation(express_list[i], cancel, max_magnitude)
             #remove numbers that have been operated on
             del express_list[i+1]
             del express_list[i-1]
@@ -282,83 +1477,1153 @@ class Calculator:
         Returns:
             str: Formatted output string
         """
-        clean_output=[]
         # convert whole number float to int
-        # and applies maximium decimal places from GUI for display
-        decimal_places_str='{'+f'{decimal_places}'+'}'
-        for item in output_list:
-            if isinstance(item,float):
-                if re.search(fr'\.\d{decimal_places_str}',str(item)):
-                    item = f'{item:.{decimal_places}f}'
-                    item = float(item)
-                if item.is_integer():
-                    item=int(item)
-
-            clean_output.append(item)
+        # and applies maximium decimal places from GUI for display,
+        # int results are exact already and skip the rounding check
+        format_value = _value_formatter(decimal_places)
+        if len(output_list) == 1:
+            return format_value(output_list[0])
         #join list into string
-        text_out=''.join(map(str,clean_output))
-        return text_out
+        return ''.join(map(format_value, output_list))
 
-    def calculate(self, user_input: str, decimal_places: int) -> Tuple[str, str]:
+    def format_values(self, values: Iterable, decimal_places: int) -> List[str]:
+        """
+        Format many unformatted results at once, each as output_clean_convert([value]) would.
+
+        Args:
+            values (iterable): results such as those of compute() or a float64 column
+            decimal_places (int): decimal places for display
+
+        Returns:
+            list: formatted string per value
+        """
+        return list(map(_value_formatter(decimal_places), values))
+
+    def tokenize(self, user_input: str, variables: Iterable[str] = ()) -> TokenizeResult:
+        """
+        Tokenize and validate an expression in a single pass.
+
+        Produces the same tokens as parse_input followed by merge_negatives,
+        and the same error as validate_input, while scanning the input once.
+
+        Args:
+            user_input (str): Mathematical expression to tokenize
+            variables (iterable): names that may be used as operands
+
+        Returns:
+            TokenizeResult of (tokens, character offset of each token,
+            CalculatorError key or empty string, offset of the error or -1)
+        """
+        names = _variable_names(variables)
+        scan = (_SCAN_VARIABLE_PATTERN if names else _SCAN_PATTERN).findall
+        return self._tokenize_result(self._tokenize_pieces(scan(user_input), names))
+
+    def _tokenize_pieces(
+            self,
+            pieces: List[str],
+            names: frozenset,
+            first: int = 0,
+            state: Optional[tuple] = None,
+            checkpoints: Optional[list] = None,
+            interval: int = 0
+            ) -> tuple:
+        """
+        Run the fused merge and validation loop over scanned pieces.
+
+        Args:
+            pieces (list): input split by _SCAN_PATTERN, or _SCAN_VARIABLE_PATTERN with names
+            names (frozenset): variable names
+            first (int): index of the first piece to process
+            state (tuple): loop state after pieces[:first], from a checkpoint
+            checkpoints (list): when given, a checkpoint is appended after every
+                interval pieces so the loop can be resumed there
+            interval (int): pieces between checkpoints
+
+        Returns:
+            tuple: loop state after all pieces, see _tokenize_result
+        """
+        operator_set = self.OPERATOR_SET
+        all_operator_set = self.ALL_OPERATOR_SET
+        if state is None:
+            state = ([], [], 0, -1, '', -1, 0, 0, None, -1)
+        (tokens, positions, position, unexpected_position, pair_error, pair_position,
+         open_count, close_count, open_positions, unmatched_close_position) = state
+
+        #one chunk unless checkpoints are kept
+        chunk_starts = range(first, len(pieces), interval) if checkpoints is not None else (first,)
+        for chunk_start in chunk_starts:
+            chunk = pieces[chunk_start:chunk_start + interval] if checkpoints is not None \
+                else pieces if not first else islice(pieces, first, None)
+            #every character belongs to exactly one scanned piece, so offsets are running lengths
+            for text in chunk:
+                first_char = text[0]
+                if first_char in _SYMBOLS:
+                    item = first_char
+                    if item == '(':
+                        open_count += 1
+                        #linked (position, rest) pairs, so checkpoints share the stack
+                        open_positions = (position, open_positions)
+                    elif item == ')':
+                        close_count += 1
+                        if open_positions is not None:
+                            open_positions = open_positions[1]
+                        elif unmatched_close_position < 0:
+                            unmatched_close_position = position
+                elif first_char in _DIGITS or (first_char == '.' and len(text) > 1):
+                    number = text.replace(' ', '') if ' ' in text else text
+                    #up to 15 digits always fit INTEGER_LIMIT_BITS, skip the call
+                    item = int(number) if len(number) < 16 and '.' not in number else _number(number)
+                elif first_char == ' ':
+                    position += len(text)
+                    continue
+                elif first_char == '.':
+                    item = first_char
+                elif text in names:
+                    item = _Variable(text)
+                else:
+                    if unexpected_position < 0:
+                        unexpected_position = position
+                    position += len(text)
+                    continue
+
+                if tokens:
+                    prev_item = tokens[-1]
+                    #merge "-" with the number after it when it follows an operator or starts the list
+                    if prev_item == '-' and item.__class__ in _OPERAND_CLASSES \
+                        and (len(tokens) == 1 or tokens[-2] in all_operator_set):
+                        tokens[-1] = -item
+                        position += len(text)
+                        continue
+                    #the previous token is final now, check it against its own predecessor
+                    if not pair_error and len(tokens) > 1:
+                        pair_error = self._pair_error(tokens[-2], prev_item)
+                        pair_position = positions[-1]
+                tokens.append(item)
+                positions.append(position)
+                position += len(text)
+
+            if checkpoints is not None:
+                #the last token may still be merged, so its current value is kept too
+                checkpoints.append((
+                    min(chunk_start + interval, len(pieces)), len(tokens), tokens[-1] if tokens else None,
+                    position, unexpected_position, pair_error, pair_position,
+                    open_count, close_count, open_positions, unmatched_close_position))
+
+        return (tokens, positions, position, unexpected_position, pair_error, pair_position,
+                open_count, close_count, open_positions, unmatched_close_position)
+
+    def _tokenize_result(self, state: tuple) -> TokenizeResult:
+        """Check the end of the input and report errors in the order validate_input checks them."""
+        (tokens, positions, _, unexpected_position, pair_error, pair_position,
+         open_count, close_count, open_positions, unmatched_close_position) = state
+        operator_set = self.OPERATOR_SET
+        if not pair_error and len(tokens) > 1:
+            pair_error = self._pair_error(tokens[-2], tokens[-1])
+            pair_position = positions[-1]
+
+        if unexpected_position >= 0:
+            return TokenizeResult(tokens, positions, 'UNEXPECTED_CHARACTERS', unexpected_position)
+        if not tokens:
+            return TokenizeResult(tokens, positions, 'EMPTY_EXPRESSION', 0)
+        if pair_error:
+            return TokenizeResult(tokens, positions, pair_error, pair_position)
+        if open_count != close_count:
+            if open_count > close_count:
+                #the outermost parenthesis left open
+                while open_positions[1] is not None:
+                    open_positions = open_positions[1]
+                unequal_position = open_positions[0]
+            else:
+                unequal_position = unmatched_close_position
+            return TokenizeResult(tokens, positions, 'UNEQUAL_PARENTHESIS', unequal_position)
+        if tokens[0] in operator_set:
+            return TokenizeResult(tokens, positions, 'INVALID_OPERATOR_PLACEMENT', positions[0])
+        if tokens[-1] in operator_set:
+            return TokenizeResult(tokens, positions, 'INVALID_OPERATOR_PLACEMENT', positions[-1])
+        return TokenizeResult(tokens, positions, '', -1)
+
+    def _pair_error(self, prev_item, item) -> str:
+        """Error key for two adjacent tokens, as checked by validate_input."""
+        if item in self.OPERATOR_SET:
+            return 'CONSECUTIVE_OPERATORS' if prev_item in self.OPERATOR_SET else ''
+        if item == '.':
+            return 'DECIMAL_ERROR'
+        if item.__class__ in _OPERAND_CLASSES and prev_item.__class__ in _OPERAND_CLASSES:
+            return 'CONSECUTIVE_NUMBERS'
+        return ''
+
+    def compile(
+            self,
+            user_input: str,
+            variables: Iterable[str] = (),
+            backend: Optional[str] = None
+            ) -> CompiledExpression:
+        """
+        Parse and validate an expression once for repeated evaluation.
+
+        The expression is tokenized, validated and reduced symbolically in
+        linear time. Input errors are kept in the returned object and reported
+        by its evaluate() method, exactly as calculate() would report them.
+
+        Args:
+            user_input (str): Mathematical expression to compile
+            variables (iterable): names of variables used in the expression,
+                given values when the compiled expression is evaluated
+            backend (str): 'interpreter' or 'codegen', defaults to the calculator's backend
+
+        Returns:
+            CompiledExpression: reusable expression object
+        """
+        backend = backend or self.backend
+        output_list, positions, error_key, error_position = self.tokenize(user_input, variables)
+        if error_key:
+            return CompiledExpression(
+                self, user_input, error=error_key, error_position=error_position, backend=backend)
+
+        builder = _ProgramBuilder()
+        elements = [
+            builder.operand(item) if isinstance(item,_NUMBER_TYPES)
+            else builder.variable(item.name, item.negative) if isinstance(item,_Variable)
+            else item
+            for item in output_list
+            ]
+
+        #reduce the innermost group each time a ')' is reached, like the loop in calculate
+        reduced = []
+        open_indexes = []
+        for item, position in zip(elements, positions):
+            while item == ')':
+                if not open_indexes:
+                    error_key = 'IMPROPER_PARENTHESIS'
+                    error_position = position
+                    break
+                parenth_index_l = open_indexes.pop()
+                group = reduced[parenth_index_l:]
+                group.append(')')
+                del reduced[parenth_index_l:]
+                group = _reduce_group(group, builder)
+                if group is None:
+                    error_key = 'CALCULATION_INCOMPLETE'
+                    break
+                #the group is replaced by its first element
+                item = group[1]
+            if error_key:
+                break
+            if item == '(':
+                open_indexes.append(len(reduced))
+            reduced.append(item)
+
+        result = None
+        if not error_key:
+            reduced = _reduce_group(reduced, builder)
+            if reduced is not None and len(reduced) == 1:
+                result = reduced[0]
+            else:
+                error_key = 'CALCULATION_INCOMPLETE'
+        return CompiledExpression(
+            self,
+            user_input,
+            builder.constants,
+            builder.instructions,
+            result,
+            error_key,
+            [(slot, name, negative) for (name, negative), slot in builder.variables.items()],
+            error_position,
+            backend
+            )
+
+    def calculate(
+            self,
+            user_input: str,
+            decimal_places: int,
+            limits: Optional[ResourceLimits] = None,
+            cancel: Optional[CancellationToken] = None
+            ) -> Tuple[str, str]:
         """
         Main calculation method.
         
         Args:
             user_input (str): Mathematical expression to calculate
             decimal_places (int): number of decimal places to return
+            limits (ResourceLimits): limits returning the RESOURCE_LIMIT error when hit
+            cancel (CancellationToken): token another thread can cancel the calculation with
         
         Returns:
             Tuple of (result, error_message)
         """
+        if limits is not None or cancel is not None:
+            return self._calculate_limited(user_input, decimal_places, limits or ResourceLimits(), cancel)
+        if self.metrics is not None:
+            return self._calculate_measured(user_input, decimal_places)
+        if self._result_cache is not None:
+            return self._calculate_cached(user_input, decimal_places)
+        if self.engine == 'reduction':
+            # Parse, merge negative numbers and validate input in one pass
+            return self.evaluate_tokens(user_input, self.tokenize(user_input), decimal_places)
+        value, error_key = self.compile(user_input, backend=self.engine).compute()
+        if error_key:
+            return user_input, CalculatorError.get_error_message(error_key)
+        return self.output_clean_convert([value], decimal_places), ''
+
+    def compute(self, user_input: str) -> Tuple[Union[int, float, complex, str, None], str]:
+        """
+        Calculate an expression with the calculator's engine without formatting the result.
+
+        Args:
+            user_input (str): Mathematical expression to calculate
+
+        Returns:
+            Tuple of (unformatted result, CalculatorError key or empty string)
+        """
+        if self.engine == 'reduction':
+            return self.compute_tokens(self.tokenize(user_input))
+        return self.compile(user_input, backend=self.engine).compute()
+
+    def evaluate_tokens(
+            self,
+            user_input: str,
+            tokenized: TokenizeResult,
+            decimal_places: int,
+            cancel: Optional[CancellationToken] = None,
+            max_magnitude: Optional[float] = None
+            ) -> Tuple[str, str]:
+        """
+        Finish calculate() for an expression that is already tokenized.
+
+        Args:
+            user_input (str): the expression the tokens were made from, returned with errors
+            tokenized (TokenizeResult): output of tokenize() or IncrementalTokenizer.update()
+            decimal_places (int): number of decimal places to return
+            cancel (CancellationToken): checked by the reduction passes
+            max_magnitude (float): largest absolute value an operation may produce
+
+        Returns:
+            Tuple of (result, error_message)
+        """
+        value, error_key = self.compute_tokens(tokenized, cancel, max_magnitude)
+        if error_key:
+            return user_input, CalculatorError.get_error_message(error_key)
+        return self.output_clean_convert([value], decimal_places), ''
+
+    def compute_tokens(
+            self,
+            tokenized: TokenizeResult,
+            cancel: Optional[CancellationToken] = None,
+            max_magnitude: Optional[float] = None
+            ) -> Tuple[Union[int, float, complex, str, None], str]:
+        """
+        Calculate tokenized input without formatting the result.
+
+        Args:
+            tokenized (TokenizeResult): output of tokenize() or IncrementalTokenizer.update()
+            cancel (CancellationToken): checked by the reduction passes
+            max_magnitude (float): largest absolute value an operation may produce
+
+        Returns:
+            Tuple of (unformatted result, CalculatorError key or empty string)
+        """
         try:
-            # Parse input
-            output_list = self.parse_input(user_input)
-            # Merge negative numbers
-            output_list = self.merge_negatives(output_list)
+            output_list, _, error_key, _ = tokenized
+            if error_key:
+                return None, error_key
             
-            # Validate input
-            error_out = self.validate_input(output_list, user_input)
-            if error_out:
-                return user_input, error_out
-            
-            # Handle parenthetical expressions
-            while ')' in output_list:
-                parenth_index_r = output_list.index(')')
-                output_list_rev_slice = output_list[:parenth_index_r]
-                output_list_rev_slice.reverse()
-                try:
-                    parenth_index_l = parenth_index_r - output_list_rev_slice.index('(') - 1
-                except ValueError:
-                    return user_input, CalculatorError.get_error_message('IMPROPER_PARENTHESIS')
-                
-                output_list = self.parenth_list(output_list, parenth_index_l, parenth_index_r)
-            
-            # Perform calculations
-            output_list = self.add_subtract(
-                self.multi_divide(
-                    self.exponent(output_list)
-                )
-            )
+            # Handle parenthetical expressions and perform calculations
+            output_list = self._reduce_tokens(output_list, cancel=cancel, max_magnitude=max_magnitude)
+            if output_list is None:
+                return None, 'IMPROPER_PARENTHESIS'
             
             # Verify final result
             if len(output_list) == 1:
-                output_txt = self.output_clean_convert(output_list, decimal_places)
-                return output_txt, ''
+                return output_list[0], ''
             else:
-                return user_input, CalculatorError.get_error_message('CALCULATION_INCOMPLETE')
+                return None, 'CALCULATION_INCOMPLETE'
         
         except ZeroDivisionError:
-            return user_input, CalculatorError.get_error_message('DIVISION_BY_ZERO')
+            return None, 'DIVISION_BY_ZERO'
         except OverflowError:
-            return user_input, CalculatorError.get_error_message('OVERFLOW')
+            return None, 'OVERFLOW'
+        except (ValueError, TypeError, IndexError):
+            #an operator was left next to a parenthesis or non-real operand
+            return None, 'CALCULATION_INCOMPLETE'
+        except ResourceLimitError:
+            return None, 'RESOURCE_LIMIT'
+
+    def _calculate_limited(
+            self,
+            user_input: str,
+            decimal_places: int,
+            limits: ResourceLimits,
+            cancel: Optional[CancellationToken]
+            ) -> Tuple[str, str]:
+        """
+        Calculate like calculate() within resource limits.
+
+        Input length is checked first. Token count, deadline and cancellation
+        are checked while tokenizing, nesting depth after it, before any
+        reduction; magnitude, deadline and cancellation during the passes. The
+        result cache is not used, and with metrics only the 'calculate' stage is
+        recorded.
+        """
+        if limits.max_magnitude is not None and not limits.max_magnitude > 0:
+            raise ValueError('max_magnitude must be positive')
+        if limits.timeout is not None:
+            cancel = CancellationToken(limits.timeout, cancel)
+        begin = self.metrics.clock() if self.metrics is not None else 0.0
+
+        tokenized = None
+        if limits.max_length is None or len(user_input) <= limits.max_length:
+            tokenized = self._tokenize_limited(user_input, limits.max_tokens, cancel)
+        if tokenized is None:
+            result = user_input, CalculatorError.get_error_message('RESOURCE_LIMIT')
+        elif not tokenized.error_key and (
+                (limits.max_tokens is not None and len(tokenized.tokens) > limits.max_tokens)
+                or (limits.max_depth is not None and _nesting_depth(tokenized.tokens) > limits.max_depth)
+                or (cancel is not None and cancel.cancelled)):
+            result = user_input, CalculatorError.get_error_message('RESOURCE_LIMIT')
+        else:
+            result = self.evaluate_tokens(user_input, tokenized, decimal_places, cancel, limits.max_magnitude)
+
+        if self.metrics is not None:
+            self.metrics.record('calculate', begin, CalculatorError.get_error_key(result[1]))
+        return result
+
+    def _tokenize_limited(
+            self,
+            user_input: str,
+            max_tokens: Optional[int],
+            cancel: Optional[CancellationToken]
+            ) -> Optional[TokenizeResult]:
+        """
+        Tokenize like tokenize(), LIMIT_CHECK_INTERVAL pieces at a time.
+
+        The input is scanned lazily and the loop is resumed from its state
+        after each chunk, so an oversized or cancelled input stops early,
+        before input errors later in it are found.
+
+        Returns:
+            TokenizeResult, or None once max_tokens is exceeded or cancel is cancelled
+        """
+        matches = _SCAN_PATTERN.finditer(user_input)
+        get_piece = re.Match.group
+        state = None
+        while True:
+            pieces = list(map(get_piece, islice(matches, LIMIT_CHECK_INTERVAL)))
+            if not pieces and state is not None:
+                return self._tokenize_result(state)
+            state = self._tokenize_pieces(pieces, frozenset(), state=state)
+            #a short input is checked after tokenizing, where input errors come first
+            if len(pieces) == LIMIT_CHECK_INTERVAL and (
+                    (max_tokens is not None and len(state[0]) > max_tokens)
+                    or (cancel is not None and cancel.cancelled)):
+                return None
+
+    def _reduce_tokens(
+            self,
+            tokens: List[Union[float, str]],
+            stream: bool = True,
+            cancel: Optional[CancellationToken] = None,
+            max_magnitude: Optional[float] = None
+            ) -> Optional[List[Union[float, str]]]:
+        """
+        Resolve the parentheses and reduction passes of validated tokens.
+
+        From STREAM_MIN_TOKENS tokens the stages run over an exact TokenStream.
+        A complex power or a value of 2^53 or more, which may be an integer
+        float64 can't hold exactly, can't be stored in one, so the list stages
+        are used again from the start when either occurs.
+
+        Args:
+            tokens (list): validated tokens, not modified
+            stream (bool): allow the TokenStream stages
+            cancel (CancellationToken): checked by the stages
+            max_magnitude (float): largest absolute value an operation may produce
+
+        Returns:
+            list: reduced expression list, or None for improperly paired parentheses
+        """
+        if stream and len(tokens) >= STREAM_MIN_TOKENS:
+            try:
+                output_stream = self.resolve_parentheses(
+                    TokenStream.from_tokens(tokens, exact=True), cancel, max_magnitude)
+                if output_stream is None:
+                    return None
+                return self.add_subtract(self.multi_divide(
+                    self.exponent(output_stream, cancel, max_magnitude), cancel, max_magnitude),
+                    cancel, max_magnitude).to_list()
+            except TypeError:
+                pass
+        output_list = self.resolve_parentheses(tokens, cancel, max_magnitude)
+        if output_list is None:
+            return None
+        return self.add_subtract(self.multi_divide(
+            self.exponent(output_list, cancel, max_magnitude), cancel, max_magnitude),
+            cancel, max_magnitude)
+
+    def _calculate_measured(self, user_input: str, decimal_places: int) -> Tuple[str, str]:
+        """
+        Calculate like calculate() while recording each stage in self.metrics.
+
+        A stage that raises is recorded up to the error. With a result cache the
+        whole lookup is the 'cache' stage, misses are compiled inside it.
+        """
+        metrics = self.metrics
+        stage = 'tokenize'
+        begin = start = metrics.clock()
+        output_txt = ''
+        try:
+            if self._result_cache is not None:
+                stage = 'cache'
+                output_txt, error_message = self._calculate_cached(user_input, decimal_places)
+                error_key = CalculatorError.get_error_key(error_message)
+            else:
+                tokens, _, error_key, _ = self.tokenize(user_input)
+                if not error_key:
+                    start = metrics.record(stage, start)
+                    stage = 'parentheses'
+                    use_stream = len(tokens) >= STREAM_MIN_TOKENS
+                    try:
+                        output_list = self.resolve_parentheses(
+                            TokenStream.from_tokens(tokens, exact=True) if use_stream else tokens)
+                        if output_list is not None:
+                            start = metrics.record(stage, start)
+                            stage = 'reduce'
+                            output_list = self.add_subtract(self.multi_divide(self.exponent(output_list)))
+                            if use_stream:
+                                output_list = output_list.to_list()
+                    except TypeError:
+                        if not use_stream:
+                            raise
+                        #a complex power or inexact value, redo the stages with lists as _reduce_tokens does
+                        output_list = self._reduce_tokens(tokens, stream=False)
+                    if output_list is None:
+                        error_key = 'IMPROPER_PARENTHESIS'
+                    elif len(output_list) != 1:
+                        error_key = 'CALCULATION_INCOMPLETE'
+                if not error_key:
+                    start = metrics.record(stage, start)
+                    stage = 'format'
+                    output_txt = self.output_clean_convert(output_list, decimal_places)
+        except ZeroDivisionError:
+            error_key = 'DIVISION_BY_ZERO'
+        except OverflowError:
+            error_key = 'OVERFLOW'
+        except (ValueError, TypeError, IndexError):
+            error_key = 'CALCULATION_INCOMPLETE'
+        metrics.record(stage, start)
+        metrics.record('calculate', begin, error_key)
+
+        if error_key:
+            return user_input, CalculatorError.get_error_message(error_key)
+        return output_txt, ''
+
+    def _calculate_cached(self, user_input: str, decimal_places: int) -> Tuple[str, str]:
+        """
+        Calculate through the compiled expression and result caches.
+
+        Both caches are keyed by the input without spaces. Other whitespace is
+        kept in the key because validate_input rejects it. Misses are looked up
+        in the persistent cache, when there is one, before calculating.
+        """
+        expression_key = user_input.replace(' ', '')
+        result = self._result_cache.get((expression_key, decimal_places))
+        if result is None:
+            persistent_cache = self.persistent_cache
+            if persistent_cache is not None:
+                result = persistent_cache.get_result(expression_key, decimal_places)
+            if result is None:
+                value, error_key = self._compile_cached(user_input).compute()
+                result = ('', error_key) if error_key else (self.output_clean_convert([value], decimal_places), '')
+                if persistent_cache is not None:
+                    persistent_cache.put_result(expression_key, decimal_places, result)
+            self._result_cache.put((expression_key, decimal_places), result)
+
+        output_txt, error_key = result
+        if error_key:
+            return user_input, CalculatorError.get_error_message(error_key)
+        return output_txt, ''
+
+    def cache_info(self) -> dict:
+        """
+        Report the statistics of the compiled expression and result caches.
+
+        Returns:
+            dict: CacheInfo(hits, misses, evictions, maxsize, currsize) for
+            'compiled' and 'results', and 'persistent' when there is a persistent
+            cache, or an empty dict when caching is disabled
+        """
+        if self._result_cache is None:
+            return {}
+        info = {
+            'compiled': self._compiled_cache.info(),
+            'results': self._result_cache.info(),
+        }
+        if self.persistent_cache is not None:
+            info['persistent'] = self.persistent_cache.info()
+        return info
+
+    def cache_clear(self) -> None:
+        """Empty the in-memory caches and reset their statistics, the persistent cache is kept."""
+        if self._result_cache is not None:
+            self._compiled_cache.clear()
+            self._result_cache.clear()
+
+    def calculate_many(
+            self,
+            expressions: Iterable[str],
+            decimal_places: int,
+            workers: Optional[int] = None,
+            chunk_size: int = BATCH_CHUNK_SIZE,
+            executor: Optional['Executor'] = None,
+            threads: bool = False
+            ) -> Iterator[Tuple[str, str]]:
+        """
+        Lazily calculate a stream of expressions.
+
+        Results are produced one at a time, so any iterable (including an open
+        file or a generator) can be processed in constant memory. With workers
+        or an executor, chunks of expressions are calculated in parallel while
+        results are still yielded in input order. Threads, whether started with
+        threads=True or taken from a ThreadPoolExecutor, share this calculator
+        and its caches; with the GIL they don't calculate in parallel, and
+        free-threaded builds are not benchmarked yet.
+
+        Args:
+            expressions (iterable): Mathematical expressions to calculate
+            decimal_places (int): number of decimal places to return
+            workers (int): number of worker processes, None to calculate in this process
+            chunk_size (int): number of expressions sent to a worker at a time
+            executor (Executor): existing executor to use instead of starting a
+                process pool; it is not shut down afterwards
+            threads (bool): start a pool of `workers` threads instead of processes
+
+        Yields:
+            Tuple of (result, error_message) for each expression, in input order
+        """
+        if threads or executor is not None or (workers is not None and workers > 1):
+            yield from self._calculate_parallel(expressions, decimal_places, workers, chunk_size, executor, threads)
+            return
+        calculate = self.calculate
+        for user_input in expressions:
+            yield calculate(user_input, decimal_places)
+
+    def _calculate_parallel(
+            self,
+            expressions: Iterable[str],
+            decimal_places: int,
+            workers: Optional[int],
+            chunk_size: int,
+            executor: Optional['Executor'],
+            threads: bool = False
+            ) -> Iterator[Tuple[str, str]]:
+        """Calculate chunks on an executor, keeping at most two chunks per worker pending."""
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+        workers = workers or os.cpu_count() or 1
+        owned_executor = executor is None
+        if owned_executor:
+            executor = (ThreadPoolExecutor if threads else ProcessPoolExecutor)(max_workers=workers)
+        if isinstance(executor, ThreadPoolExecutor):
+            task, arguments = self._calculate_list, (decimal_places,)
+        else:
+            cache_size = self._result_cache.maxsize if self._result_cache is not None else None
+            task, arguments = _calculate_chunk, (decimal_places, cache_size, self.engine, self.persistent_cache)
+
+        expressions = iter(expressions)
+        pending = deque()
+        try:
+            while True:
+                while len(pending) < 2 * workers:
+                    chunk = list(islice(expressions, chunk_size))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(task, chunk, *arguments))
+                if not pending:
+                    break
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            if owned_executor:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def _calculate_list(self, expressions: List[str], decimal_places: int) -> List[Tuple[str, str]]:
+        """Calculate a chunk of expressions in a thread sharing this calculator."""
+        calculate = self.calculate
+        return [calculate(user_input, decimal_places) for user_input in expressions]
+
+    def calculate_columns(
+            self,
+            expressions: Iterable[str],
+            values=None,
+            error_codes=None
+            ) -> ColumnarResults:
+        """
+        Calculate a batch of expressions into a float64 column and a uint8 error code column.
+
+        Nothing is formatted, see ColumnarResults.format(). A complex or '.'
+        result can't be stored as float64 and gets the CALCULATION_INCOMPLETE
+        code, as in CompiledExpression.evaluate_array().
+
+        Args:
+            expressions (iterable): Mathematical expressions to calculate
+            values: preallocated writable float64 buffer, such as array('d') or
+                a NumPy array, with room for every expression; None to allocate
+            error_codes: preallocated writable uint8 buffer of the same length
+
+        Returns:
+            ColumnarResults over the given buffers, or new array('d')/array('B')
+            columns exactly as long as the batch
+
+        Raises:
+            TypeError: for a buffer of the wrong item format
+            IndexError: when the batch is longer than the buffers
+        """
+        compute = self._compute_cached if self._result_cache is not None \
+            else lambda user_input: self.compute_tokens(self.tokenize(user_input))
+        error_code = CalculatorError.get_error_code
+        nan = math.nan
+
+        def columns():
+            for user_input in expressions:
+                value, error_key = compute(user_input)
+                if not error_key:
+                    if value.__class__ is float:
+                        yield value, 0
+                        continue
+                    if value.__class__ is int:
+                        try:
+                            yield float(value), 0
+                        except OverflowError:
+                            yield nan, error_code('OVERFLOW')
+                        continue
+                    error_key = 'CALCULATION_INCOMPLETE'
+                yield nan, error_code(error_key)
+
+        if values is None and error_codes is None:
+            values = array('d')
+            error_codes = array('B')
+            for value, code in columns():
+                values.append(value)
+                error_codes.append(code)
+            return ColumnarResults(self, values, error_codes)
+
+        value_view = memoryview(values)
+        code_view = memoryview(error_codes)
+        if value_view.format != 'd' or code_view.format != 'B':
+            raise TypeError("values must be a float64 ('d') buffer and error_codes a uint8 ('B') buffer")
+        if len(value_view) != len(code_view):
+            raise ValueError('values and error_codes must have the same length')
+        count = 0
+        for count, (value, code) in enumerate(columns(), 1):
+            if count > len(value_view):
+                raise IndexError('more expressions than room in the result buffers')
+            value_view[count - 1] = value
+            code_view[count - 1] = code
+        return ColumnarResults(self, value_view[:count], code_view[:count])
+
+    def _compute_cached(self, user_input: str) -> Tuple[Union[int, float, complex, str, None], str]:
+        """compute_tokens() through the compiled expression cache."""
+        return self._compile_cached(user_input).compute()
+
+    def _compile_cached(self, user_input: str) -> CompiledExpression:
+        """compile() through the compiled expression cache when there is one."""
+        if self._compiled_cache is None:
+            return self.compile(user_input)
+        expression_key = user_input.replace(' ', '')
+        compiled = self._compiled_cache.get(expression_key)
+        if compiled is None:
+            persistent_cache = self.persistent_cache
+            if persistent_cache is not None:
+                compiled = persistent_cache.get_compiled(expression_key, self, user_input)
+            if compiled is None:
+                compiled = self.compile(user_input)
+                if persistent_cache is not None:
+                    persistent_cache.put_compiled(expression_key, compiled)
+            self._compiled_cache.put(expression_key, compiled)
+        return compiled
+
+    def calculate_shared(self, expressions: Iterable[str], decimal_places: int) -> SharedBatchResult:
+        """
+        Calculate a batch, performing each distinct operation of the whole batch once.
+
+        Every expression is compiled and its operations are hash-consed into one
+        DAG: an operation on the same operator and operand nodes as an earlier one,
+        in this or another expression, is the same node. Repeated subexpressions
+        such as "(1.07^12)" are therefore calculated once for the batch. Errors
+        are reported per expression in its own program order, as by calculate().
+
+        Args:
+            expressions (iterable): Mathematical expressions to calculate
+            decimal_places (int): number of decimal places to return
+
+        Returns:
+            SharedBatchResult of (results, operations, evaluations, saved): the
+            (result, error_message) pairs in input order, the operations of all
+            expressions, those actually performed, and the difference
+        """
+        nodes = {}
+        #(operator, left node, right node), or (None, value) for a constant
+        definitions = []
+        programs = []
+        operations = 0
+        for user_input in expressions:
+            compiled = self._compile_cached(user_input)
+            local = []
+            for value in compiled._constants:
+                #2 and 2.0, or 0.0 and -0.0, are equal but calculate differently
+                key = (value.__class__, repr(value))
+                node = nodes.get(key)
+                if node is None:
+                    node = nodes[key] = len(definitions)
+                    definitions.append((None, value))
+                local.append(node)
+            for op, left, right in compiled._instructions:
+                key = (op, local[left], local[right])
+                node = nodes.get(key)
+                if node is None:
+                    node = nodes[key] = len(definitions)
+                    definitions.append(key)
+                local.append(node)
+            operations += len(compiled._instructions)
+            programs.append((user_input, compiled, local[len(compiled._constants):], local))
+
+        #definitions are in dependency order, operands always come first
+        values = []
+        errors = []
+        integers = set()
+        powers = set()
+        evaluations = 0
+        for node, definition in enumerate(definitions):
+            op = definition[0]
+            if op is None:
+                value = definition[1]
+                if value.__class__ is int:
+                    integers.add(node)
+                values.append(value)
+                errors.append('')
+                continue
+            _, left, right = definition
+            evaluations += 1
+            if op == '^':
+                powers.add(node)
+            if left in integers and right in integers:
+                function = _EXACT_OPERATIONS[op]
+                if op != '/':
+                    integers.add(node)
+            elif left in powers or right in powers:
+                function = _CHECKED_OPERATIONS[op]
+            else:
+                function = _OPERATIONS[op]
+            error_key = ''
+            value = _FAILED
+            if values[left] is not _FAILED and values[right] is not _FAILED:
+                try:
+                    value = function(values[left], values[right])
+                except ZeroDivisionError:
+                    error_key = 'DIVISION_BY_ZERO'
+                except OverflowError:
+                    error_key = 'OVERFLOW'
+                except TypeError:
+                    error_key = 'CALCULATION_INCOMPLETE'
+            values.append(value)
+            errors.append(error_key)
+
+        results = []
+        formatted = {}
+        format_value = _value_formatter(decimal_places)
+        for user_input, compiled, instruction_nodes, local in programs:
+            #an operation that failed because an operand failed has no key, the operand comes first
+            error_key = next((errors[node] for node in instruction_nodes if errors[node]), '') \
+                or compiled._error
+            if error_key:
+                results.append((user_input, CalculatorError.get_error_message(error_key)))
+                continue
+            result = compiled._result
+            if result.__class__ is not int:
+                results.append((format_value(result), ''))
+                continue
+            node = local[result]
+            if node not in formatted:
+                formatted[node] = format_value(values[node])
+            results.append((formatted[node], ''))
+        return SharedBatchResult(results, operations, evaluations, operations - evaluations)
+
+    def calculate_file(
+            self,
+            path: str,
+            decimal_places: int,
+            buffer_size: int = FILE_BUFFER_SIZE,
+            **batch_options
+            ) -> Iterator[Tuple[str, str]]:
+        """
+        Lazily calculate a file containing one expression per line.
+
+        Args:
+            path (str): path of the expression file
+            decimal_places (int): number of decimal places to return
+            buffer_size (int): number of bytes read from the file at a time
+            **batch_options: workers, chunk_size or executor, as for calculate_many
+
+        Yields:
+            Tuple of (result, error_message) for each line, in file order
+        """
+        with open(path, 'r', encoding='utf-8', buffering=buffer_size) as expression_file:
+            yield from self.calculate_many(
+                (line.rstrip('\n') for line in expression_file),
+                decimal_places,
+                **batch_options
+                )
+
+
+class IncrementalTokenizer:
+    """
+    Tokenizer for an expression that is edited in place, such as a text entry.
+
+    The scanned pieces of the last input and checkpoints of the tokenizer loop
+    every `interval` pieces are kept. An update resumes from the last checkpoint
+    before the first changed character, so typing near the end of a long
+    expression does not re-scan or re-validate the unchanged start.
+    """
+
+    def __init__(
+            self,
+            calculator: Calculator,
+            variables: Iterable[str] = (),
+            interval: int = TOKENIZE_CHECKPOINT_INTERVAL
+            ):
+        """
+        Args:
+            calculator (Calculator): calculator whose tokenizer is used
+            variables (iterable): names that may be used as operands
+            interval (int): pieces between checkpoints
+        """
+        self.calculator = calculator
+        self.names = _variable_names(variables)
+        self.interval = interval
+        self.text = ''
+        #pieces processed by the last update, the rest were reused
+        self.processed = 0
+        self._scan = (_SCAN_VARIABLE_PATTERN if self.names else _SCAN_PATTERN).findall
+        self._pieces = []
+        self._checkpoints = []
+        self._result = calculator.tokenize('', self.names)
+
+    def update(self, text: str) -> TokenizeResult:
+        """
+        Tokenize the new text of the expression.
+
+        Args:
+            text (str): full expression after the edit
+
+        Returns:
+            TokenizeResult, the same as Calculator.tokenize(text, variables)
+        """
+        if text == self.text:
+            self.processed = 0
+            return self._result
+        changed = _common_prefix_length(self.text, text)
+
+        #the last checkpoint whose pieces, and the character each looked at after
+        #its end, all come before the change; a '.' may have looked past spaces
+        checkpoints = self._checkpoints
+        index = len(checkpoints) - 1
+        while index >= 0 and (checkpoints[index][3] >= changed
+                              or self._pieces[checkpoints[index][0] - 1] == '.'):
+            index -= 1
+        if index >= 0:
+            first, count, last_token, position, *rest = checkpoints[index]
+            tokens = self._result.tokens[:count]
+            positions = self._result.positions[:count]
+            if count:
+                tokens[-1] = last_token
+            state = (tokens, positions, position, *rest)
+        else:
+            first = position = 0
+            state = None
+        del checkpoints[index + 1:]
+
+        pieces = self._pieces[:first]
+        pieces.extend(self._scan(text, position))
+        state = self.calculator._tokenize_pieces(pieces, self.names, first, state, checkpoints, self.interval)
+        self.text = text
+        self.processed = len(pieces) - first
+        self._pieces = pieces
+        self._result = self.calculator._tokenize_result(state)
+        return self._result
+
+
+def _common_prefix_length(first: str, second: str) -> int:
+    """Length of the common start of two strings, compared in halves."""
+    low, high = 0, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[low:middle] == second[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+#calculators of the current worker process, by cache size, engine and persistent cache file
+_worker_calculators = {}
+
+
+def _calculate_chunk(
+        expressions: List[str],
+        decimal_places: int,
+        cache_size: Optional[int] = None,
+        engine: str = 'reduction',
+        persistent_cache=None
+        ) -> List[Tuple[str, str]]:
+    """
+    Calculate a chunk of expressions in a worker.
+
+    Args:
+        expressions (list): Mathematical expressions to calculate
+        decimal_places (int): number of decimal places to return
+        cache_size (int): cache size of the worker's calculator
+        engine (str): engine of the worker's calculator
+        persistent_cache (PersistentCache): persistent cache of the worker's calculator
+
+    Returns:
+        list: (result, error_message) for each expression
+    """
+    key = (cache_size, engine, persistent_cache.path if persistent_cache is not None else None)
+    calculator = _worker_calculators.get(key)
+    if calculator is None:
+        calculator = _worker_calculators[key] = Calculator(
+            cache_size=cache_size, engine=engine, persistent_cache=persistent_cache)
+    calculate = calculator.calculate
+    results = [calculate(user_input, decimal_places) for user_input in expressions]
+    if calculator.persistent_cache is not None:
+        #pool workers exit without running atexit handlers
+        calculator.persistent_cache.flush()
+    return results
+
+def _read_lines(path: str) -> Iterator[str]:
+    """
+    Lines of an expression file without their line breaks, memory-mapped when possible.
+
+    Args:
+        path (str): file path, or '-' for standard input
+
+    Yields:
+        str: each line, undecodable bytes replaced so they are reported as unexpected characters
+    """
+    source = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    mapped = None
+    try:
+        try:
+            mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            #pipes, terminals and empty files can't be mapped, read them buffered
+            lines = source
+        else:
+            lines = iter(mapped.readline, b'')
+        for line in lines:
+            yield line.rstrip(b'\r\n').decode('utf-8', 'replace')
+    finally:
+        if mapped is not None:
+            mapped.close()
+        if source is not sys.stdin.buffer:
+            source.close()
+
+
+def _output_formatter(output_format: str):
+    """Function formatting one output line from an expression and its (result, error) pair."""
+    if output_format == 'plain':
+        return lambda user_input, result, error: (error or result) + '\n'
+    if output_format == 'tsv':
+        return lambda user_input, result, error: f'{user_input}\t{result}\t{error}\n'
+    #same text as json.dumps of the dictionary, without building it
+    from json.encoder import encode_basestring_ascii as encode
+    return lambda user_input, result, error: (
+        f'{{"expr": {encode(user_input)}, "result": {encode(result)}, "error": {encode(error)}}}\n')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Calculate expressions from the command line.
+
+    Without expressions or --batch the expression is prompted for. With --batch
+    every line of the given files (standard input when none are given or for
+    '-') is calculated, writing one output line per input line in input order:
+    the result or error message (plain), expression, result and error
+    separated by tabs (tsv), or {"expr", "result", "error"} objects (jsonl).
+
+    Args:
+        argv (list): command line arguments, defaults to sys.argv
+
+    Returns:
+        int: process exit code, 1 when any expression could not be calculated
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description='Calculate mathematical expressions')
+    parser.add_argument('inputs', nargs='*',
+                        help="expressions to calculate, or expression files with --batch ('-' for stdin); "
+                             "put '--' before expressions starting with '-'")
+    parser.add_argument('--batch', action='store_true',
+                        help='calculate every line of the input files or stdin')
+    parser.add_argument('--format', choices=('plain', 'tsv', 'jsonl'), default='plain')
+    parser.add_argument('--decimals', type=int, default=4, help='decimal places of the results')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='calculate in this many worker processes instead of this one')
+    parser.add_argument('--chunk-size', type=int, default=BATCH_CHUNK_SIZE,
+                        help='expressions sent to a worker at a time')
+    parser.add_argument('--cache-size', type=int, default=None, help='result cache size, for repetitive input')
+    parser.add_argument('--engine', choices=ENGINES, default='reduction', help='calculation engine')
+    parser.add_argument('--stats', action='store_true', help='report counts and timings on stderr')
+    args = parser.parse_args(argv)
 
-if __name__ == "__main__": 
-    user_input_calc = input('Provide the expression you wish to calculate:\nUsable operators are + , - , * , / , ^, ( , )\n--->')
-    calculator = Calculator()
-    out,error=calculator.calculate(user_input_calc,4)
-    print(f'Results: {out}\nError: {error}')
+    calculator = Calculator(cache_size=args.cache_size, engine=args.engine)
+    if not args.batch and not args.inputs:
+        user_input_calc = input('Provide the expression you wish to calculate:\nUsable operators are + , - , * , / , ^, ( , )\n--->')
+        out,error=calculator.calculate(user_input_calc,args.decimals)
+        print(f'Results: {out}\nError: {error}')
+        return 1 if error else 0
 
+    if args.batch:
+        expressions = (line for path in args.inputs or ['-'] for line in _read_lines(path))
+    else:
+        expressions = iter(args.inputs)
+    expressions, echoed = tee(expressions)
+    results = calculator.calculate_many(
+        expressions, args.decimals, workers=args.workers or None, chunk_size=args.chunk_size)
+    formatter = _output_formatter(args.format)
+    write = sys.stdout.write
+    lines = []
+    count = errors = 0
+    started = time.perf_counter()
+    try:
+        for user_input, (result, error) in zip(echoed, results):
+            lines.append(formatter(user_input, result, error))
+            if error:
+                errors += 1
+            if len(lines) >= OUTPUT_BATCH_SIZE:
+                count += len(lines)
+                write(''.join(lines))
+                lines.clear()
+        count += len(lines)
+        write(''.join(lines))
+        sys.stdout.flush()
+    except BrokenPipeError:
+        #the reader went away, as in `... | head`; silence the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    elapsed = time.perf_counter() - started
 
+    if args.stats:
+        print(f'expressions: {count}\n'
+              f'errors: {errors}\n'
+              f'import: {_IMPORT_SECONDS * 1000:.1f} ms\n'
+              f'calculate: {elapsed:.3f} s\n'
+              f'rate: {count / elapsed if elapsed else 0:.0f} expressions/s', file=sys.stderr)
+    return 1 if errors else 0
 
 
+#seconds spent importing this module
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
 
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -8,7 +8,8 @@ This module provides a graphical user interface for the Calculator application.
 Features:
 - Interactive button-based input or keyboard input through cursor
 - Decimal place display selection
-- Real-time calculation
+- Real-time calculation on a background thread, so long expressions never freeze the window
+- Live preview of the result while typing, re-tokenizing only the edited part
 - Error handling
 
 Dependencies:
@@ -16,12 +17,101 @@ Dependencies:
 - Calculator module
 """
 
+import queue
+import threading
 import tkinter as tk
+from typing import Callable, Optional
 import Calculator as calc
 
 #Initialize calculator object
 calculator = calc.Calculator()
 
+#milliseconds between checks for finished background calculations
+POLL_INTERVAL_MS = 20
+
+
+class BackgroundCalculator:
+    """
+    Run calculations on a worker thread and deliver results on the Tk thread.
+
+    Only the latest request of each kind is kept: requests submitted while the
+    worker is busy replace the waiting one, and results of requests that were
+    replaced before finishing are dropped. An exception raised by a request is
+    passed to on_error instead of the callback and the worker keeps running.
+    """
+
+    def __init__(
+            self,
+            root: tk.Misc,
+            poll_interval: int = POLL_INTERVAL_MS,
+            on_error: Optional[Callable[[str, Exception], None]] = None
+            ):
+        """
+        Args:
+            root (tk.Misc): widget whose after() polls for results
+            poll_interval (int): milliseconds between polls
+            on_error (callable): called on the Tk thread with the kind and the exception
+                of a request that raised, unless a newer request of the kind was submitted
+        """
+        self._root = root
+        self._poll_interval = poll_interval
+        self._on_error = on_error
+        self._condition = threading.Condition()
+        #kind -> (request number, function, arguments, callback)
+        self._waiting = {}
+        self._latest = {}
+        self._request_count = 0
+        self._results = queue.SimpleQueue()
+        threading.Thread(target=self._work, daemon=True).start()
+        root.after(poll_interval, self._poll)
+
+    def submit(self, kind: str, callback: Callable, function: Callable, *args) -> None:
+        """
+        Calculate function(*args) in the background and pass the result to callback on the Tk thread.
+
+        Args:
+            kind (str): requests of the same kind replace each other
+            callback (callable): called with the result unless a newer request of the kind was submitted
+            function (callable): calculation to run on the worker thread
+        """
+        with self._condition:
+            self._request_count += 1
+            self._latest[kind] = self._request_count
+            self._waiting[kind] = (self._request_count, function, args, callback)
+            self._condition.notify()
+
+    def _work(self) -> None:
+        """Worker thread loop, oldest waiting request first."""
+        while True:
+            with self._condition:
+                while not self._waiting:
+                    self._condition.wait()
+                kind = min(self._waiting, key=lambda waiting_kind: self._waiting[waiting_kind][0])
+                request_number, function, args, callback = self._waiting.pop(kind)
+            try:
+                result = function(*args)
+            except Exception as exception:
+                #a failed request must not stop the only worker thread
+                self._results.put((kind, request_number, None, exception))
+            else:
+                self._results.put((kind, request_number, callback, result))
+
+    def _poll(self) -> None:
+        """Deliver finished results on the Tk thread."""
+        while True:
+            try:
+                kind, request_number, callback, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if self._latest.get(kind) != request_number:
+                continue
+            if callback is not None:
+                callback(result)
+            elif self._on_error is not None:
+                self._on_error(kind, result)
+        self._root.after(self._poll_interval, self._poll)
+
+
 def main() -> None:
     """
     Create and initialize the calculator GUI application.
@@ -85,6 +175,44 @@ def main() -> None:
     error_message=''
     error_text=tk.Label(root, text=error_message,font=('Times New Roman',12),height=1)
     error_text.grid(columnspan = max_columns,row=max_rows+2,column=0,padx=3,pady=3)
+
+    #live preview of the result
+    preview_text=tk.Label(root, text='',font=('Times New Roman',12),height=1,fg='gray40')
+    preview_text.grid(columnspan = max_columns,row=max_rows+3,column=0,padx=3,pady=3)
+
+    #calculations run on a worker thread, the preview tokenizer is only used there
+    def show_failure(kind, exception):
+        if kind=='preview':
+            preview_text.config(text='')
+        else:
+            error_text.config(text=f'Error: {exception}')
+
+    background = BackgroundCalculator(root, on_error=show_failure)
+    preview_tokenizer = calc.IncrementalTokenizer(calculator)
+
+    def preview(expression, decimal_places):
+        if not expression.strip():
+            return ''
+        calc_output,calc_error = calculator.evaluate_tokens(
+            expression, preview_tokenizer.update(expression), decimal_places)
+        return calc_error or '= '+calc_output
+
+    def show_result(expression, result):
+        #ignore the result if the entry was edited while calculating
+        if entry_string.get()!=expression:
+            return
+        calc_output,calc_error=result
+        error_text.config(text=calc_error)
+        entry_string.set(calc_output)
+        entry_screen.icursor(len(entry_string.get()))
+
+    def update_preview(*_):
+        background.submit(
+            'preview', lambda text: preview_text.config(text=text),
+            preview, entry_string.get(), decimal_value.get()
+            )
+    entry_string.trace_add('write', update_preview)
+    decimal_value.trace_add('write', update_preview)
     
     #Function for button presses of character inputs
     def character_click(value):
@@ -97,10 +225,11 @@ def main() -> None:
                 )
             entry_screen.icursor(cursor_position+1)
         elif value==calculate_button:
-            calc_output,calc_error=calculator.calculate(entry_string.get(),decimal_value.get())
-            error_text.config(text=calc_error)
-            entry_string.set(calc_output)
-            entry_screen.icursor(len(entry_string.get()))
+            expression=entry_string.get()
+            background.submit(
+                'calculate', lambda result: show_result(expression, result),
+                calculator.calculate, expression, decimal_value.get()
+                )
         elif value==clear_button:
             entry_string.set('')
             error_text.config(text='')
@@ -0,0 +1,587 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Calculator Benchmark Module
+
+This module measures the throughput of the Calculator module on generated expressions.
+Benchmarks:
+- stages: time of each pipeline stage for expressions of growing length, nesting and
+  operator mix, saved as JSON and compared against a baseline run; stages that look
+  slower are measured again before a regression is reported
+- parallel: batch calculation scaling from 1 to N worker processes
+- threads: batch calculation scaling from 1 to N threads sharing one calculator, which
+  can't scale with the GIL; run it on a free-threaded (no-GIL) build to measure that case
+- server: request latency (p50/p99) and throughput of Calculator_server.py
+
+Usage:
+    python Calculator_benchmark.py stages --output stages.json
+    python Calculator_benchmark.py stages --baseline stages.json --threshold 1.5
+    python Calculator_benchmark.py parallel --count 200000 --max-workers 8
+    python3.13t Calculator_benchmark.py threads --count 200000 --max-threads 8
+    python Calculator_benchmark.py server --clients 16 --requests 2000
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import time
+from typing import Callable, List, Optional
+
+import Calculator as calc
+
+
+def generate_expression(
+        rng: random.Random,
+        operands: int,
+        operators: str = '+-*/',
+        nesting: float = 0.2
+        ) -> str:
+    """
+    Generate a random valid expression.
+
+    Args:
+        rng (random.Random): random number generator
+        operands (int): number of numbers in the expression
+        operators (str): operators to choose from
+        nesting (float): probability of wrapping a sub-expression in parentheses
+
+    Returns:
+        str: expression text
+    """
+    if operands <= 1:
+        number = rng.choice((str(rng.randint(1, 999)), f'{rng.uniform(0.1, 99):.3f}'))
+        return number if rng.random() > 0.2 else '-' + number
+    left_operands = rng.randint(1, operands - 1)
+    left = generate_expression(rng, left_operands, operators, nesting)
+    right = generate_expression(rng, operands - left_operands, operators, nesting)
+    operator = rng.choice(operators)
+    if left.endswith(')') and operator == '-' and not right.startswith('('):
+        #a '-' after ')' is merged into the following number by the tokenizer
+        right = f'({right})'
+    expression = f'{left}{operator}{right}'
+    if rng.random() < nesting:
+        expression = f'({expression})'
+    return expression
+
+
+def generate_batch(count: int, operands: int = 8, seed: int = 0) -> List[str]:
+    """
+    Generate a reproducible list of expressions.
+
+    Args:
+        count (int): number of expressions
+        operands (int): numbers per expression
+        seed (int): random seed
+
+    Returns:
+        list: expression strings
+    """
+    rng = random.Random(seed)
+    return [generate_expression(rng, operands) for _ in range(count)]
+
+
+#expression shapes of the stage benchmark
+SHAPES = ('mixed', 'additive', 'multiplicative', 'nested')
+#pipeline stages, each timed separately
+STAGES = (
+    'tokenize', 'parse_input', 'merge_negatives', 'validate_input', 'parentheses',
+    'exponent', 'multi_divide', 'add_subtract', 'output_clean_convert', 'compile', 'evaluate',
+)
+DEFAULT_MAX_TOKENS = 10 ** 6
+#shortest timed run of a stage, fast stages are called repeatedly to reach it
+MIN_RUN_SECONDS = 0.005
+#more runs per measurement when a stage is measured again to confirm a regression
+CONFIRM_REPEAT_FACTOR = 3
+#seconds a local server gets to shut its workers down before it is killed
+SERVER_STOP_TIMEOUT = 10.0
+
+
+def generate_shaped_expression(shape: str, tokens: int, seed: int = 0) -> str:
+    """
+    Generate a valid expression of roughly the given number of tokens.
+
+    Args:
+        shape (str): 'mixed' (all operators), 'additive' (+ -), 'multiplicative' (* /),
+            or 'nested' (one group per operator, nested as deep as possible)
+        tokens (int): approximate number of tokens
+        seed (int): random seed
+
+    Returns:
+        str: expression text
+    """
+    rng = random.Random(seed)
+    operands = max(1, (tokens + 1) // 2)
+    if shape == 'nested':
+        depth = max(1, tokens // 4)
+        return '(' * depth + '1' + ''.join(rng.choice(('+2)', '*1)', '-1)')) for _ in range(depth))
+    operators = {'mixed': '+-*/^', 'additive': '+-', 'multiplicative': '*/'}[shape]
+    parts = [str(rng.randint(1, 9))]
+    for _ in range(operands - 1):
+        #never chain '^', its left-to-right evaluation would overflow
+        operator = rng.choice(operators.replace('^', '') if parts[-2:-1] == ['^'] else operators)
+        operand = str(rng.randint(1, 3)) if operator == '^' else rng.choice(('7', '3', '1.5', '2', '4.25'))
+        parts.append(operator)
+        parts.append(operand)
+    return ''.join(parts)
+
+
+def benchmark_stages(
+        sizes: List[int],
+        shapes: List[str] = SHAPES,
+        repeat: int = 3,
+        budget: float = 1.0
+        ) -> List[dict]:
+    """
+    Time every pipeline stage on expressions of growing length.
+
+    Each stage gets the output of the stage before it, copied outside the
+    timed region. A stage faster than MIN_RUN_SECONDS is called several times
+    per run and timed per call. A stage that takes longer than the budget at
+    one size, and every stage depending on it, is not run for larger sizes of
+    that shape. 'output_clean_convert' formats the one final result.
+
+    Args:
+        sizes (list): token counts to generate
+        shapes (list): expression shapes, see generate_shaped_expression
+        repeat (int): runs per measurement, the fastest is kept
+        budget (float): seconds a single call may take
+
+    Returns:
+        list: {'shape', 'stage', 'tokens', 'seconds'} per measurement
+    """
+    calculator = calc.Calculator()
+    rows = []
+    for shape in shapes:
+        over_budget = set()
+        for size in sizes:
+            expression = generate_shaped_expression(shape, size)
+
+            def measure(stage: str, function: Callable, make_args: Callable):
+                if stage in over_budget:
+                    return None
+                args = make_args()
+                start = time.perf_counter()
+                output = function(*args)
+                best = time.perf_counter() - start
+                if best > budget:
+                    over_budget.add(stage)
+                else:
+                    #calls per run, so short stages are timed over MIN_RUN_SECONDS
+                    number = max(1, min(10000, int(MIN_RUN_SECONDS / max(best, 1e-9))))
+                    for _ in range(repeat):
+                        calls = [make_args() for _ in range(number)]
+                        start = time.perf_counter()
+                        for args in calls:
+                            function(*args)
+                        best = min(best, (time.perf_counter() - start) / number)
+                rows.append({'shape': shape, 'stage': stage, 'tokens': size, 'seconds': best})
+                return output
+
+            def after(stage: str, source, function: Callable, make_args: Callable):
+                if source is None:
+                    over_budget.add(stage)
+                    return None
+                return measure(stage, function, make_args)
+
+            tokens = measure('tokenize', calculator.tokenize, lambda: (expression,))
+            parsed = measure('parse_input', calculator.parse_input, lambda: (expression,))
+            merged = after('merge_negatives', parsed, calculator.merge_negatives, lambda: (list(parsed),))
+            after('validate_input', merged, calculator.validate_input, lambda: (merged, expression))
+
+            token_list = tokens.tokens if tokens is not None else None
+            flat = after('parentheses', token_list, calculator.resolve_parentheses, lambda: (list(token_list),))
+            powered = after('exponent', flat, calculator.exponent, lambda: (list(flat),))
+            multiplied = after('multi_divide', powered, calculator.multi_divide, lambda: (list(powered),))
+            reduced = after('add_subtract', multiplied, calculator.add_subtract, lambda: (list(multiplied),))
+            after('output_clean_convert', reduced, calculator.output_clean_convert, lambda: (reduced, 4))
+
+            compiled = measure('compile', calculator.compile, lambda: (expression,))
+            after('evaluate', compiled, lambda expression: expression.evaluate(4), lambda: (compiled,))
+    return rows
+
+
+def scaling_exponents(rows: List[dict], min_seconds: float = 1e-5) -> List[dict]:
+    """
+    Fit time ~ tokens^k for every shape and stage.
+
+    Args:
+        rows (list): measurements from benchmark_stages
+        min_seconds (float): shorter measurements are ignored as noise
+
+    Returns:
+        list: {'shape', 'stage', 'exponent'} per shape and stage with two or more usable sizes
+    """
+    points = {}
+    for row in rows:
+        if row['seconds'] >= min_seconds:
+            points.setdefault((row['shape'], row['stage']), []).append(
+                (math.log(row['tokens']), math.log(row['seconds'])))
+    exponents = []
+    for (shape, stage), samples in points.items():
+        if len(samples) < 2:
+            continue
+        mean_x = sum(x for x, _ in samples) / len(samples)
+        mean_y = sum(y for _, y in samples) / len(samples)
+        variance = sum((x - mean_x) ** 2 for x, _ in samples)
+        if variance:
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in samples) / variance
+            exponents.append({'shape': shape, 'stage': stage, 'exponent': slope})
+    return exponents
+
+
+def compare_results(
+        current: List[dict],
+        baseline: List[dict],
+        threshold: float,
+        min_seconds: float = 1e-3
+        ) -> List[str]:
+    """
+    Find stages that got slower than a baseline run.
+
+    Args:
+        current (list): measurements of this run
+        baseline (list): measurements of an earlier run
+        threshold (float): allowed ratio of current to baseline time
+        min_seconds (float): baseline measurements below this are too noisy to compare
+
+    Returns:
+        list: one message per regression, sizes or shapes not run this time are skipped
+    """
+    return [message for _, message in _regressions(current, baseline, threshold, min_seconds)]
+
+
+def _regressions(current: List[dict], baseline: List[dict], threshold: float, min_seconds: float) -> List[tuple]:
+    """(shape, stage, tokens) and message of every regression, see compare_results."""
+    measured = {(row['shape'], row['stage'], row['tokens']): row['seconds'] for row in current}
+    sizes = {(row['shape'], row['tokens']) for row in current}
+    regressions = []
+    for row in baseline:
+        key = (row['shape'], row['stage'], row['tokens'])
+        if (row['shape'], row['tokens']) not in sizes:
+            continue
+        label = '{}/{} at {} tokens'.format(*key)
+        if key not in measured:
+            regressions.append((key, f'{label}: no longer finishes within the time budget'))
+        elif row['seconds'] >= min_seconds and measured[key] > row['seconds'] * threshold:
+            regressions.append((key,
+                f"{label}: {measured[key]:.4f}s vs baseline {row['seconds']:.4f}s "
+                f"({measured[key] / row['seconds']:.2f}x)"))
+    return regressions
+
+
+def confirm_regressions(
+        current: List[dict],
+        baseline: List[dict],
+        threshold: float,
+        repeat: int = 3,
+        budget: float = 1.0,
+        min_seconds: float = 1e-3
+        ) -> List[str]:
+    """
+    Compare with a baseline, measuring the sizes of apparent regressions again first.
+
+    The shapes and sizes with a slower stage are run again with
+    CONFIRM_REPEAT_FACTOR times as many runs, and each stage keeps the fastest
+    time of both runs, so a single noisy run is not reported.
+
+    Args:
+        current (list): measurements of this run, updated with the new ones
+        baseline (list): measurements of an earlier run
+        threshold (float): allowed ratio of current to baseline time
+        repeat (int): runs per measurement of this run
+        budget (float): seconds a single call may take
+        min_seconds (float): baseline measurements below this are too noisy to compare
+
+    Returns:
+        list: one message per confirmed regression, as compare_results
+    """
+    suspects = {(shape, tokens) for (shape, _, tokens), _ in _regressions(current, baseline, threshold, min_seconds)}
+    fastest = {(row['shape'], row['stage'], row['tokens']): row for row in current}
+    for shape, tokens in sorted(suspects):
+        for row in benchmark_stages([tokens], [shape], repeat * CONFIRM_REPEAT_FACTOR, budget):
+            key = (row['shape'], row['stage'], row['tokens'])
+            if key not in fastest:
+                fastest[key] = row
+                current.append(row)
+            elif row['seconds'] < fastest[key]['seconds']:
+                fastest[key]['seconds'] = row['seconds']
+    return compare_results(current, baseline, threshold, min_seconds)
+
+
+def benchmark_parallel(
+        expressions: List[str],
+        max_workers: int,
+        chunk_size: int = calc.BATCH_CHUNK_SIZE,
+        decimal_places: int = 4
+        ) -> List[dict]:
+    """
+    Time calculate_many on the same batch with an increasing number of workers.
+
+    Args:
+        expressions (list): expressions to calculate
+        max_workers (int): largest number of worker processes to try
+        chunk_size (int): expressions sent to a worker at a time
+        decimal_places (int): number of decimal places to return
+
+    Returns:
+        list: one dict per worker count with seconds, throughput and speedup
+    """
+    calculator = calc.Calculator()
+    worker_counts = sorted({1, max_workers} | {2 ** power for power in range(max_workers.bit_length())
+                                              if 2 ** power <= max_workers})
+    rows = []
+    for workers in worker_counts:
+        start = time.perf_counter()
+        for _ in calculator.calculate_many(expressions, decimal_places, workers=workers, chunk_size=chunk_size):
+            pass
+        seconds = time.perf_counter() - start
+        rows.append({
+            'workers': workers,
+            'seconds': seconds,
+            'expressions_per_second': len(expressions) / seconds,
+            'speedup': rows[0]['seconds'] / seconds if rows else 1.0,
+        })
+    return rows
+
+
+def gil_enabled() -> bool:
+    """Whether this interpreter runs Python code one thread at a time."""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def benchmark_threads(
+        expressions: List[str],
+        max_threads: int,
+        chunk_size: int = calc.BATCH_CHUNK_SIZE,
+        decimal_places: int = 4,
+        cache_size: Optional[int] = None
+        ) -> List[dict]:
+    """
+    Time calculate_many on the same batch with an increasing number of threads sharing one calculator.
+
+    Args:
+        expressions (list): expressions to calculate
+        max_threads (int): largest number of threads to try
+        chunk_size (int): expressions given to a thread at a time
+        decimal_places (int): number of decimal places to return
+        cache_size (int): cache size of the shared calculator, None for no cache
+
+    Returns:
+        list: one dict per thread count with seconds, throughput, speedup and whether the GIL is enabled
+    """
+    thread_counts = sorted({1, max_threads} | {2 ** power for power in range(max_threads.bit_length())
+                                               if 2 ** power <= max_threads})
+    gil = gil_enabled()
+    rows = []
+    for threads in thread_counts:
+        calculator = calc.Calculator(cache_size=cache_size)
+        start = time.perf_counter()
+        for _ in calculator.calculate_many(
+                expressions, decimal_places, workers=threads, chunk_size=chunk_size, threads=True):
+            pass
+        seconds = time.perf_counter() - start
+        rows.append({
+            'threads': threads,
+            'gil': gil,
+            'seconds': seconds,
+            'expressions_per_second': len(expressions) / seconds,
+            'speedup': rows[0]['seconds'] / seconds if rows else 1.0,
+        })
+    return rows
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Value below which the given fraction of the sorted values fall."""
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+async def benchmark_server(
+        host: str,
+        port: int,
+        expressions: List[str],
+        clients: int,
+        window: int,
+        decimal_places: int = 4
+        ) -> dict:
+    """
+    Load-test a running calculator server.
+
+    Every client connection keeps up to window requests in flight and sends
+    the whole list of expressions.
+
+    Args:
+        host (str): server host
+        port (int): server port
+        expressions (list): expressions each client sends
+        clients (int): number of concurrent connections
+        window (int): pipelined requests in flight per connection
+        decimal_places (int): number of decimal places to request
+
+    Returns:
+        dict: request count, seconds, throughput and latency percentiles in milliseconds
+    """
+    from Calculator_server import CalculatorClient
+
+    latencies = []
+
+    async def run_client():
+        async with await CalculatorClient.connect(host, port) as client:
+            in_flight = asyncio.Semaphore(window)
+
+            async def request(expression):
+                async with in_flight:
+                    start = time.perf_counter()
+                    await client.calculate(expression, decimal_places)
+                    latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(request(expression) for expression in expressions))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client() for _ in range(clients)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'seconds': seconds,
+        'requests_per_second': len(latencies) / seconds,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def start_local_server(workers: int) -> subprocess.Popen:
+    """
+    Start Calculator_server.py on a free local port.
+
+    Returns:
+        subprocess.Popen: server process, with its port in the port attribute
+    """
+    server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Calculator_server.py')
+    process = subprocess.Popen(
+        [sys.executable, server_script, '--port', '0', '--workers', str(workers)],
+        stdout=subprocess.PIPE,
+        text=True
+        )
+    process.port = int(process.stdout.readline().rsplit(':', 1)[1])
+    return process
+
+
+def stop_local_server(process: subprocess.Popen, timeout: float = SERVER_STOP_TIMEOUT) -> None:
+    """Stop a server from start_local_server with SIGINT, so it shuts its workers down, killing it after timeout seconds."""
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    process.stdout.close()
+
+
+def print_rows(rows: List[dict]) -> None:
+    """Print benchmark rows as an aligned table."""
+    columns = list(rows[0])
+    print('  '.join(f'{column:>22}' for column in columns))
+    for row in rows:
+        print('  '.join(f'{row[column]:>22.3f}' if isinstance(row[column], float) else f'{row[column]:>22}'
+                        for column in columns))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run a benchmark from the command line.
+
+    Args:
+        argv (list): command line arguments, defaults to sys.argv
+
+    Returns:
+        int: process exit code
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the Calculator module')
+    benchmarks = parser.add_subparsers(dest='benchmark', required=True)
+
+    parallel = benchmarks.add_parser('parallel', help='batch scaling from 1 to N worker processes')
+    parallel.add_argument('--count', type=int, default=100000, help='number of expressions')
+    parallel.add_argument('--operands', type=int, default=8, help='numbers per expression')
+    parallel.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parallel.add_argument('--chunk-size', type=int, default=calc.BATCH_CHUNK_SIZE)
+
+    threads = benchmarks.add_parser('threads', help='batch scaling from 1 to N threads sharing one calculator')
+    threads.add_argument('--count', type=int, default=100000, help='number of expressions')
+    threads.add_argument('--operands', type=int, default=8, help='numbers per expression')
+    threads.add_argument('--max-threads', type=int, default=os.cpu_count() or 1)
+    threads.add_argument('--chunk-size', type=int, default=calc.BATCH_CHUNK_SIZE)
+    threads.add_argument('--cache-size', type=int, default=None, help='cache size of the shared calculator')
+
+    server = benchmarks.add_parser('server', help='latency and throughput of the calculator server')
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, help='server to test, a local one is started if omitted')
+    server.add_argument('--workers', type=int, default=0, help='worker processes of the local server')
+    server.add_argument('--clients', type=int, default=8, help='concurrent connections')
+    server.add_argument('--requests', type=int, default=2000, help='requests per connection')
+    server.add_argument('--window', type=int, default=32, help='pipelined requests per connection')
+    server.add_argument('--operands', type=int, default=8, help='numbers per expression')
+
+    stages = benchmarks.add_parser('stages', help='time of each pipeline stage by expression size')
+    stages.add_argument('--max-tokens', type=int, default=DEFAULT_MAX_TOKENS)
+    stages.add_argument('--shapes', nargs='+', choices=SHAPES, default=list(SHAPES))
+    stages.add_argument('--repeat', type=int, default=5, help='runs per measurement, the fastest is kept')
+    stages.add_argument('--budget', type=float, default=1.0,
+                        help='seconds per run before a stage is dropped for larger sizes')
+    stages.add_argument('--output', help='write the results to this JSON file')
+    stages.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    stages.add_argument('--threshold', type=float, default=1.5,
+                        help='fail when a stage is this many times slower than the baseline')
+
+    args = parser.parse_args(argv)
+    if args.benchmark == 'stages':
+        sizes = [10 ** power for power in range(1, 8) if 10 ** power <= args.max_tokens]
+        rows = benchmark_stages(sizes, args.shapes, args.repeat, args.budget)
+        report = {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': rows,
+            'exponents': scaling_exponents(rows),
+        }
+        print_rows(report['exponents'])
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as output_file:
+                json.dump(report, output_file, indent=2)
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)['results']
+            regressions = confirm_regressions(rows, baseline, args.threshold, args.repeat, args.budget)
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+            if regressions:
+                return 1
+    elif args.benchmark == 'parallel':
+        expressions = generate_batch(args.count, args.operands)
+        print_rows(benchmark_parallel(expressions, args.max_workers, args.chunk_size))
+    elif args.benchmark == 'threads':
+        expressions = generate_batch(args.count, args.operands)
+        print_rows(benchmark_threads(expressions, args.max_threads, args.chunk_size, cache_size=args.cache_size))
+    elif args.benchmark == 'server':
+        expressions = generate_batch(args.requests, args.operands)
+        process = start_local_server(args.workers) if args.port is None else None
+        try:
+            port = process.port if process else args.port
+            print_rows([asyncio.run(benchmark_server(args.host, port, expressions, args.clients, args.window))])
+        finally:
+            if process:
+                stop_local_server(process)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
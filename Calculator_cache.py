@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Calculator Cache Module
+
+This module keeps calculated results and compiled expressions in an SQLite file, so
+processes that restart or run side by side don't calculate the same expressions again.
+Features:
+- results keyed by the expression without spaces, decimal places and engine version,
+  compiled expressions keyed by the expression and engine version
+- compiled expressions stored as their constants and program, never as pickles
+- WAL journal for concurrent readers and writers in several processes, one connection
+  per process that threads share under a lock
+- new entries written in batches of WRITE_BATCH_SIZE, one transaction each, and
+  at close() or exit
+- size limit per table enforced by every write, from entry counts kept in the file, so
+  short-lived processes respect it too; the oldest stored entries are evicted first
+- errors of the database file and unreadable entries are treated as cache misses,
+  calculations never fail because of the cache
+
+Usage:
+    cache = PersistentCache('calculator-cache.sqlite3', max_entries=1000000)
+    calculator = Calculator(cache_size=10000, persistent_cache=cache)
+    calculator.calculate('2*(3+4)', 4)     # ('14', ''), also found by the next process
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import weakref
+from typing import Callable, Optional, Tuple
+
+import Calculator as calc
+
+#entries kept per table by default
+DEFAULT_MAX_ENTRIES = 1000000
+#seconds to wait for another process's write to finish
+DEFAULT_TIMEOUT = 30.0
+#new entries written to the file in one transaction
+WRITE_BATCH_SIZE = 256
+
+_TABLES = ('results', 'compiled')
+#an entry already stored by another process has the same value, so it is kept
+_INSERTS = {
+    'results': 'INSERT OR IGNORE INTO results (expression, decimal_places, version, output, error) '
+               'VALUES (?, ?, ?, ?, ?)',
+    'compiled': 'INSERT OR IGNORE INTO compiled (expression, version, program) VALUES (?, ?, ?)',
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    expression TEXT NOT NULL,
+    decimal_places INTEGER NOT NULL,
+    version TEXT NOT NULL,
+    output TEXT NOT NULL,
+    error TEXT NOT NULL,
+    UNIQUE (expression, decimal_places, version)
+);
+CREATE TABLE IF NOT EXISTS compiled (
+    expression TEXT NOT NULL,
+    version TEXT NOT NULL,
+    program TEXT NOT NULL,
+    UNIQUE (expression, version)
+);
+CREATE TABLE IF NOT EXISTS sizes (
+    name TEXT PRIMARY KEY,
+    entries INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO sizes VALUES ('results', (SELECT count(*) FROM results));
+INSERT OR IGNORE INTO sizes VALUES ('compiled', (SELECT count(*) FROM compiled));
+"""
+
+
+def engine_version() -> str:
+    """Version part of the cache keys, changing whenever results could change."""
+    #the integer limit decides which results are exact, so it is part of the version
+    return f'{calc.ENGINE_VERSION}.{calc.INTEGER_LIMIT_BITS}'
+
+
+def _program(text: str) -> tuple:
+    """
+    Read a stored compiled expression.
+
+    Returns:
+        tuple: constants, instructions, result, error key and error position
+
+    Raises:
+        ValueError, KeyError, TypeError: for text that is not a valid program
+    """
+    program = json.loads(text)
+    constants = tuple(program['constants'])
+    instructions = tuple(map(tuple, program['instructions']))
+    result, error = program['result'], program['error']
+    if any(constant.__class__ not in calc._NUMBER_CLASSES for constant in constants) \
+            or error.__class__ is not str or program['error_position'].__class__ is not int:
+        raise ValueError('invalid constants or error')
+    slots = len(constants)
+    for operator_char, left, right in instructions:
+        #every operation reads earlier slots only
+        if operator_char not in calc._OPERATIONS or left.__class__ is not int or right.__class__ is not int \
+                or not (0 <= left < slots and 0 <= right < slots):
+            raise ValueError('invalid instruction')
+        slots += 1
+    if result.__class__ is int and not 0 <= result < slots:
+        raise ValueError('invalid result slot')
+    return constants, instructions, result, error, program['error_position']
+
+
+def _flush_at_exit(reference: weakref.ref) -> None:
+    """Write the pending entries of a cache that still exists."""
+    cache = reference()
+    if cache is not None:
+        cache.flush()
+
+
+class PersistentCache:
+    """
+    SQLite file of (result, error) pairs and compiled expressions shared by processes.
+
+    Used by Calculator(cache_size=..., persistent_cache=...) behind its in-memory
+    caches. Instances can be passed to worker processes; each process opens its
+    own connection on first use, including after a fork. Entries stored by this
+    process are found at once, by other processes after the next flush().
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES, timeout: float = DEFAULT_TIMEOUT):
+        """
+        Args:
+            path (str): SQLite database file, created when missing
+            max_entries (int): entries kept in each of the result and compiled tables
+            timeout (float): seconds to wait for a write of another process
+        """
+        if max_entries < 1:
+            raise ValueError('max_entries must be at least 1')
+        self.path = path
+        self.max_entries = max_entries
+        self.timeout = timeout
+        #statistics of this process
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        #rows not written yet, by table and key columns
+        self._pending = {table: {} for table in _TABLES}
+        atexit.register(_flush_at_exit, weakref.ref(self))
+
+    def __getstate__(self) -> dict:
+        return {'path': self.path, 'max_entries': self.max_entries, 'timeout': self.timeout}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connection of this process, opened on first use."""
+        if self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            #a commit is durable once the WAL is checkpointed, enough for a cache
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _lookup(self, table: str, query: str, key: tuple, decode: Optional[Callable] = None) -> Optional[tuple]:
+        """
+        Pending row or first row of a query, None when there is none or the file can't be read.
+
+        A row that decode() rejects with ValueError, KeyError or TypeError is a miss too.
+        """
+        with self._lock:
+            row = self._pending[table].get(key)
+            if row is None:
+                try:
+                    row = self._connect().execute(query, key).fetchone()
+                except sqlite3.Error:
+                    row = None
+            if row is not None and decode is not None:
+                try:
+                    row = decode(row)
+                except (ValueError, KeyError, TypeError):
+                    row = None
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return row
+
+    def _store(self, table: str, key: tuple, row: tuple) -> None:
+        """Queue a row, writing the queue when it reaches WRITE_BATCH_SIZE rows."""
+        with self._lock:
+            pending = self._pending[table]
+            pending[key] = row
+            if len(pending) >= WRITE_BATCH_SIZE:
+                self._write()
+
+    def _write(self) -> None:
+        """Write the pending rows in one transaction and evict down to max_entries."""
+        if not any(self._pending.values()):
+            return
+        try:
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                for table, pending in self._pending.items():
+                    if pending:
+                        inserted = connection.executemany(
+                            _INSERTS[table], (key + row for key, row in pending.items())).rowcount
+                        self._evict(connection, table, inserted)
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            #a cache that can't be written only loses these entries
+            pass
+        for pending in self._pending.values():
+            pending.clear()
+
+    def flush(self) -> None:
+        """Write the pending entries so other processes find them."""
+        with self._lock:
+            self._write()
+
+    def _evict(self, connection: sqlite3.Connection, table: str, inserted: int) -> None:
+        """
+        Count the entries inserted into a table and delete its oldest entries over max_entries.
+
+        The count is kept in the file, so every process's write sees the entries
+        stored by all of them. Runs inside the write transaction.
+        """
+        connection.execute('UPDATE sizes SET entries = entries + ? WHERE name = ?', (inserted, table))
+        entries = connection.execute('SELECT entries FROM sizes WHERE name = ?', (table,)).fetchone()[0]
+        excess = entries - self.max_entries
+        if excess > 0:
+            #entries are never replaced, so rowid order is storage order
+            deleted = connection.execute(
+                f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} ORDER BY rowid LIMIT ?)',
+                (excess,)).rowcount
+            connection.execute('UPDATE sizes SET entries = entries - ? WHERE name = ?', (deleted, table))
+            self.evictions += deleted
+
+    def get_result(self, expression_key: str, decimal_places: int) -> Optional[Tuple[str, str]]:
+        """
+        Look up a stored result.
+
+        Args:
+            expression_key (str): expression without spaces
+            decimal_places (int): number of decimal places of the result
+
+        Returns:
+            Tuple of (formatted result or empty string, CalculatorError key or empty
+            string), or None when it is not stored
+        """
+        return self._lookup(
+            'results',
+            'SELECT output, error FROM results WHERE expression = ? AND decimal_places = ? AND version = ?',
+            (expression_key, decimal_places, engine_version()))
+
+    def put_result(self, expression_key: str, decimal_places: int, result: Tuple[str, str]) -> None:
+        """Store a (formatted result or empty string, error key) pair, as returned by get_result."""
+        self._store('results', (expression_key, decimal_places, engine_version()), tuple(result))
+
+    def get_compiled(
+            self,
+            expression_key: str,
+            calculator: calc.Calculator,
+            user_input: str
+            ) -> Optional[calc.CompiledExpression]:
+        """
+        Look up a stored compiled expression.
+
+        Args:
+            expression_key (str): expression without spaces
+            calculator (Calculator): calculator the compiled expression belongs to,
+                whose backend it uses
+            user_input (str): expression as typed, kept by the compiled expression
+
+        Returns:
+            CompiledExpression, or None when it is not stored
+        """
+        program = self._lookup(
+            'compiled',
+            'SELECT program FROM compiled WHERE expression = ? AND version = ?',
+            (expression_key, engine_version()),
+            lambda row: _program(row[0]))
+        if program is None:
+            return None
+        constants, instructions, result, error, error_position = program
+        return calc.CompiledExpression(
+            calculator,
+            user_input,
+            constants,
+            instructions,
+            result,
+            error,
+            error_position=error_position,
+            backend=calculator.backend,
+            )
+
+    def put_compiled(self, expression_key: str, compiled: calc.CompiledExpression) -> None:
+        """Store a compiled expression without variables."""
+        program = {
+            'constants': compiled._constants,
+            'instructions': compiled._instructions,
+            'result': compiled._result,
+            'error': compiled._error,
+            'error_position': compiled.error_position,
+        }
+        self._store('compiled', (expression_key, engine_version()), (json.dumps(program),))
+
+    def info(self) -> calc.CacheInfo:
+        """Return the statistics of this process and the entries stored by all of them, after a flush."""
+        with self._lock:
+            self._write()
+            try:
+                size = self._connect().execute('SELECT sum(entries) FROM sizes').fetchone()[0]
+            except sqlite3.Error:
+                size = 0
+            return calc.CacheInfo(self.hits, self.misses, self.evictions, self.max_entries, size)
+
+    def clear(self) -> None:
+        """Delete every entry, for all processes, and reset the statistics."""
+        with self._lock:
+            for pending in self._pending.values():
+                pending.clear()
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            for table in _TABLES:
+                connection.execute(f'DELETE FROM {table}')
+            connection.execute('UPDATE sizes SET entries = 0')
+            connection.execute('COMMIT')
+            self.hits = self.misses = self.evictions = 0
+
+    def close(self) -> None:
+        """Write the pending entries and close the connection of this process, a later use opens a new one."""
+        with self._lock:
+            self._write()
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+            self._pid = None
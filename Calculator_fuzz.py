@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Calculator Fuzz Module
+
+This module compares the calculation engines of the Calculator module on random expressions.
+Features:
+- generator of random expressions covering nesting, negative numbers merged by
+  merge_negatives, implicit products of groups, decimals, spaces inside numbers,
+  overflow, complex powers and invalid input of every error type
+- long flat and deeply nested expressions of STREAM_MIN_TOKENS tokens or more, with
+  integer operands around and above 2^53, covering the TokenStream stages
+- differential run of calculate() with each engine on the same corpus, reporting every
+  expression whose (result, error) tuples differ and the throughput of each engine
+
+Usage:
+    python Calculator_fuzz.py --count 100000 --seed 1
+    python Calculator_fuzz.py --engines reduction interpreter --decimals 2
+"""
+
+import argparse
+import random
+import time
+from collections import Counter, namedtuple
+from typing import Iterable, List, Optional
+
+import Calculator as calc
+
+#numbers of every form the tokenizer accepts
+NUMBERS = ('0', '1', '2', '3', '7', '10', '255', '0.5', '2.25', '3.0', '.5', '5.', '1 2', '. 5', '1 .5',
+           '99999999999999999', '123456789.123456789')
+#fragments that usually make an expression invalid or fail to calculate
+ERROR_FRAGMENTS = ('+', '*', '/', '^', '-', '.', '(', ')', '()', '..', ' ', 'a', '1/0', '9^999', '(-8)^0.5')
+#integer terms around and above 2^53, where float64 stops holding every integer
+LARGE_INTEGERS = ('9007199254740991', '9007199254740992', '9007199254740993', '2^53', '3^40', '2^62-1',
+                  '12345678901234567891', '-9007199254740993')
+
+#operands of the terms of long expressions, and the factors and divisors between them
+LONG_INTEGERS = ('1', '2', '3', '7', '10', '255', '1 2', '99999999999999999')
+LONG_NUMBERS = LONG_INTEGERS + ('0.5', '2.25', '.5', '5.', '123456789.123456789')
+SMALL_FACTORS = ('1', '2', '3', '1 0')
+
+_tokenizer = calc.Calculator()
+
+DifferentialResult = namedtuple('DifferentialResult', ['count', 'mismatches', 'throughput', 'errors'])
+
+
+def generate_expression(rng: random.Random, depth: int = 0, max_depth: int = 5) -> str:
+    """
+    Generate a random, usually valid, expression.
+
+    Args:
+        rng (random.Random): random number generator
+        depth (int): nesting depth of this sub-expression
+        max_depth (int): depth at which only numbers are generated
+
+    Returns:
+        str: expression text
+    """
+    choice = rng.random()
+    if depth >= max_depth or choice < 0.35:
+        return rng.choice(NUMBERS)
+    if choice < 0.5:
+        return '(' + generate_expression(rng, depth + 1, max_depth) + ')'
+    if choice < 0.6:
+        #merged into the number by merge_negatives, including after another operator
+        return '-' + rng.choice(NUMBERS)
+    if choice < 0.65:
+        #a group followed by a group or number is a product
+        return '(' + generate_expression(rng, depth + 1, max_depth) + ')(' + \
+            generate_expression(rng, depth + 1, max_depth) + ')'
+    return generate_expression(rng, depth + 1, max_depth) + rng.choice('+-*/^') + \
+        generate_expression(rng, depth + 1, max_depth)
+
+
+def generate_long_expression(rng: random.Random, min_tokens: int = calc.STREAM_MIN_TOKENS) -> str:
+    """
+    Generate a usually valid expression of at least min_tokens tokens.
+
+    Terms are joined into a flat sum, or, for about half of the expressions,
+    each term wraps everything before it in parentheses, nesting hundreds of
+    levels deep. Products and quotients use small factors, so most results
+    stay finite, and about half of the expressions use integers only, whose
+    results must stay exact above 2^53.
+
+    Args:
+        rng (random.Random): random number generator
+        min_tokens (int): least number of tokens
+
+    Returns:
+        str: expression text
+    """
+    nested = rng.random() < 0.5
+    integers = rng.random() < 0.5
+    operands = LONG_INTEGERS if integers else LONG_NUMBERS
+    expression = rng.choice(LARGE_INTEGERS)
+    while len(_tokenizer.tokenize(expression).tokens) < min_tokens:
+        for _ in range(64):
+            operator = rng.choice('+-+-*' if integers else '+-+-*/')
+            if operator in '*/':
+                term = rng.choice(SMALL_FACTORS)
+            elif rng.random() < 0.3:
+                term = rng.choice(LARGE_INTEGERS)
+            else:
+                term = rng.choice(operands) + rng.choice('+-*') + rng.choice(operands)
+            if not nested:
+                expression += operator + '(' + term + ')'
+            elif rng.random() < 0.5:
+                expression = '(' + expression + ')' + operator + '(' + term + ')'
+            else:
+                expression = '(' + term + ')' + operator + '(' + expression + ')'
+    return expression
+
+
+def mutate_expression(rng: random.Random, expression: str) -> str:
+    """
+    Insert, delete or replace one character or fragment of an expression.
+
+    Args:
+        rng (random.Random): random number generator
+        expression (str): expression to change
+
+    Returns:
+        str: changed expression, which may still be valid
+    """
+    position = rng.randint(0, len(expression))
+    choice = rng.random()
+    if choice < 0.4 or not expression:
+        return expression[:position] + rng.choice(ERROR_FRAGMENTS) + expression[position:]
+    if choice < 0.7:
+        return expression[:position] + expression[position + 1:]
+    return expression[:position] + rng.choice(ERROR_FRAGMENTS) + expression[position + 1:]
+
+
+def generate_corpus(count: int, seed: int = 0, error_rate: float = 0.2, long_rate: float = 0.002) -> List[str]:
+    """
+    Generate a reproducible corpus of expressions.
+
+    Args:
+        count (int): number of expressions
+        seed (int): random seed
+        error_rate (float): fraction of expressions mutated by mutate_expression
+        long_rate (float): fraction of expressions from generate_long_expression
+
+    Returns:
+        list: expressions
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        if rng.random() < long_rate:
+            expression = generate_long_expression(rng)
+        else:
+            expression = generate_expression(rng, max_depth=rng.randint(1, 6))
+        if rng.random() < error_rate:
+            expression = mutate_expression(rng, expression)
+        corpus.append(expression)
+    return corpus
+
+
+def differential(
+        expressions: Iterable[str],
+        engines: Iterable[str] = calc.ENGINES,
+        decimal_places: int = 4
+        ) -> DifferentialResult:
+    """
+    Calculate the same expressions with several engines and compare the results.
+
+    Args:
+        expressions (iterable): expressions to calculate
+        engines (iterable): names from Calculator.ENGINES, the first is the reference
+        decimal_places (int): number of decimal places to return
+
+    Returns:
+        DifferentialResult of the number of expressions, (expression, {engine: (result, error)})
+        for every expression whose results differ, expressions per second of each engine, and
+        a Counter of the reference engine's error messages ('' for results)
+    """
+    expressions = list(expressions)
+    engines = list(engines)
+    results = {}
+    throughput = {}
+    for engine in engines:
+        calculate = calc.Calculator(engine=engine).calculate
+        start = time.perf_counter()
+        results[engine] = [calculate(expression, decimal_places) for expression in expressions]
+        seconds = time.perf_counter() - start
+        throughput[engine] = len(expressions) / seconds if seconds else float('inf')
+
+    reference = results[engines[0]]
+    mismatches = []
+    for index, expression in enumerate(expressions):
+        expected = reference[index]
+        if any(results[engine][index] != expected for engine in engines[1:]):
+            mismatches.append((expression, {engine: results[engine][index] for engine in engines}))
+    errors = Counter(error for _, error in reference)
+    return DifferentialResult(len(expressions), mismatches, throughput, errors)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run a differential fuzzing session from the command line.
+
+    Args:
+        argv (list): command line arguments, defaults to sys.argv
+
+    Returns:
+        int: process exit code, 1 when any engines disagree
+    """
+    parser = argparse.ArgumentParser(description='Compare the Calculator engines on random expressions')
+    parser.add_argument('--count', type=int, default=100000, help='number of expressions')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.2, help='fraction of mutated expressions')
+    parser.add_argument('--long-rate', type=float, default=0.002,
+                        help='fraction of expressions of STREAM_MIN_TOKENS tokens or more')
+    parser.add_argument('--decimals', type=int, default=4, help='decimal places of the results')
+    parser.add_argument('--engines', nargs='+', choices=calc.ENGINES, default=list(calc.ENGINES),
+                        help='engines to compare, the first is the reference')
+    parser.add_argument('--show', type=int, default=10, help='mismatches to print')
+    args = parser.parse_args(argv)
+
+    result = differential(generate_corpus(args.count, args.seed, args.error_rate, args.long_rate), args.engines, args.decimals)
+    reference = result.throughput[args.engines[0]]
+    print(f"{'engine':>12}  {'expressions/s':>14}  {'speedup':>8}")
+    for engine, rate in result.throughput.items():
+        print(f'{engine:>12}  {rate:>14.0f}  {rate / reference:>8.2f}')
+    print(f'{result.count} expressions, outcomes of the {args.engines[0]} engine:')
+    for error, count in result.errors.most_common():
+        print(f"{count:>10}  {error or 'result'}")
+    for expression, outcomes in result.mismatches[:args.show]:
+        print(f'MISMATCH {expression!r}: {outcomes}')
+    print(f'{len(result.mismatches)} mismatches')
+    return 1 if result.mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
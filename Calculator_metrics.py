@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Calculator Metrics Module
+
+This module collects per-stage timings of Calculator.calculate for production monitoring.
+Features:
+- call counts, total time and latency histograms for each pipeline stage
+- counts of calculations by CalculatorError.ERROR_TYPES key
+- export as a dict or in the Prometheus text exposition format
+- listener callbacks to forward each stage to a tracer
+
+Stages:
+- tokenize: parsing, negative number merging and input validation (one fused pass)
+- parentheses: reduction of parenthetical groups
+- reduce: the exponent, multiply/divide and add/subtract passes
+- format: rounding and conversion of the result to text
+- cache: the whole cached lookup when the calculator has a result cache
+- calculate: the whole call, recorded once per calculation with its error key
+
+Usage:
+    metrics = CalculatorMetrics()
+    calculator = Calculator(metrics=metrics)
+    calculator.calculate('2*(3+4)', 2)
+    print(metrics.to_prometheus())
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+from Calculator import CalculatorError
+
+#upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+#listener(stage, start, seconds, error_key)
+Listener = Callable[[str, float, float, str], None]
+
+
+class _StageStats:
+    """Call count, total time and histogram bucket counts of one stage."""
+
+    __slots__ = ('count', 'total', 'buckets')
+
+    def __init__(self, bucket_count: int):
+        self.count = 0
+        self.total = 0.0
+        #one count per bucket plus the +Inf bucket, not cumulative
+        self.buckets = [0] * (bucket_count + 1)
+
+
+class CalculatorMetrics:
+    """
+    Thread-safe collector of Calculator.calculate stage timings and error counts.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, prefix: str = 'calculator'):
+        """
+        Args:
+            buckets (tuple): increasing histogram bucket upper bounds in seconds
+            prefix (str): name prefix of the exported Prometheus metrics
+        """
+        if list(buckets) != sorted(set(buckets)):
+            raise ValueError('buckets must be strictly increasing')
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.clock = time.perf_counter
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stages = {}
+        self._errors = dict.fromkeys(CalculatorError.ERROR_TYPES, 0)
+        self._calculations = 0
+
+    def add_listener(self, listener: Listener) -> None:
+        """
+        Call listener(stage, start, seconds, error_key) after every recorded stage.
+
+        start is a perf_counter() timestamp so tracers can rebuild spans. error_key
+        is only set for the 'calculate' stage of a calculation that failed.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Listener) -> None:
+        """Stop calling a listener added with add_listener."""
+        self._listeners.remove(listener)
+
+    def record(self, stage: str, start: float, error_key: str = '') -> float:
+        """
+        Record a stage that started at start.
+
+        Args:
+            stage (str): stage name
+            start (float): clock() value when the stage started
+            error_key (str): error key of the calculation, counted for the 'calculate' stage
+
+        Returns:
+            float: the current clock() value, the start of the next stage
+        """
+        now = self.clock()
+        seconds = now - start
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = _StageStats(len(self.buckets))
+            stats.count += 1
+            stats.total += seconds
+            stats.buckets[bisect_left(self.buckets, seconds)] += 1
+            if stage == 'calculate':
+                self._calculations += 1
+                if error_key:
+                    self._errors[error_key] = self._errors.get(error_key, 0) + 1
+        for listener in self._listeners:
+            listener(stage, start, seconds, error_key)
+        return now
+
+    def reset(self) -> None:
+        """Clear all recorded timings and counts, keeping the listeners."""
+        with self._lock:
+            self._stages.clear()
+            self._errors = dict.fromkeys(CalculatorError.ERROR_TYPES, 0)
+            self._calculations = 0
+
+    def as_dict(self) -> Dict[str, object]:
+        """
+        Export the metrics as plain data.
+
+        Returns:
+            dict: 'calculations' count, 'errors' count by error key and 'stages' with
+            'count', 'total_seconds' and cumulative 'buckets' [upper bound, count] per stage
+        """
+        with self._lock:
+            stages = {}
+            for stage, stats in self._stages.items():
+                stages[stage] = {
+                    'count': stats.count,
+                    'total_seconds': stats.total,
+                    'buckets': self._cumulative(stats.buckets),
+                }
+            return {
+                'calculations': self._calculations,
+                'errors': dict(self._errors),
+                'stages': stages,
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Export the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: stage latency histogram, calculation counter and error counter
+        """
+        snapshot = self.as_dict()
+        name = f'{self.prefix}_stage_seconds'
+        lines = [
+            f'# HELP {name} Time spent in each stage of Calculator.calculate.',
+            f'# TYPE {name} histogram',
+        ]
+        for stage, stats in snapshot['stages'].items():
+            for bound, count in stats['buckets']:
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {stats["total_seconds"]!r}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {stats["count"]}')
+
+        name = f'{self.prefix}_calculations_total'
+        lines.append(f'# HELP {name} Calculations performed.')
+        lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name} {snapshot["calculations"]}')
+
+        name = f'{self.prefix}_errors_total'
+        lines.append(f'# HELP {name} Calculations that returned an error, by error type.')
+        lines.append(f'# TYPE {name} counter')
+        for error_key, count in snapshot['errors'].items():
+            lines.append(f'{name}{{error="{error_key}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def _cumulative(self, counts: List[int]) -> List[List]:
+        """Turn per-bucket counts into Prometheus style cumulative [upper bound, count] pairs."""
+        total = 0
+        cumulative = []
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            total += count
+            cumulative.append([bound, total])
+        return cumulative
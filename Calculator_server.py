@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Calculator Server Module
+
+This module serves the Calculator over a TCP or Unix socket so several services can
+share one warm calculator process.
+Protocol:
+- newline-delimited JSON requests: {"id": any, "expr": str, "decimal_places": int}
+- one JSON response per request, in request order: {"id": any, "result": str, "error": str}
+- "id" is optional and echoed back, "decimal_places" defaults to 4
+
+Features:
+- pipelining: clients may send any number of requests without waiting for responses
+- batching: requests already queued on a connection are calculated in one executor call
+- backpressure: a connection stops being read while its bounded queue is full
+- calculations run on an executor so slow clients and long expressions don't stall the event loop
+
+Usage:
+    python Calculator_server.py --port 8765
+    python Calculator_server.py --unix /tmp/calculator.sock --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import signal
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
+
+import Calculator as calc
+
+DEFAULT_DECIMAL_PLACES = 4
+#requests queued per connection before the server stops reading from it
+DEFAULT_MAX_PENDING = 1024
+#requests calculated per executor call
+DEFAULT_BATCH_SIZE = 256
+#longest accepted request line in bytes
+MAX_LINE_LENGTH = 1 << 24
+
+#calculators of the current worker, by cache size
+_calculators = {}
+
+
+def _calculate_requests(
+        requests: List[Tuple[str, int]],
+        cache_size: Optional[int]
+        ) -> List[Tuple[str, str]]:
+    """
+    Calculate a batch of requests in an executor worker.
+
+    Args:
+        requests (list): (expression, decimal_places) pairs
+        cache_size (int): cache size of the worker's calculator
+
+    Returns:
+        list: (result, error_message) for each request
+    """
+    calculator = _calculators.get(cache_size)
+    if calculator is None:
+        calculator = _calculators[cache_size] = calc.Calculator(cache_size=cache_size)
+    calculate = calculator.calculate
+    return [calculate(expression, decimal_places) for expression, decimal_places in requests]
+
+
+def parse_request(line: bytes) -> Tuple[Any, Optional[Tuple[str, int]], str]:
+    """
+    Decode one request line.
+
+    Args:
+        line (bytes): JSON request without the trailing newline
+
+    Returns:
+        Tuple of (request id, (expression, decimal_places) or None, error message)
+    """
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return None, None, 'Invalid request: malformed JSON'
+    if not isinstance(request, dict):
+        return None, None, 'Invalid request: expected a JSON object'
+    request_id = request.get('id')
+    expression = request.get('expr')
+    decimal_places = request.get('decimal_places', DEFAULT_DECIMAL_PLACES)
+    if not isinstance(expression, str):
+        return request_id, None, 'Invalid request: "expr" must be a string'
+    if not isinstance(decimal_places, int) or isinstance(decimal_places, bool) or decimal_places < 0:
+        return request_id, None, 'Invalid request: "decimal_places" must be a non-negative integer'
+    return request_id, (expression, decimal_places), ''
+
+
+class CalculatorServer:
+    """
+    Asyncio server answering JSON-lines calculation requests.
+    """
+
+    def __init__(
+            self,
+            executor: Optional[Executor] = None,
+            cache_size: Optional[int] = None,
+            max_pending: int = DEFAULT_MAX_PENDING,
+            batch_size: int = DEFAULT_BATCH_SIZE
+            ):
+        """
+        Args:
+            executor (Executor): executor running the calculations, defaults to one worker thread
+            cache_size (int): result cache size of the calculator in each worker
+            max_pending (int): requests queued per connection before reading pauses
+            batch_size (int): largest number of requests calculated per executor call
+        """
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._server = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> Tuple[str, int]:
+        """
+        Start listening on a TCP socket.
+
+        Returns:
+            Tuple of the bound (host, port)
+        """
+        self._server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_LINE_LENGTH)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start_unix(self, path: str) -> str:
+        """
+        Start listening on a Unix socket.
+
+        Returns:
+            str: the socket path
+        """
+        self._server = await asyncio.start_unix_server(self._handle_connection, path, limit=MAX_LINE_LENGTH)
+        return path
+
+    async def serve_forever(self) -> None:
+        """Serve connections until cancelled."""
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """Stop accepting connections and wait for the listener to close."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Read requests into a bounded queue while a responder task answers them in order."""
+        queue = asyncio.Queue(maxsize=self.max_pending)
+        responder = asyncio.ensure_future(self._respond(queue, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    await queue.put((None, None, 'Invalid request: line too long'))
+                    break
+                if not line:
+                    break
+                line = line.strip()
+                if line:
+                    await queue.put(parse_request(line))
+        except ConnectionError:
+            pass
+        finally:
+            await queue.put(None)
+            await responder
+            writer.close()
+
+    async def _respond(self, queue: asyncio.Queue, writer: asyncio.StreamWriter) -> None:
+        """
+        Calculate queued requests in batches and write the responses in request order.
+
+        Once the client stops accepting responses the queue is still drained, so
+        the reading side never waits on a full queue.
+        """
+        loop = asyncio.get_running_loop()
+        connected = True
+        while True:
+            batch = [await queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            finished = batch[-1] is None
+            if finished:
+                batch.pop()
+
+            calculations = [request for _, request, _ in batch if request is not None]
+            results = deque()
+            if connected and calculations:
+                results.extend(await loop.run_in_executor(
+                    self.executor, _calculate_requests, calculations, self.cache_size))
+
+            lines = []
+            for request_id, request, error in (batch if connected else ()):
+                result = results.popleft() if request is not None else ('', error)
+                lines.append(json.dumps({'id': request_id, 'result': result[0], 'error': result[1]}))
+            if connected and lines:
+                try:
+                    writer.write(('\n'.join(lines) + '\n').encode())
+                    await writer.drain()
+                except ConnectionError:
+                    connected = False
+            if finished:
+                return
+
+
+class CalculatorClient:
+    """
+    Asyncio client for CalculatorServer supporting pipelined requests.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._waiting = deque()
+        self._next_id = 0
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, host: str = '127.0.0.1', port: int = 8765) -> 'CalculatorClient':
+        """Connect to a server on a TCP socket."""
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE_LENGTH)
+        return cls(reader, writer)
+
+    @classmethod
+    async def connect_unix(cls, path: str) -> 'CalculatorClient':
+        """Connect to a server on a Unix socket."""
+        reader, writer = await asyncio.open_unix_connection(path, limit=MAX_LINE_LENGTH)
+        return cls(reader, writer)
+
+    async def calculate(self, expression: str, decimal_places: int = DEFAULT_DECIMAL_PLACES) -> Tuple[str, str]:
+        """
+        Send one request and wait for its response.
+
+        Concurrent calls share the connection and are pipelined.
+
+        Returns:
+            Tuple of (result, error_message)
+        """
+        future = self._send(expression, decimal_places)
+        await self._writer.drain()
+        return await future
+
+    async def calculate_many(
+            self,
+            expressions: List[str],
+            decimal_places: int = DEFAULT_DECIMAL_PLACES
+            ) -> List[Tuple[str, str]]:
+        """
+        Pipeline a list of requests and wait for all responses.
+
+        Returns:
+            list: (result, error_message) for each expression, in order
+        """
+        futures = [self._send(expression, decimal_places) for expression in expressions]
+        await self._writer.drain()
+        return list(await asyncio.gather(*futures))
+
+    async def close(self) -> None:
+        """Close the connection once all responses have arrived."""
+        if self._waiting:
+            await asyncio.gather(*self._waiting, return_exceptions=True)
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._receiver.cancel()
+
+    async def __aenter__(self) -> 'CalculatorClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _send(self, expression: str, decimal_places: int) -> asyncio.Future:
+        """Write a request and return the future of its response."""
+        future = asyncio.get_running_loop().create_future()
+        request = {'id': self._next_id, 'expr': expression, 'decimal_places': decimal_places}
+        self._next_id += 1
+        self._waiting.append(future)
+        self._writer.write(json.dumps(request).encode() + b'\n')
+        return future
+
+    async def _receive(self) -> None:
+        """Resolve waiting requests as responses arrive, in order."""
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    raise ConnectionError('calculator server closed the connection')
+                response = json.loads(line)
+                future = self._waiting.popleft()
+                if not future.done():
+                    future.set_result((response['result'], response['error']))
+        except Exception as error:
+            while self._waiting:
+                future = self._waiting.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    """
+    Run the server described by the command line arguments.
+
+    SIGTERM and SIGINT stop serving; the worker processes are shut down
+    before returning, whichever way the server stops.
+    """
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers else None
+    try:
+        server = CalculatorServer(executor, args.cache_size, args.max_pending, args.batch_size)
+        if args.unix:
+            address = await server.start_unix(args.unix)
+        else:
+            address = '{}:{}'.format(*await server.start(args.host, args.port))
+        serving = asyncio.ensure_future(server.serve_forever())
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signal_number, serving.cancel)
+            except NotImplementedError:
+                #no signal handlers on Windows event loops, KeyboardInterrupt still stops main()
+                pass
+        print(f'Calculator server listening on {address}', flush=True)
+        try:
+            await serving
+        except asyncio.CancelledError:
+            if not serving.cancelled():
+                raise
+        await server.close()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Start the calculator server from the command line.
+
+    Args:
+        argv (list): command line arguments, defaults to sys.argv
+
+    Returns:
+        int: process exit code
+    """
+    parser = argparse.ArgumentParser(description='Serve the calculator over JSON lines')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='calculate in this many worker processes instead of one thread')
+    parser.add_argument('--cache-size', type=int, default=None, help='result cache size per worker')
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
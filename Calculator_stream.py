@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Calculator Stream Module
+
+This module calculates single expressions too large to hold as token lists, such as
+generated sums of millions of products stored in a file.
+Features:
+- reads a string, bytes, memory-mapped file, file object or iterable of chunks piece by piece
+- lazy tokenizer generator that merges negative numbers and validates as it goes
+- reduction with one small operator/operand stack per open parenthesis, so memory
+  grows with nesting depth instead of expression length
+- same results and error messages as Calculator.calculate
+
+Errors:
+The reduction passes of Calculator stop at the first failing operation, in the order
+they perform them: parenthetical groups by their closing ')', then '^', then '*' and
+'/', then '+' and '-', each left to right. Operations here run as soon as their
+operands are known, so a failure is recorded with that rank instead of raised, and
+the lowest ranked failure is reported once the whole input has been validated.
+
+Usage:
+    calculate_stream(open('huge.txt'), 4)
+    calculate_mapped_file('huge.txt', 4)
+"""
+
+import mmap
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+import Calculator as calc
+
+#characters read per chunk
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+#reduction pass of each operator, lower passes run first
+_PASS_LEVELS = {'^': 0, '*': 1, '/': 1, '+': 2, '-': 2}
+#value of an operation that failed, or depends on one that did
+_FAILED = object()
+#line breaks are only allowed at the end of the input, where files usually have one
+_LINE_BREAKS = frozenset('\r\n')
+
+_default_calculator = calc.Calculator()
+
+Source = Union[str, bytes, bytearray, memoryview, mmap.mmap, Iterable]
+
+
+def iter_chunks(source: Source, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Split an expression source into text chunks.
+
+    Bytes are decoded as Latin-1, which maps every byte to one character, so
+    memory-mapped files are read a chunk at a time. Any byte outside ASCII is
+    an unexpected character either way.
+
+    Args:
+        source: str, bytes-like object or mmap, file object opened in text or
+            binary mode, or an iterable of str/bytes chunks
+        chunk_size (int): characters or bytes per chunk
+
+    Returns:
+        Iterator of str chunks
+    """
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+    elif isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield str(view[start:start + chunk_size], 'latin-1')
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk if isinstance(chunk, str) else str(chunk, 'latin-1')
+    else:
+        for chunk in source:
+            yield chunk if isinstance(chunk, str) else str(chunk, 'latin-1')
+
+
+def iter_pieces(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Scan chunks into the pieces Calculator.tokenize scans, across chunk boundaries.
+
+    The last piece of a chunk may continue in the next one, as may a '.'
+    followed only by spaces, so they are held back and scanned again.
+
+    Args:
+        chunks (iterable): text chunks of one expression
+
+    Returns:
+        Iterator of pieces: numbers (which may contain spaces), runs of spaces,
+        or single characters
+    """
+    scan = calc._SCAN_PATTERN.findall
+    carry = ''
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pieces = scan(carry + chunk)
+        keep = 2 if len(pieces) > 1 and pieces[-1][0] == ' ' and pieces[-2] == '.' else 1
+        carry = ''.join(pieces[-keep:])
+        del pieces[-keep:]
+        yield from pieces
+    if carry:
+        yield from scan(carry)
+
+
+class _Group:
+    """Reduction state of the expression inside one pair of parentheses, or of the top level."""
+
+    __slots__ = ('values', 'operators', 'after_operand', 'empty', 'first', 'segments', 'error')
+
+    def __init__(self):
+        self.values = []
+        #(pass level, function, position) of operators waiting for their right operand
+        self.operators = []
+        self.after_operand = False
+        self.empty = True
+        #value of the first operand sequence, the value Calculator gives the group
+        self.first = _FAILED
+        #operand sequences directly next to each other, such as "(2)(3)"
+        self.segments = 0
+        #(pass level, position, error key) of the first failure in pass order
+        self.error = None
+
+    def fail(self, level: int, position: int, error_key: str) -> None:
+        """Record a failed operation, keeping the one the reduction passes reach first."""
+        if self.error is None or (level, position) < self.error[:2]:
+            self.error = (level, position, error_key)
+
+    def apply(self) -> None:
+        """Perform the last waiting operator on the last two values."""
+        level, function, position = self.operators.pop()
+        right = self.values.pop()
+        left = self.values.pop()
+        result = _FAILED
+        if left is _FAILED or right is _FAILED:
+            pass
+        elif left.__class__ not in calc._NUMBER_CLASSES or right.__class__ not in calc._NUMBER_CLASSES:
+            #float() in the reduction passes rejects a complex power, or a leading '.'
+            self.fail(level, position, 'CALCULATION_INCOMPLETE')
+        else:
+            try:
+                result = function(left, right)
+            except ZeroDivisionError:
+                self.fail(level, position, 'DIVISION_BY_ZERO')
+            except OverflowError:
+                self.fail(level, position, 'OVERFLOW')
+        self.values.append(result)
+
+    def operand(self, value) -> None:
+        """Add a number or the value of a closed group."""
+        if self.after_operand:
+            self.end_segment()
+        self.values.append(value)
+        self.after_operand = True
+        self.empty = False
+
+    def operator(self, symbol: str, position: int) -> None:
+        """Add an operator, performing waiting operators of the same or an earlier pass first."""
+        level = _PASS_LEVELS[symbol]
+        if not self.after_operand:
+            #an operator right after '(' has no number on its left
+            self.fail(level, position, 'CALCULATION_INCOMPLETE')
+            self.values.append(_FAILED)
+        operators = self.operators
+        while operators and operators[-1][0] <= level:
+            self.apply()
+        operators.append((level, calc._EXACT_OPERATIONS[symbol], position))
+        self.after_operand = False
+        self.empty = False
+
+    def end_segment(self) -> None:
+        """Finish the current operand sequence."""
+        if not self.after_operand and self.operators:
+            #an operator right before ')' has no number on its right
+            level, _, position = self.operators[-1]
+            self.fail(level, position, 'CALCULATION_INCOMPLETE')
+            self.values.append(_FAILED)
+        while self.operators:
+            self.apply()
+        value = self.values.pop()
+        self.segments += 1
+        if self.segments == 1:
+            self.first = value
+        self.after_operand = False
+
+
+class _StreamCalculation:
+    """Tokenizer, validation and reduction state of one streamed expression."""
+
+    def __init__(self, calculator: calc.Calculator):
+        self.calculator = calculator
+        self.position = 0
+        self.unexpected = False
+        self.line_break = False
+        #the last token may still be merged with a following number
+        self.last = None
+        self.before_last = None
+        self.first = None
+        self.token_count = 0
+        self.pair_error = ''
+        self.open_count = self.close_count = 0
+        #reduction
+        self.groups = [_Group()]
+        self.evaluating = True
+        self.calculation_error = ''
+
+    def feed(self, text: str) -> None:
+        """Process one scanned piece, see Calculator._tokenize_pieces."""
+        first_char = text[0]
+        position = self.position
+        self.position += len(text)
+        if first_char == ' ':
+            return
+        if self.line_break or (first_char in _LINE_BREAKS and self.token_count):
+            #a line break followed by anything but more line breaks is unexpected
+            if first_char in _LINE_BREAKS:
+                self.line_break = True
+                return
+            self.unexpected = True
+            return
+        if first_char in calc._SYMBOLS:
+            item = first_char
+            if item == '(':
+                self.open_count += 1
+            elif item == ')':
+                self.close_count += 1
+        elif first_char in calc._DIGITS or (first_char == '.' and len(text) > 1):
+            item = calc._number(text.replace(' ', '') if ' ' in text else text)
+        elif first_char == '.':
+            item = first_char
+        else:
+            self.unexpected = True
+            return
+
+        last = self.last
+        if last is not None:
+            #merge "-" with the number after it when it follows an operator or starts the expression
+            if last == '-' and item.__class__ in calc._NUMBER_CLASSES \
+                and (self.before_last is None or self.before_last in self.calculator.ALL_OPERATOR_SET):
+                self.last = -item
+                return
+            self.finish_token(last, position)
+        self.last = item
+        self.token_count += 1
+
+    def finish_token(self, item, position: int) -> None:
+        """Validate a token that can no longer change and pass it to the reduction."""
+        if self.before_last is None:
+            self.first = item
+        elif not self.pair_error:
+            self.pair_error = self.calculator._pair_error(self.before_last, item)
+        self.before_last = item
+        if self.evaluating and not self.pair_error:
+            self.reduce(item, position)
+
+    def reduce(self, item, position: int) -> None:
+        """Add a validated token to the reduction."""
+        groups = self.groups
+        if item.__class__ in calc._NUMBER_CLASSES or item == '.':
+            #a '.' can only get here as the first token
+            groups[-1].operand(item)
+        elif item == '(':
+            groups.append(_Group())
+        elif item == ')':
+            while True:
+                if len(groups) == 1:
+                    #a ')' without '(' ends the reduction, unless a group failed first
+                    self.calculation_error = 'IMPROPER_PARENTHESIS'
+                    self.evaluating = False
+                    return
+                group = groups.pop()
+                #an empty group becomes a ')' closing the group around it
+                if not group.empty:
+                    break
+            group.end_segment()
+            if group.error is not None:
+                #groups fail in the order they close, later failures are never reached
+                self.calculation_error = group.error[2]
+                self.evaluating = False
+                return
+            groups[-1].operand(group.first)
+        else:
+            groups[-1].operator(item, position)
+
+    def result(self, decimal_places: int) -> Tuple[str, str]:
+        """Finish the input and return (result, error key)."""
+        if self.last is not None:
+            self.finish_token(self.last, self.position)
+
+        #report errors in the order validate_input checks them
+        if self.unexpected:
+            return '', 'UNEXPECTED_CHARACTERS'
+        if not self.token_count:
+            return '', 'EMPTY_EXPRESSION'
+        if self.pair_error:
+            return '', self.pair_error
+        if self.open_count != self.close_count:
+            return '', 'UNEQUAL_PARENTHESIS'
+        operator_set = self.calculator.OPERATOR_SET
+        if self.first in operator_set or self.last in operator_set:
+            return '', 'INVALID_OPERATOR_PLACEMENT'
+        if self.calculation_error:
+            return '', self.calculation_error
+
+        group = self.groups[0]
+        group.end_segment()
+        if group.error is not None:
+            return '', group.error[2]
+        if group.segments != 1:
+            return '', 'CALCULATION_INCOMPLETE'
+        return self.calculator.output_clean_convert([group.first], decimal_places), ''
+
+
+def calculate_stream(
+        source: Source,
+        decimal_places: int,
+        calculator: Optional[calc.Calculator] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+        ) -> Tuple[str, str]:
+    """
+    Calculate one expression read in chunks.
+
+    Line breaks at the very end of the input are ignored; anywhere else they
+    are unexpected characters, as in Calculator.calculate.
+
+    Args:
+        source: expression source, see iter_chunks
+        decimal_places (int): number of decimal places to return
+        calculator (Calculator): calculator whose output formatting is used
+        chunk_size (int): characters or bytes read at a time
+
+    Returns:
+        Tuple of (result, error_message); the result is empty on errors instead
+        of repeating the input
+    """
+    calculation = _StreamCalculation(calculator or _default_calculator)
+    feed = calculation.feed
+    for piece in iter_pieces(iter_chunks(source, chunk_size)):
+        feed(piece)
+        if calculation.unexpected:
+            #outranks every other error, the rest need not be read
+            break
+    result, error_key = calculation.result(decimal_places)
+    if error_key:
+        return result, calc.CalculatorError.get_error_message(error_key)
+    return result, ''
+
+
+def calculate_mapped_file(
+        path: str,
+        decimal_places: int,
+        calculator: Optional[calc.Calculator] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+        ) -> Tuple[str, str]:
+    """
+    Calculate the expression in a file through a read-only memory map.
+
+    Args:
+        path (str): file holding one expression
+        decimal_places (int): number of decimal places to return
+        calculator (Calculator): calculator whose output formatting is used
+        chunk_size (int): bytes decoded at a time
+
+    Returns:
+        Tuple of (result, error_message), see calculate_stream
+    """
+    with open(path, 'rb') as expression_file:
+        #an empty file can't be mapped
+        if not expression_file.seek(0, 2):
+            return calculate_stream('', decimal_places, calculator, chunk_size)
+        with mmap.mmap(expression_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return calculate_stream(mapped, decimal_places, calculator, chunk_size)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Calculator Workbook Module
+
+This module uses the Calculator as the formula engine of a grid of named cells, such as
+a1 = b2*3 + c4.
+Features:
+- formulas are compiled once with their cell references as variables
+- dependency graph between cells, with circular references rejected when a cell is set
+- changing a cell recalculates only the cells downstream of it, in topological order,
+  and stops at cells whose value did not change
+- errors propagate to the cells that reference a failed or undefined cell
+
+Usage:
+    workbook = Workbook()
+    workbook.set('b2', '2')
+    workbook.set('c4', '1.5')
+    workbook.set('a1', 'b2*3 + c4')
+    workbook.get('a1', 2)           # ('7.5', '')
+    workbook.set('b2', '4')         # ['b2', 'a1'] recalculated
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import Calculator as calc
+
+
+class CircularReferenceError(ValueError):
+    """Raised when a formula would make a cell depend on itself."""
+
+
+def _changed(old: tuple, new: tuple) -> bool:
+    """Whether a (value, error key) pair changed, telling 1 from 1.0 apart."""
+    return old != new or old[0].__class__ is not new[0].__class__
+
+
+class _Cell:
+    """Formula, compiled form and current value of one cell."""
+
+    __slots__ = ('formula', 'compiled', 'references', 'value', 'error_key')
+
+    def __init__(self, formula: str, compiled: Optional[calc.CompiledExpression], references: frozenset):
+        self.formula = formula
+        self.compiled = compiled
+        self.references = references
+        self.value = None
+        self.error_key = ''
+
+
+class Workbook:
+    """
+    Named cells holding formulas over other cells, recalculated incrementally.
+
+    Cell names are identifiers such as 'a1' or 'rate'. A formula may reference
+    cells that are not set yet; it gets the UNDEFINED_REFERENCE error until
+    they are. Referenced values are bound as floats, like compiled variables.
+    """
+
+    def __init__(self, calculator: Optional[calc.Calculator] = None):
+        """
+        Args:
+            calculator (Calculator): calculator compiling the formulas and formatting results
+        """
+        self.calculator = calculator or calc.Calculator()
+        self._cells = {}
+        #cells referencing each name, including names that are not set
+        self._dependents = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._cells
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._cells)
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def formula(self, name: str) -> str:
+        """Return the formula of a cell."""
+        return self._cells[name].formula
+
+    def references(self, name: str) -> frozenset:
+        """Return the names a cell's formula references."""
+        return self._cells[name].references
+
+    def dependents(self, name: str) -> frozenset:
+        """Return the names of the cells whose formulas reference a name."""
+        return frozenset(self._dependents.get(name, ()))
+
+    def set(self, name: str, formula: Union[str, int, float]) -> List[str]:
+        """
+        Set the formula of a cell and recalculate it and everything downstream of it.
+
+        Args:
+            name (str): cell name, an identifier
+            formula (str or number): expression over other cells, or a number
+
+        Returns:
+            list: names of the recalculated cells, in recalculation order
+
+        Raises:
+            ValueError: for an invalid cell name
+            CircularReferenceError: when the formula references the cell itself,
+                directly or through other cells; the workbook is left unchanged
+        """
+        calc._variable_names((name,))
+        if isinstance(formula, str):
+            references = frozenset(calc._IDENTIFIER_PATTERN.findall(formula))
+            if name in references or self._reaches(references, name):
+                raise CircularReferenceError(f'circular reference to {name!r} in {formula!r}')
+            cell = _Cell(formula, self.calculator.compile(formula, references), references)
+        else:
+            cell = _Cell(repr(formula), None, frozenset())
+            cell.value = formula
+
+        old = self.value(name)
+        old_cell = self._cells.get(name)
+        if old_cell is not None:
+            self._unlink(name, old_cell.references)
+        for reference in cell.references:
+            self._dependents.setdefault(reference, set()).add(name)
+        self._cells[name] = cell
+        return self._recalculate(name, old)
+
+    def remove(self, name: str) -> List[str]:
+        """
+        Remove a cell; cells referencing it get the UNDEFINED_REFERENCE error.
+
+        Returns:
+            list: names of the recalculated cells, in recalculation order
+        """
+        old = self.value(name)
+        cell = self._cells.pop(name)
+        self._unlink(name, cell.references)
+        return self._recalculate(name, old)
+
+    def value(self, name: str) -> Tuple[Union[int, float, complex, str, None], str]:
+        """
+        Return the unformatted value of a cell.
+
+        Returns:
+            Tuple of (value, CalculatorError key or empty string)
+        """
+        cell = self._cells.get(name)
+        if cell is None:
+            return None, 'UNDEFINED_REFERENCE'
+        return cell.value, cell.error_key
+
+    def get(self, name: str, decimal_places: int) -> Tuple[str, str]:
+        """
+        Return the value of a cell formatted like Calculator.calculate.
+
+        Returns:
+            Tuple of (result, error_message); the result is the formula on errors
+        """
+        value, error_key = self.value(name)
+        if error_key:
+            formula = self._cells[name].formula if name in self._cells else ''
+            return formula, calc.CalculatorError.get_error_message(error_key)
+        return self.calculator.output_clean_convert([value], decimal_places), ''
+
+    def values(self, decimal_places: int) -> Dict[str, Tuple[str, str]]:
+        """Return get() of every cell."""
+        return {name: self.get(name, decimal_places) for name in self._cells}
+
+    def _unlink(self, name: str, references: frozenset) -> None:
+        """Remove the dependency edges of a cell's old formula."""
+        for reference in references:
+            dependents = self._dependents[reference]
+            dependents.discard(name)
+            if not dependents:
+                del self._dependents[reference]
+
+    def _reaches(self, names: frozenset, target: str) -> bool:
+        """Whether target is referenced, directly or indirectly, by any of the named cells."""
+        seen = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name == target:
+                return True
+            if name in seen:
+                continue
+            seen.add(name)
+            cell = self._cells.get(name)
+            if cell is not None:
+                stack.extend(cell.references)
+        return False
+
+    def _downstream(self, name: str) -> List[str]:
+        """Cells depending on a name, directly or indirectly, in topological order."""
+        #depth-first postorder over dependents, reversed, puts every cell after its inputs
+        order = []
+        visited = set()
+        stack = [(name, iter(self._dependents.get(name, ())))]
+        while stack:
+            current, children = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(self._dependents.get(child, ()))))
+                    break
+            else:
+                stack.pop()
+                if current != name:
+                    order.append(current)
+        order.reverse()
+        return order
+
+    def _recalculate(self, name: str, old: tuple) -> List[str]:
+        """Recalculate a changed cell and the cells downstream of it whose inputs changed."""
+        recalculated = []
+        if name in self._cells:
+            self._evaluate(self._cells[name])
+            recalculated.append(name)
+        if not _changed(old, self.value(name)):
+            return recalculated
+        changed = {name}
+        for dependent in self._downstream(name):
+            cell = self._cells[dependent]
+            if changed.isdisjoint(cell.references):
+                continue
+            old = (cell.value, cell.error_key)
+            self._evaluate(cell)
+            recalculated.append(dependent)
+            if _changed(old, (cell.value, cell.error_key)):
+                changed.add(dependent)
+        return recalculated
+
+    def _evaluate(self, cell: _Cell) -> None:
+        """Calculate a cell from the current values of the cells it references."""
+        if cell.compiled is None:
+            return
+        values = {}
+        error_key = ''
+        for reference in cell.compiled.variables:
+            value, reference_error = self.value(reference)
+            if reference_error:
+                error_key = reference_error
+                break
+            if value.__class__ not in calc._NUMBER_CLASSES:
+                #a complex value or lone '.' is rejected where it is used, as in calculate()
+                error_key = 'CALCULATION_INCOMPLETE'
+                break
+            values[reference] = value
+        if not error_key:
+            try:
+                cell.value, error_key = cell.compiled.compute(**values)
+            except OverflowError:
+                #an exact integer too large to bind as a float
+                error_key = 'OVERFLOW'
+        if error_key:
+            cell.value = None
+        cell.error_key = error_key
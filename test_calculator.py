@@ -1,5 +1,18 @@
+import io
+import json
+import os
+import random
+import re
+import struct
+import subprocess
+import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 import pytest
-from Calculator import Calculator
+from Calculator import (Calculator, CalculatorError, CancellationToken, IncrementalTokenizer, ResourceLimitError,
+                        ResourceLimits, STREAM_MIN_TOKENS, TokenStream)
+from Calculator import main as calculator_main
+from Calculator_metrics import CalculatorMetrics
 
 # Initialize calculator instance for testing
 calculator = Calculator()
@@ -129,3 +142,578 @@ def test_float_display() -> None:
     for expression, decimal, expected in floating_point_test:
         result = calculator.calculate(expression, decimal)
         assert result == expected, f"Failed floating point test: {expression}, {decimal}"
+
+def test_compiled_expression() -> None:
+    """
+    Test that compiled expressions match calculate() for results,
+    errors and behaviour of the list-reduction passes
+    """
+    expressions = [
+        "3+5", "21/5", "2^3^2", "2+3*4", "(2+3)*4", "-2^3", "(-2)^3",
+        "-3*-2", "2*(3+(4-1)*2)", "((2+3)*4)^2", "10/3", "3.141592",
+        "", "3/0", "2++3", "(2+3", "2+5abc3", "--2--3", ")2+3(",
+        "8..3+5", "8(3+5)", "8...3+5", "9^999999", "(2(3))", "(2)-3",
+        "()", "(1+())", "(-8)^0.5", "(-8)^0.5*2", "1/0+9^999999", ".",
+    ]
+
+    for expression in expressions:
+        compiled = calculator.compile(expression)
+        for decimal in (0, 2, 4):
+            expected = calculator.calculate(expression, decimal)
+            assert compiled.evaluate(decimal) == expected, f"Failed compile test: {expression}, {decimal}"
+
+def test_compiled_expression_long_input() -> None:
+    """
+    Test compiled evaluation of long and deeply nested expressions
+    """
+    long_expression = '+'.join(['2*3^2'] * 5000)
+    assert calculator.compile(long_expression).evaluate(4) == ('90000', '')
+
+    nested_expression = '(' * 500 + '1+1' + ')' * 500
+    assert calculator.compile(nested_expression).evaluate(4) == ('2', '')
+
+def test_calculate_many() -> None:
+    """
+    Test lazy batch calculation over an iterable
+    """
+    expressions = ["3+5", "10/3", "3/0", "", "2++3"]
+    results = calculator.calculate_many(iter(expressions), 4)
+
+    assert not isinstance(results, list)
+    assert list(results) == [calculator.calculate(expression, 4) for expression in expressions]
+
+def test_calculate_file(tmp_path) -> None:
+    """
+    Test batch calculation of a file with one expression per line
+    """
+    expression_file = tmp_path / 'expressions.txt'
+    expression_file.write_text('3+5\n10/3\r\n\n(2+3\n2^3')
+
+    results = list(calculator.calculate_file(str(expression_file), 2, buffer_size=4))
+    assert results == [
+        ('8', ''),
+        ('3.33', ''),
+        ('', 'Invalid: No expression'),
+        ('(2+3', 'Invalid: Unbalanced parentheses'),
+        ('8', ''),
+    ]
+
+def test_compiled_variables() -> None:
+    """
+    Test compiled expressions with named variables against
+    calculate() on the substituted expression
+    """
+    compiled = calculator.compile("x*2^y - 3", ["x", "y"])
+    assert compiled.variables == ('x', 'y')
+
+    for x, y in ((1.5, 3), (-2, 2), (0, 0.5), (7, -1)):
+        expression = f"{x}*2^{y} - 3"
+        assert compiled.evaluate(4, x=x, y=y) == calculator.calculate(expression, 4)
+
+    assert calculator.compile("-x^2", ["x"]).evaluate(4, x=3) == ('9', '')
+    assert calculator.compile("x/y", ["x", "y"]).evaluate(4, x=1, y=0) == ('x/y', 'Error: Division by zero')
+    assert calculator.compile("2x", ["x"]).evaluate(4, x=1) == ('2x', 'Invalid: Consecutive numbers')
+    assert calculator.compile("x+z", ["x"]).evaluate(4, x=1) == ('x+z', 'Invalid: Unexpected characters')
+    with pytest.raises(TypeError):
+        compiled.compute(x=1)
+
+def test_compiled_variables_array() -> None:
+    """
+    Test element-wise evaluation over NumPy arrays with per element error codes
+    """
+    numpy = pytest.importorskip('numpy')
+    compiled = calculator.compile("1/x + x^y", ["x", "y"])
+    x = numpy.array([0.0, 2.0, -8.0, 10.0, 4.0])
+    y = numpy.array([1.0, 2.0, 0.5, 400.0, 0.5])
+
+    values, errors = compiled.evaluate_array(x=x, y=y)
+    assert errors.dtype == numpy.uint8
+    assert list(errors) == [
+        CalculatorError.get_error_code('DIVISION_BY_ZERO'),
+        0,
+        CalculatorError.get_error_code('CALCULATION_INCOMPLETE'),
+        CalculatorError.get_error_code('OVERFLOW'),
+        0,
+    ]
+    assert values[1] == 4.5 and values[4] == 2.25
+    assert numpy.isnan(values[[0, 2, 3]]).all()
+
+    values, errors = calculator.compile("(x", ["x"]).evaluate_array(x=x)
+    assert (errors == CalculatorError.get_error_code('UNEQUAL_PARENTHESIS')).all()
+
+def test_calculation_cache() -> None:
+    """
+    Test the optional LRU cache of compiled expressions and results
+    """
+    cached_calculator = Calculator(cache_size=2)
+    assert calculator.cache_info() == {}
+
+    assert cached_calculator.calculate("2 + 3", 4) == ('5', '')
+    assert cached_calculator.calculate("2+3", 4) == ('5', '')
+    assert cached_calculator.calculate("2+3", 2) == ('5', '')
+    info = cached_calculator.cache_info()
+    assert info['results'].hits == 1 and info['results'].misses == 2
+    assert info['compiled'].hits == 1 and info['compiled'].misses == 1
+
+    #errors echo the caller's input even when the cached entry came from another spacing
+    assert cached_calculator.calculate("3/0", 4) == ('3/0', 'Error: Division by zero')
+    assert cached_calculator.calculate("3 / 0", 4) == ('3 / 0', 'Error: Division by zero')
+    assert cached_calculator.calculate("3\t/0", 4) == ('3\t/0', 'Invalid: Unexpected characters')
+
+    info = cached_calculator.cache_info()
+    assert info['results'].evictions == 2 and info['results'].currsize == 2
+    assert info['compiled'].evictions == 1 and info['compiled'].currsize == 2
+
+    cached_calculator.cache_clear()
+    assert cached_calculator.cache_info()['results'] == (0, 0, 0, 2, 0)
+
+def test_tokenize_matches_parse_and_validate() -> None:
+    """
+    Test that the single-pass tokenizer agrees with parse_input,
+    merge_negatives and validate_input on random input
+    """
+    rng = random.Random(2024)
+    alphabet = list('0123456789') * 2 + list('+-*/^().  ') + ['\t', 'x', ',']
+
+    for _ in range(3000):
+        expression = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        output_list = calculator.merge_negatives(calculator.parse_input(expression))
+        error_out = calculator.validate_input(output_list, expression)
+        result = calculator.tokenize(expression)
+        if error_out:
+            assert CalculatorError.get_error_message(result.error_key) == error_out, expression
+        else:
+            assert (result.tokens, result.error_key) == (output_list, ''), expression
+
+def test_tokenize_error_positions() -> None:
+    """
+    Test the character offset reported for the first input error
+    """
+    position_tests = [
+        ("2+5abc3", 'UNEXPECTED_CHARACTERS', 3),
+        ("2 * (3 ++ 4)", 'CONSECUTIVE_OPERATORS', 8),
+        ("8...3+5", 'DECIMAL_ERROR', 2),
+        ("8..3+5", 'CONSECUTIVE_NUMBERS', 2),
+        ("(2+(3", 'UNEQUAL_PARENTHESIS', 0),
+        ("2+3)", 'UNEQUAL_PARENTHESIS', 3),
+        ("2+3 *", 'INVALID_OPERATOR_PLACEMENT', 4),
+        ("   ", 'EMPTY_EXPRESSION', 0),
+        ("1 2 . 5 - -3", '', -1),
+    ]
+
+    for expression, error_key, position in position_tests:
+        result = calculator.tokenize(expression)
+        assert (result.error_key, result.error_position) == (error_key, position), expression
+
+    assert calculator.tokenize("1 2 . 5 - -3").tokens == [12.5, '-', -3.0]
+    assert calculator.compile(")2+3(").error_position == 0
+
+def test_calculate_many_parallel() -> None:
+    """
+    Test that parallel batch calculation keeps input order and per item errors
+    """
+    expressions = ["3+5", "10/3", "3/0", "", "2++3", "(2+3", "2^3^2"] * 5
+    expected = [calculator.calculate(expression, 3) for expression in expressions]
+
+    assert list(calculator.calculate_many(expressions, 3, workers=2, chunk_size=4)) == expected
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = calculator.calculate_many(iter(expressions), 3, chunk_size=3, executor=executor)
+        assert list(results) == expected
+
+def test_calculation_metrics() -> None:
+    """
+    Test stage counts, error counts and listener events of an instrumented calculator
+    """
+    expressions = ["3+5", "2*(3+4)", "3/0", "", "2++3", "(2+3", ")2+3(", "(-8)^0.5+1", "9^999999"]
+    events = []
+    metrics = CalculatorMetrics()
+    metrics.add_listener(lambda stage, start, seconds, error_key: events.append((stage, error_key)))
+    measured = Calculator(metrics=metrics)
+
+    for expression in expressions:
+        assert measured.calculate(expression, 2) == calculator.calculate(expression, 2), expression
+
+    snapshot = metrics.as_dict()
+    counts = {stage: stats['count'] for stage, stats in snapshot['stages'].items()}
+    assert counts == {'tokenize': 9, 'parentheses': 6, 'reduce': 5, 'format': 2, 'calculate': 9}
+    assert snapshot['calculations'] == 9
+    assert {key: count for key, count in snapshot['errors'].items() if count} == {
+        'DIVISION_BY_ZERO': 1, 'EMPTY_EXPRESSION': 1, 'CONSECUTIVE_OPERATORS': 1,
+        'UNEQUAL_PARENTHESIS': 1, 'IMPROPER_PARENTHESIS': 1, 'CALCULATION_INCOMPLETE': 1, 'OVERFLOW': 1}
+    assert snapshot['stages']['calculate']['buckets'][-1] == ['+Inf', 9]
+    assert events[:5] == [('tokenize', ''), ('parentheses', ''), ('reduce', ''), ('format', ''), ('calculate', '')]
+    assert ('calculate', 'DIVISION_BY_ZERO') in events
+
+    exported = metrics.to_prometheus()
+    assert 'calculator_stage_seconds_count{stage="tokenize"} 9' in exported
+    assert 'calculator_errors_total{error="OVERFLOW"} 1' in exported
+    assert 'calculator_calculations_total 9' in exported
+
+    cached = Calculator(cache_size=4, metrics=CalculatorMetrics())
+    assert [cached.calculate(expression, 2) for expression in expressions * 2] == \
+        [calculator.calculate(expression, 2) for expression in expressions * 2]
+    assert cached.metrics.as_dict()['stages']['cache']['count'] == 18
+
+    metrics.reset()
+    assert metrics.as_dict()['calculations'] == 0
+
+def test_deep_parentheses() -> None:
+    """
+    Test deeply nested groups and the parenthesis errors of nested input
+    """
+    depth = 20000
+    assert calculator.calculate("(" * depth + "1" + "+1)" * depth, 2) == (str(depth + 1), '')
+
+    parenthesis_tests = [
+        ("((2+3)*(4-1))^2", '225'),
+        ("(((())))+1", 'Invalid: Improperly paired parenthesis'),
+        ("(2(3))", '2'),
+        ("((2)))+((3)", 'Invalid: Improperly paired parenthesis'),
+        ("((2+3)", 'Invalid: Unbalanced parentheses'),
+        ("(1/0)+())(", 'Error: Division by zero'),
+    ]
+    for expression, expected in parenthesis_tests:
+        result, error = calculator.calculate(expression, 2)
+        assert (error or result) == expected, expression
+
+def test_incremental_tokenizer() -> None:
+    """
+    Test that random edits re-tokenize like tokenize() of the whole new text
+    """
+    rng = random.Random(11)
+    characters = list('0123456789+-*/^().  x') + ['\t', 'a']
+    for interval in (1, 3, 64):
+        tokenizer = IncrementalTokenizer(calculator, ['x'], interval=interval)
+        text = ''
+        for _ in range(400):
+            position = rng.randint(0, len(text))
+            if rng.random() < 0.6:
+                text = text[:position] + ''.join(rng.choices(characters, k=rng.randint(1, 3))) + text[position:]
+            else:
+                text = text[:position] + text[position + rng.randint(1, 3):]
+            result = tokenizer.update(text)
+            expected = calculator.tokenize(text, ['x'])
+            assert result[1:] == expected[1:], text
+            assert [getattr(token, 'name', token) for token in result.tokens] == \
+                [getattr(token, 'name', token) for token in expected.tokens], text
+
+    tokenizer = IncrementalTokenizer(calculator)
+    text = '1+2*3-' * 1000 + '1'
+    tokenizer.update(text)
+    assert calculator.evaluate_tokens(text + '5', tokenizer.update(text + '5'), 2) == \
+        calculator.calculate(text + '5', 2)
+    assert tokenizer.processed <= tokenizer.interval + 1
+
+def test_token_stream_stages() -> None:
+    """
+    Test that the stages give the same result for a TokenStream as for a list
+    """
+    def run(stage, tokens):
+        try:
+            result = stage(tokens)
+        except (ValueError, ZeroDivisionError) as error:
+            return type(error)
+        return result.to_list() if isinstance(result, TokenStream) else result
+
+    stage_tests = [
+        "-3+-2*-(4-5)",
+        "2^3^2-8/4/2",
+        "((2+3)*(4-1))^2",
+        "(((())))+1",
+        "(2(3))",
+        "(1+2)*(3",
+        "1.5*-2-(-3)",
+        "(4/(2-2))",
+    ]
+    for expression in stage_tests:
+        parsed = calculator.parse_input(expression)
+        merged = calculator.merge_negatives(list(parsed))
+        assert calculator.merge_negatives(TokenStream.from_tokens(parsed)).to_list() == merged, expression
+
+        resolved = run(calculator.resolve_parentheses, list(merged))
+        assert run(calculator.resolve_parentheses, TokenStream.from_tokens(merged)) == resolved, expression
+        for stage in (calculator.exponent, calculator.multi_divide, calculator.add_subtract):
+            if not isinstance(resolved, list):
+                break
+            reduced = run(stage, list(resolved))
+            assert run(stage, TokenStream.from_tokens(resolved)) == reduced, expression
+            resolved = reduced
+
+def test_long_expression_streams() -> None:
+    """
+    Test long expressions, which are reduced as TokenStreams, against short equivalents
+    """
+    repeat = 2000
+    long_tests = [
+        ("1+2*3-" * repeat + "1", str(5 * repeat + 1)),
+        ("2^2/4*" * repeat + "1", '1'),
+        ("(" * repeat + "(-8)^0.5" + ")" * repeat, calculator.calculate("(-8)^0.5", 4)[0]),
+        ("(-8)^0.5+" + "1+" * repeat + "1", 'Error: Calculation incomplete'),
+        ("1/0+" + "(-8)^0.5+" * repeat + "1", 'Error: Division by zero'),
+        ("9^999999+" + "1/0+" * repeat + "1", 'Error: Overflow due to large numbers'),
+        ("1+" * repeat + "()", 'Invalid: Improperly paired parenthesis'),
+    ]
+    for expression, expected in long_tests:
+        result, error = calculator.calculate(expression, 4)
+        assert (error or result) == expected, expression[:20]
+
+def test_codegen_backend_matches_calculate() -> None:
+    """
+    Test the codegen backend against calculate() and the interpreter on random expressions
+    """
+    rng = random.Random(13)
+
+    def expression(depth=0):
+        choice = rng.random()
+        if depth > 4 or choice < 0.3:
+            return rng.choice(['0', '1', '2', '3', '0.5', '2.25', '10', '999', 'x', 'y'])
+        if choice < 0.45:
+            return '(' + expression(depth + 1) + ')'
+        if choice < 0.5:
+            return '-' + expression(depth + 1)
+        return expression(depth + 1) + rng.choice('+-*/^') + expression(depth + 1)
+
+    for _ in range(2000):
+        text = expression()
+        codegen = calculator.compile(text, ['x', 'y'], backend='codegen')
+        interpreter = calculator.compile(text, ['x', 'y'])
+        decimal_places = rng.randint(0, 6)
+        x, y = rng.choice([0, 1, -2, 0.5, 3]), rng.choice([0, 2, -1, 1.5])
+        assert codegen.evaluate(decimal_places, x=x, y=y) == interpreter.evaluate(decimal_places, x=x, y=y), text
+        constant = text.replace('x', str(x)).replace('y', f'({y})')
+        assert calculator.compile(constant, backend='codegen').evaluate(decimal_places) == \
+            calculator.calculate(constant, decimal_places), constant
+
+    assert Calculator(backend='codegen').compile("2.0^3^2").python_source().count('**') == 2
+    assert Calculator(backend='codegen').compile("2^3^2").python_source().count('_exact_power') == 2
+    assert Calculator(cache_size=8, backend='codegen').calculate("-2^2+1/0", 2) == \
+        ("-2^2+1/0", 'Error: Division by zero')
+
+def test_exact_integers(monkeypatch) -> None:
+    """
+    Test that integer-only arithmetic is exact and predicted overflow matches float overflow
+    """
+    integer_tests = [
+        ("3^40", ('12157665459056928801', '')),
+        ("2^53+1", ('9007199254740993', '')),
+        ("12345678901234567891*3-1", ('37037036703703703672', '')),
+        ("(-2)^3*5", ('-40', '')),
+        ("7/2", ('3.5', '')),
+        ("2^-1", ('0.5', '')),
+        ("1.5*2", ('3', '')),
+        ("9^999999", ('9^999999', 'Error: Overflow due to large numbers')),
+        ("10^300*10^300", ('inf', '')),
+        ("0^-1", ('0^-1', 'Error: Division by zero')),
+    ]
+    for expression, expected in integer_tests:
+        assert calculator.calculate(expression, 4) == expected, expression
+        assert calculator.compile(expression).evaluate(4) == expected, expression
+        assert calculator.compile(expression, backend='codegen').evaluate(4) == expected, expression
+    assert calculator.tokenize("12 3+4.0").tokens == [123, '+', 4.0]
+    assert calculator.tokenize("12 3").tokens[0].__class__ is int
+
+    #long inputs reduced as float64 token streams stay exact above 2^53
+    padding = "+0" * STREAM_MIN_TOKENS
+    long_tests = [
+        ("3^40" + padding, ('12157665459056928801', '')),
+        ("9007199254740993" + padding, ('9007199254740993', '')),
+        ("9007199254740992" + "+1" * 3000, ('9007199254743992', '')),
+        ("(2^52+1)" + "*1" * 3000 + "*2", ('9007199254740994', '')),
+        ("1.5" + padding, ('1.5', '')),
+    ]
+    cached = Calculator(cache_size=8)
+    for expression, expected in long_tests:
+        assert calculator.calculate(expression, 4) == expected, expression[:20]
+        assert cached.calculate(expression, 4) == expected, expression[:20]
+    with pytest.raises(TypeError):
+        TokenStream.from_tokens([2 ** 53, '+', 1.0], exact=True)
+
+    #beyond the limit results are computed as floats, as they were before
+    monkeypatch.setattr('Calculator.INTEGER_LIMIT_BITS', 60)
+    assert calculator.calculate("3^40", 4) == (str(int(3.0 ** 40)), '')
+    assert calculator.calculate("3^40*1", 4) == (str(int(3.0 ** 40)), '')
+    assert calculator.calculate("2^30*2^29", 4) == (str(2 ** 59), '')
+
+def test_resource_limits() -> None:
+    """
+    Test token, depth, magnitude and deadline limits and cancellation
+    """
+    limit_error = 'Error: Resource limit exceeded'
+    limit_tests = [
+        ("1+2*3", ResourceLimits(max_tokens=5), ('7', '')),
+        ("1+2*3+4", ResourceLimits(max_tokens=5), ("1+2*3+4", limit_error)),
+        ("((1+2))*3", ResourceLimits(max_depth=2), ('9', '')),
+        ("(((1+2)))*3", ResourceLimits(max_depth=2), ("(((1+2)))*3", limit_error)),
+        ("9^9^9^9", ResourceLimits(max_magnitude=1e100), ("9^9^9^9", limit_error)),
+        ("2^400/2^399", ResourceLimits(max_magnitude=1e100), ("2^400/2^399", limit_error)),
+        ("10^50*10^50-1", ResourceLimits(max_magnitude=1e100), ('99999999999999999999999999999999'
+                                                                 '99999999999999999999999999999999'
+                                                                 '999999999999999999999999999999999999', '')),
+        ("1/0+9^999", ResourceLimits(max_magnitude=1e100), ("1/0+9^999", limit_error)),
+        ("0.5^-2000", ResourceLimits(max_magnitude=1e100), ("0.5^-2000", limit_error)),
+        ("0.5^-10", ResourceLimits(max_magnitude=1e100), ('1024', '')),
+        ("(-0.5)^-2001", ResourceLimits(max_magnitude=1e100), ("(-0.5)^-2001", limit_error)),
+        ("0^-1", ResourceLimits(max_magnitude=1e100), ("0^-1", 'Error: Division by zero')),
+        ("1+a", ResourceLimits(max_tokens=1), ("1+a", 'Invalid: Unexpected characters')),
+        ("2*3", ResourceLimits(timeout=0), ("2*3", limit_error)),
+        ("2*3", ResourceLimits(timeout=60), ('6', '')),
+        ("1+2*3", ResourceLimits(max_length=5), ('7', '')),
+        ("1+2*3 ", ResourceLimits(max_length=5), ("1+2*3 ", limit_error)),
+    ]
+    for expression, limits, expected in limit_tests:
+        assert calculator.calculate(expression, 4, limits=limits) == expected, expression
+
+    token = CancellationToken()
+    long_expression = "(1+2)*" * (STREAM_MIN_TOKENS // 3) + "1"
+    assert calculator.calculate(long_expression, 4, cancel=token) == calculator.calculate(long_expression, 4)
+    token.cancel()
+    assert calculator.calculate("2*3", 4, cancel=token) == ("2*3", limit_error)
+    assert calculator.calculate(long_expression, 4, cancel=CancellationToken(parent=token))[1] == limit_error
+    with pytest.raises(ResourceLimitError):
+        calculator.exponent([2, '^', 3], cancel=token)
+    assert calculator.exponent([2, '^', 3], max_magnitude=10) == [8]
+    with pytest.raises(ResourceLimitError):
+        calculator.multi_divide(TokenStream.from_tokens([2.0, '*', 30.0]), max_magnitude=10)
+
+    #oversized input stops while tokenizing, long passes check the token while reducing
+    huge = "1+" * 1000000 + "1a"
+    assert calculator.calculate(huge, 4, limits=ResourceLimits(max_tokens=1000)) == (huge, limit_error)
+    assert calculator.calculate(huge, 4, limits=ResourceLimits(timeout=0)) == (huge, limit_error)
+    stream = TokenStream.from_tokens([1.0] + ['*', 1.0] * 100000)
+    with pytest.raises(ResourceLimitError):
+        calculator.multi_divide(stream, cancel=CancellationToken(timeout=0))
+
+def test_calculate_columns() -> None:
+    """
+    Test columnar float64/uint8 batch results against calculate()
+    """
+    expressions = ["1+2", "7/2", "1/0", "(-8)^0.5", "2^0.5*3", "1+a", "(1+2", "9^999999", "2^60", ""]
+    columns = calculator.calculate_columns(expressions)
+    assert len(columns) == len(expressions)
+    assert columns.values.typecode == 'd' and columns.error_codes.typecode == 'B'
+    error_keys = list(CalculatorError.ERROR_CODES)
+    for expression, value, code, formatted in zip(
+            expressions, columns.values, columns.error_codes, columns.format(4)):
+        result, error = calculator.calculate(expression, 4)
+        if code:
+            assert value != value and formatted == ('', CalculatorError.ERROR_TYPES[error_keys[code - 1]])
+            #a complex result can't be stored as float64
+            assert error == formatted[1] or 'j' in result, expression
+        else:
+            assert not error and abs(value - float(result)) <= 1e-4 * max(1, value) and formatted == (result, ''), expression
+    assert columns.error_codes[3] == CalculatorError.get_error_code('CALCULATION_INCOMPLETE')
+
+    #preallocated buffers are filled in place
+    values = array('d', [0.0] * 4)
+    error_codes = array('B', [255] * 4)
+    columns = Calculator(cache_size=8).calculate_columns(["2*3", "1/0", "2*3"], values, error_codes)
+    assert values[0] == values[2] == 6.0 and values[1] != values[1] and list(error_codes) == [0, 8, 0, 255]
+    assert memoryview(columns.values).obj is values
+    with pytest.raises(IndexError):
+        calculator.calculate_columns(["1"] * 5, values, error_codes)
+    with pytest.raises(TypeError):
+        calculator.calculate_columns(["1"], array('f', [0.0]), error_codes)
+
+def test_calculate_shared() -> None:
+    """
+    Test batch-wide subexpression sharing against calculate() and its evaluation counts
+    """
+    shared = calculator.calculate_shared(["(1.07^12)*100", "(1.07^12)*200", "(1.07^12)*100"], 2)
+    assert shared.results == [('225.22', ''), ('450.44', ''), ('225.22', '')]
+    assert (shared.operations, shared.evaluations, shared.saved) == (6, 3, 3)
+
+    #equal values of different types or signs are not shared
+    batch = ["2^3^2", "2.0^3^2", "(-8)^0.5", "(-8)^0.5*2", "1/0+(-8)^0.5", "1/0", "(1+2", ".", "-0.0*1", "3^40"]
+    assert calculator.calculate_shared(batch * 2, 4).results == [calculator.calculate(e, 4) for e in batch * 2]
+
+    rng = random.Random(18)
+    groups = ["(1.07^12)", "(2/3)", "(4-5*6)", "(0^0)", "(1/0)", "(2^0.5)"]
+    batch = [rng.choice(groups) + rng.choice("+-*/^") + rng.choice(groups) for _ in range(500)]
+    shared = Calculator(cache_size=16).calculate_shared(batch, 3)
+    assert shared.results == [calculator.calculate(e, 3) for e in batch]
+    assert shared.evaluations <= len(groups) * 2 + len(groups) ** 2 * 5
+
+def test_command_line(tmp_path, capsys, monkeypatch) -> None:
+    """
+    Test the command line batch mode formats, exit codes, stdin and lazy process pool import
+    """
+    path = tmp_path / "expressions.txt"
+    path.write_bytes(b"1+2\r\n3/0\n2^0.5\n\n(1\n\xff")
+    expected = [calculator.calculate(e, 2) for e in ["1+2", "3/0", "2^0.5", "", "(1", "�"]]
+
+    assert calculator_main(["--batch", "--decimals", "2", str(path)]) == 1
+    assert capsys.readouterr().out.splitlines() == [error or result for result, error in expected]
+    assert calculator_main(["--batch", "--format", "jsonl", "--decimals", "2", str(path)]) == 1
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(line['result'], line['error']) for line in lines] == expected
+    assert calculator_main(["--format", "tsv", "--", "-2^2", "7*6"]) == 0
+    assert capsys.readouterr().out == "-2^2\t4\t\n7*6\t42\t\n"
+
+    #empty files and stdin are read without a memory map
+    empty = tmp_path / "empty.txt"
+    empty.write_text("")
+    monkeypatch.setattr('sys.stdin', io.TextIOWrapper(io.BytesIO(b"2*3\n4-1")))
+    assert calculator_main(["--batch", "--stats", str(empty), "-"]) == 0
+    captured = capsys.readouterr()
+    assert captured.out == "6\n3\n" and "expressions: 2" in captured.err
+
+    imported = subprocess.run(
+        [sys.executable, "-c", "import sys, Calculator; print('concurrent.futures' in sys.modules)"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert imported.stdout.strip() == "False"
+
+def test_shared_across_threads() -> None:
+    """
+    Test one calculator with small caches and metrics used by many threads at once
+    """
+    rng = random.Random(21)
+    parts = ["1.5", "2", "(3-4)", "0", "(2^0.5)", "(-8)^0.5", "10^400", "(1+", "7"]
+    expressions = [rng.choice(parts) + rng.choice("+-*/^") + rng.choice(parts) for _ in range(400)]
+    expected = {e: Calculator().calculate(e, 3) for e in expressions}
+
+    metrics = CalculatorMetrics()
+    shared = Calculator(cache_size=16, metrics=metrics)
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        def work(seed):
+            batch = random.Random(seed).sample(expressions, len(expressions))
+            return [(e, shared.calculate(e, 3)) for e in batch]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for results in executor.map(work, range(16)):
+                assert all(result == expected[e] for e, result in results)
+        threaded = list(shared.calculate_many(expressions, 3, workers=4, chunk_size=7, threads=True))
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert threaded == [expected[e] for e in expressions]
+
+    info = shared.cache_info()['results']
+    assert info.hits + info.misses == 17 * len(expressions) and info.currsize <= 16
+    assert metrics.as_dict()['calculations'] == 17 * len(expressions)
+    assert Calculator.OPERATOR_SET is shared.OPERATOR_SET
+
+def test_output_formatting() -> None:
+    """
+    Test that output formatting is identical to rounding through a decimal digits pattern and f-string
+    """
+    def reference(item, decimal_places):
+        if isinstance(item, float):
+            if re.search(r'\.\d{' + str(decimal_places) + '}', str(item)):
+                item = float(f'{item:.{decimal_places}f}')
+            if item.is_integer():
+                item = int(item)
+        return str(item)
+
+    rng = random.Random(23)
+    values = [0.0, -0.0, 1e-05, 1.5e-05, -1.2345e-05, 2.675, 0.125, 1e16, 1.5e16, 1e300, 5e-324,
+              float('inf'), float('-inf'), float('nan'), 3 ** 40, 1j + 2, '.']
+    values += [struct.unpack('d', struct.pack('Q', rng.getrandbits(64)))[0] for _ in range(3000)]
+    values += [rng.randint(-10 ** 6, 10 ** 6) / 10 ** rng.randint(0, 12) for _ in range(3000)]
+    values += [round(rng.uniform(-100, 100), rng.randint(0, 6)) + rng.choice([5e-9, -5e-9]) for _ in range(3000)]
+    for decimal_places in range(-1, 17):
+        expected = [reference(value, decimal_places) for value in values]
+        assert [calculator.output_clean_convert([value], decimal_places) for value in values] == expected
+        assert calculator.format_values(values, decimal_places) == expected
+    assert calculator.output_clean_convert([1.25, '+', 2.0], 1) == '1.2+2'
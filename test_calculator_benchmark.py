@@ -0,0 +1,74 @@
+from Calculator import Calculator
+from Calculator_benchmark import (
+    SHAPES, STAGES, generate_batch, generate_shaped_expression, benchmark_stages, benchmark_threads,
+    scaling_exponents, compare_results, confirm_regressions)
+
+calculator = Calculator()
+
+def test_shaped_expressions() -> None:
+    """
+    Test that every benchmark shape generates a valid expression
+    """
+    for shape in SHAPES:
+        for tokens in (1, 10, 1000):
+            expression = generate_shaped_expression(shape, tokens)
+            assert calculator.calculate(expression, 4)[1] == '', (shape, tokens)
+
+def test_benchmark_stages() -> None:
+    """
+    Test that every stage is measured for every shape and size
+    """
+    rows = benchmark_stages([10, 100], ['mixed', 'nested'], repeat=1)
+    measured = {(row['shape'], row['stage'], row['tokens']) for row in rows}
+    assert measured == {(shape, stage, size)
+                        for shape in ('mixed', 'nested') for stage in STAGES for size in (10, 100)}
+
+def test_scaling_exponents() -> None:
+    """
+    Test the fitted exponent of linear and quadratic timings
+    """
+    rows = [{'shape': 'mixed', 'stage': stage, 'tokens': size, 'seconds': size ** power * 1e-4}
+            for stage, power in (('linear', 1), ('quadratic', 2)) for size in (10, 100, 1000)]
+    exponents = {row['stage']: round(row['exponent'], 6) for row in scaling_exponents(rows)}
+    assert exponents == {'linear': 1, 'quadratic': 2}
+
+def test_compare_results() -> None:
+    """
+    Test that slower and dropped stages are reported as regressions
+    """
+    baseline = [
+        {'shape': 'mixed', 'stage': 'tokenize', 'tokens': 100, 'seconds': 0.01},
+        {'shape': 'mixed', 'stage': 'compile', 'tokens': 100, 'seconds': 0.01},
+        {'shape': 'mixed', 'stage': 'evaluate', 'tokens': 100, 'seconds': 0.01},
+        {'shape': 'mixed', 'stage': 'exponent', 'tokens': 100, 'seconds': 0.00001},
+    ]
+    current = [
+        {'shape': 'mixed', 'stage': 'tokenize', 'tokens': 100, 'seconds': 0.012},
+        {'shape': 'mixed', 'stage': 'compile', 'tokens': 100, 'seconds': 0.03},
+        {'shape': 'mixed', 'stage': 'exponent', 'tokens': 100, 'seconds': 0.001},
+    ]
+    regressions = compare_results(current, baseline, 1.5)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('mixed/compile at 100 tokens')
+    assert regressions[1] == 'mixed/evaluate at 100 tokens: no longer finishes within the time budget'
+
+def test_confirm_regressions() -> None:
+    """
+    Test that a noisy slow measurement is measured again and a real slowdown is still reported
+    """
+    baseline = benchmark_stages([1000], ['additive'], repeat=3)
+    noisy = [dict(row, seconds=row['seconds'] * (100 if row['stage'] == 'compile' else 1)) for row in baseline]
+    assert compare_results(noisy, baseline, 3, min_seconds=0)
+    assert confirm_regressions(noisy, baseline, 3, repeat=3, min_seconds=0) == []
+
+    faster_baseline = [dict(row, seconds=row['seconds'] / 100) for row in baseline]
+    regressions = confirm_regressions([dict(row) for row in baseline], faster_baseline, 3, repeat=1, min_seconds=0)
+    assert len(regressions) == len(STAGES)
+
+def test_benchmark_threads() -> None:
+    """
+    Test that every thread count up to the maximum is measured on the same batch
+    """
+    rows = benchmark_threads(generate_batch(200, 4), 3, chunk_size=16, cache_size=32)
+    assert [row['threads'] for row in rows] == [1, 2, 3]
+    assert rows[0]['speedup'] == 1.0 and all(row['expressions_per_second'] > 0 for row in rows)
@@ -0,0 +1,95 @@
+import multiprocessing
+import sqlite3
+import Calculator as calc
+from Calculator import Calculator
+from Calculator_cache import PersistentCache
+from Calculator_fuzz import generate_corpus
+
+calculator = Calculator()
+
+def test_persistent_results(tmp_path, monkeypatch) -> None:
+    """
+    Test that results and compiled expressions stored by one calculator are found by another
+    """
+    path = str(tmp_path / "cache.sqlite3")
+    corpus = generate_corpus(500, seed=24) + ["3^40", "9" * 400 + "*0", "2^0.5", "(-8)^0.5", ".", "1 2+3"]
+    expected = [calculator.calculate(e, 3) for e in corpus]
+
+    first = Calculator(cache_size=64, persistent_cache=PersistentCache(path))
+    assert [first.calculate(e, 3) for e in corpus] == expected
+    #entries are written in batches, other processes find them after a flush
+    first.persistent_cache.flush()
+    second = Calculator(cache_size=64, persistent_cache=PersistentCache(path))
+    assert [second.calculate(e, 3) for e in corpus] == expected
+    assert second.persistent_cache.info().misses == 0
+    assert second.calculate("12+3", 3) == ('15', '')
+
+    #other decimal places reuse the stored compiled expressions, with any backend
+    codegen = Calculator(cache_size=64, backend='codegen', persistent_cache=PersistentCache(path))
+    assert [codegen.calculate(e, 1) for e in corpus] == [calculator.calculate(e, 1) for e in corpus]
+    info = codegen.persistent_cache.info()
+    assert info.misses == len(set(e.replace(' ', '') for e in corpus)) and info.hits >= info.misses
+
+    #results of another engine version or integer limit are not used
+    monkeypatch.setattr(calc, 'INTEGER_LIMIT_BITS', 60)
+    limited = Calculator(cache_size=64, persistent_cache=PersistentCache(path))
+    assert limited.calculate("3^40", 3) == (str(int(3.0 ** 40)), '')
+    assert limited.persistent_cache.info().hits == 0
+
+def test_persistent_eviction(tmp_path) -> None:
+    """
+    Test that each table is kept at max_entries, the oldest entries going first
+    """
+    cache = PersistentCache(str(tmp_path / "cache.sqlite3"), max_entries=20)
+    limited = Calculator(cache_size=4, persistent_cache=cache)
+    for number in range(100):
+        limited.calculate(f"{number}+1", 2)
+    info = cache.info()
+    assert info.currsize == 40 and info.evictions == 160
+    assert cache.get_result("99+1", 2) == ('100', '') and cache.get_result("0+1", 2) is None
+    cache.clear()
+    assert cache.info().currsize == 0
+
+    #short-lived caches sharing the file enforce the limit together
+    path = str(tmp_path / "shared.sqlite3")
+    for run in range(5):
+        short = Calculator(cache_size=4, persistent_cache=PersistentCache(path, max_entries=100))
+        for number in range(run * 80, run * 80 + 80):
+            short.calculate(f"{number}*2", 2)
+        short.persistent_cache.close()
+    shared = PersistentCache(path, max_entries=100)
+    assert shared.info().currsize == 200
+    assert shared.get_result("399*2", 2) == ('798', '') and shared.get_result("299*2", 2) is None
+
+    #unreadable stored programs are misses
+    connection = sqlite3.connect(path)
+    connection.execute("UPDATE compiled SET program = '{\"constants\": [1]}' WHERE expression = '399*2'")
+    connection.execute("UPDATE compiled SET program = 'not json' WHERE expression = '398*2'")
+    connection.execute("UPDATE compiled SET program = replace(program, '\"*\"', '\"%\"') WHERE expression = '397*2'")
+    connection.commit()
+    connection.close()
+    reader = Calculator(cache_size=4, persistent_cache=PersistentCache(path))
+    for number in (399, 398, 397):
+        assert reader.calculate(f"{number}*2", 3) == (str(number * 2), '')
+    #a result and a compiled expression looked up for each
+    assert reader.persistent_cache.info().misses == 6
+
+def test_persistent_processes(tmp_path) -> None:
+    """
+    Test concurrent use of one cache file by worker processes and an unreadable cache file
+    """
+    path = str(tmp_path / "cache.sqlite3")
+    corpus = generate_corpus(400, seed=25)
+    expected = [calculator.calculate(e, 4) for e in corpus]
+    shared = Calculator(cache_size=16, persistent_cache=PersistentCache(path))
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=3, mp_context=multiprocessing.get_context('spawn')) as executor:
+        assert list(shared.calculate_many(corpus * 2, 4, chunk_size=50, executor=executor)) == expected * 2
+    fresh = Calculator(cache_size=16, persistent_cache=PersistentCache(path))
+    assert [fresh.calculate(e, 4) for e in corpus] == expected
+    assert fresh.persistent_cache.info().misses == 0
+
+    broken = tmp_path / "broken.sqlite3"
+    broken.write_bytes(b"not a database" * 100)
+    unreadable = Calculator(cache_size=16, persistent_cache=PersistentCache(str(broken)))
+    assert [unreadable.calculate(e, 4) for e in corpus[:50]] == expected[:50]
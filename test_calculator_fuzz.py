@@ -0,0 +1,50 @@
+import random
+import pytest
+from Calculator import ENGINES, STREAM_MIN_TOKENS, Calculator
+from Calculator_fuzz import (differential, generate_corpus, generate_expression, generate_long_expression,
+                             mutate_expression)
+
+def test_engines_agree() -> None:
+    """
+    Test that every engine returns the same (result, error) tuples on a fuzzed corpus
+    """
+    result = differential(generate_corpus(3000, seed=22), ENGINES, 3)
+    assert result.mismatches == []
+    assert result.count == 3000 and set(result.throughput) == set(ENGINES)
+    assert result.errors[''] > 1000 and len(result.errors) >= 10
+
+    for engine in ENGINES:
+        calculator = Calculator(engine=engine)
+        assert calculator.calculate("-2*(2+3)^-1*.5", 2) == ('-0.2', '')
+        assert calculator.compute("3^40") == (3 ** 40, '')
+        assert calculator.compute("1/0") == (None, 'DIVISION_BY_ZERO')
+    with pytest.raises(ValueError):
+        Calculator(engine='turbo')
+
+def test_engines_agree_on_long_expressions() -> None:
+    """
+    Test that the engines agree on flat and nested expressions long enough for token streams
+    """
+    rng = random.Random(15)
+    calculator = Calculator()
+    expressions = [generate_long_expression(rng) for _ in range(12)]
+    assert all(len(calculator.tokenize(e).tokens) >= STREAM_MIN_TOKENS for e in expressions)
+    result = differential(expressions, ENGINES, 2)
+    assert result.mismatches == []
+    assert result.errors[''] >= 10
+    #exact integer results above 2^53 are among them
+    values = [calculator.compute(e)[0] for e in expressions]
+    assert any(value.__class__ is int and abs(value) > 2 ** 53 for value in values)
+
+def test_generator() -> None:
+    """
+    Test that generated expressions are valid and mutations make them invalid
+    """
+    rng = random.Random(22)
+    calculator = Calculator()
+    input_errors = 0
+    for _ in range(500):
+        expression = generate_expression(rng)
+        assert not calculator.tokenize(expression).error_key, expression
+        input_errors += bool(calculator.tokenize(mutate_expression(rng, expression)).error_key)
+    assert input_errors > 150
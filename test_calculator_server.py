@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import pytest
+from Calculator import Calculator
+from Calculator_server import CalculatorServer, CalculatorClient
+
+calculator = Calculator()
+
+def run(coroutine):
+    """Run a coroutine on a new event loop."""
+    return asyncio.run(coroutine)
+
+def test_server_pipelined_requests() -> None:
+    """
+    Test that pipelined requests are answered in order with calculate() results
+    """
+    expressions = ["3+5", "10/3", "3/0", "", "2++3", "(2+3", "2^3^2"] * 20
+
+    async def scenario():
+        server = CalculatorServer(max_pending=8, batch_size=5)
+        host, port = await server.start()
+        try:
+            async with await CalculatorClient.connect(host, port) as client:
+                many = await client.calculate_many(expressions, 3)
+                single = await asyncio.gather(*(client.calculate(expression, 2) for expression in expressions[:7]))
+            return many, single
+        finally:
+            await server.close()
+
+    many, single = run(scenario())
+    assert many == [calculator.calculate(expression, 3) for expression in expressions]
+    assert single == [calculator.calculate(expression, 2) for expression in expressions[:7]]
+
+def test_server_invalid_requests() -> None:
+    """
+    Test responses to malformed requests, which keep their place in the order
+    """
+    async def scenario():
+        server = CalculatorServer()
+        host, port = await server.start()
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b'{"id": 1, "expr": "2*3"}\nnot json\n{"id": 3, "expr": 5}\n'
+                         b'{"id": 4, "expr": "1/3", "decimal_places": 2}\n')
+            await writer.drain()
+            responses = [json.loads(await reader.readline()) for _ in range(4)]
+            writer.close()
+            return responses
+        finally:
+            await server.close()
+
+    responses = run(scenario())
+    assert responses[0] == {'id': 1, 'result': '6', 'error': ''}
+    assert responses[1]['error'] == 'Invalid request: malformed JSON'
+    assert responses[2] == {'id': 3, 'result': '', 'error': 'Invalid request: "expr" must be a string'}
+    assert responses[3] == {'id': 4, 'result': '0.33', 'error': ''}
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='Unix sockets are not available')
+def test_server_unix_socket(tmp_path) -> None:
+    """
+    Test serving over a Unix socket
+    """
+    async def scenario():
+        server = CalculatorServer()
+        path = await server.start_unix(str(tmp_path / 'calculator.sock'))
+        try:
+            async with await CalculatorClient.connect_unix(path) as client:
+                return await client.calculate("(2+3)*4")
+        finally:
+            await server.close()
+
+    assert run(scenario()) == ('20', '')
+
+def process_stat(pid):
+    """State and parent pid of a process from /proc, or None once it is gone or a zombie."""
+    try:
+        with open(f'/proc/{pid}/stat') as stat_file:
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return None if fields[0] == 'Z' else (fields[0], int(fields[1]))
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='needs /proc to find child processes')
+def test_server_stops_workers() -> None:
+    """
+    Test that SIGTERM stops a server started with --workers and its worker processes
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Calculator_server.py')
+    process = subprocess.Popen([sys.executable, script, '--port', '0', '--workers', '2'],
+                               stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(process.stdout.readline().rsplit(':', 1)[1])
+
+        async def scenario():
+            async with await CalculatorClient.connect('127.0.0.1', port) as client:
+                return await client.calculate_many(["1+2", "2*3"] * 20, 2)
+
+        assert run(scenario()) == [('3', ''), ('6', '')] * 20
+        workers = [int(pid) for pid in os.listdir('/proc')
+                   if pid.isdigit() and (process_stat(pid) or (None, None))[1] == process.pid]
+        assert len(workers) == 2
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
+        assert [process_stat(worker) for worker in workers] == [None, None]
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
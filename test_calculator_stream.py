@@ -0,0 +1,74 @@
+import io
+import random
+from Calculator import Calculator
+from Calculator_stream import calculate_mapped_file, calculate_stream, iter_pieces
+
+calculator = Calculator()
+
+def test_stream_matches_calculate() -> None:
+    """
+    Test streamed calculation against calculate() at several chunk sizes, including error order
+    """
+    stream_tests = [
+        "3+5*2", "2^3^2", "-2^2", "(1+2)(3)", "2(3)^2", "(2(3))", "1 2 . 5+1", ". 5",
+        ".", ".+1", "(1+())", "()", "(3+)", "(+3)", "(2)-3", "1/0+9^999999", "9^999999+1/0",
+        "(-8)^0.5", "(-8)^0.5+1", "(1/0)+(2^9999)", ")(", "1+*2", "1..2", "(1+2", "+1", "1+",
+        "", "   ", "1+a", "((2^0.5)^2)*3",
+    ]
+    for expression in stream_tests:
+        result, error = calculator.calculate(expression, 3)
+        expected = ('' if error else result, error)
+        for chunk_size in (1, 2, 3, 4096):
+            assert calculate_stream(expression, 3, chunk_size=chunk_size) == expected, (expression, chunk_size)
+
+    rng = random.Random(14)
+
+    def expression(depth=0):
+        choice = rng.random()
+        if depth > 5 or choice < 0.3:
+            return rng.choice(['0', '1', '2', '3', '0.5', '10', '99', '. 5', '1 0'])
+        if choice < 0.45:
+            return '(' + expression(depth + 1) + ')'
+        if choice < 0.5:
+            return '-' + expression(depth + 1)
+        return expression(depth + 1) + rng.choice('+-*/^') + expression(depth + 1)
+
+    for _ in range(2000):
+        text = expression()
+        result, error = calculator.calculate(text, 4)
+        chunk_size = rng.choice([1, 2, 5, 64])
+        assert calculate_stream(text, 4, chunk_size=chunk_size) == ('' if error else result, error), text
+
+def test_stream_chunk_boundaries() -> None:
+    """
+    Test that pieces split across chunks are scanned as calculate() scans the whole input
+    """
+    text = "12 3. 4 5+. 6-7 . *8"
+    expected = [piece for piece in iter_pieces([text])]
+    for chunk_size in range(1, len(text) + 1):
+        chunks = [text[start:start + chunk_size] for start in range(0, len(text), chunk_size)]
+        assert list(iter_pieces(chunks)) == expected, chunk_size
+
+def test_stream_sources(tmp_path) -> None:
+    """
+    Test file, binary, memory-mapped and chunk iterable sources and trailing line breaks
+    """
+    repeat = 5000
+    text = "(1+2*3-4)/2+" * repeat + "1"
+    expected = (str(1.5 * repeat + 1).rstrip('0').rstrip('.'), '')
+    path = tmp_path / "expression.txt"
+    path.write_text(text + "\n")
+    assert calculate_stream(io.StringIO(text), 2, chunk_size=7) == expected
+    assert calculate_stream(io.BytesIO(text.encode() + b"\r\n"), 2, chunk_size=7) == expected
+    assert calculate_stream([text[:10], text[10:].encode()], 2) == expected
+    assert calculate_mapped_file(str(path), 2, chunk_size=100) == expected
+    assert calculate_stream("1+2\n+3", 2)[1] == 'Invalid: Unexpected characters'
+    assert calculate_stream("1+2é", 2)[1] == 'Invalid: Unexpected characters'
+
+    empty = tmp_path / "empty.txt"
+    empty.write_text("")
+    assert calculate_mapped_file(str(empty), 2)[1] == 'Invalid: No expression'
+
+    deep = tmp_path / "deep.txt"
+    deep.write_text("(" * repeat + "1/0" + ")" * repeat)
+    assert calculate_mapped_file(str(deep), 2) == ('', 'Error: Division by zero')
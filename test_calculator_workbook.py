@@ -0,0 +1,83 @@
+import pytest
+from Calculator import Calculator
+from Calculator_workbook import CircularReferenceError, Workbook
+
+calculator = Calculator()
+
+def test_workbook_matches_calculate() -> None:
+    """
+    Test cell results against calculate() with the referenced values substituted
+    """
+    workbook = Workbook()
+    workbook.set('a', '2')
+    workbook.set('b', '0.5')
+    workbook.set('c', 'a^3*(b+1)')
+    workbook.set('d', 'c/(a-2)')
+    workbook.set('e', '(-8)^b')
+    workbook.set('f', 'e+1')
+    workbook.set('g', '-a^2')
+    workbook.set('h', 3 ** 40)
+    workbook.set('i', 'h+1')
+    workbook.set('j', '1+*a')
+    workbook.set('k', 'j*2')
+    cell_tests = [
+        ('a', '2'), ('b', '0.5'), ('c', '2^3*(0.5+1)'), ('d', '12/(2-2)'), ('e', '(-8)^0.5'),
+        ('g', '-2^2'), ('j', '1+*2'),
+    ]
+    for name, expression in cell_tests:
+        result, error = calculator.calculate(expression, 4)
+        assert workbook.get(name, 4) == (workbook.formula(name) if error else result, error), name
+    assert workbook.get('f', 4) == ('e+1', 'Error: Calculation incomplete')
+    assert workbook.get('i', 4) == calculator.calculate(str(3 ** 40) + '.0+1', 4)
+    assert workbook.get('k', 4) == ('j*2', 'Invalid: Consecutive operators')
+
+def test_workbook_incremental_recalculation() -> None:
+    """
+    Test that only cells downstream of a change are recalculated, in dependency order
+    """
+    workbook = Workbook()
+    workbook.set('x', '1')
+    workbook.set('y', '2')
+    for index in range(100):
+        workbook.set(f'x{index}', f'x+{index}')
+        workbook.set(f'y{index}', f'y*{index}')
+    workbook.set('total', 'x99+y99')
+    workbook.set('diamond', 'x0+x1+total')
+
+    recalculated = workbook.set('x', '5')
+    assert len(recalculated) == 1 + 100 + 2
+    assert recalculated.index('x99') < recalculated.index('total') < recalculated.index('diamond')
+    assert workbook.get('total', 2) == ('302', '')
+    assert workbook.get('diamond', 2) == ('313', '')
+
+    #a dependent whose value does not change stops the recalculation there
+    workbook.set('z', 'y0+1')
+    recalculated = workbook.set('y', '3')
+    assert len(recalculated) == 1 + 100 + 2 and 'z' not in recalculated
+    assert workbook.get('z', 2) == ('1', '')
+    assert workbook.set('x', '5') == ['x']
+
+def test_workbook_references() -> None:
+    """
+    Test circular references, undefined and removed cells and redefinitions
+    """
+    workbook = Workbook()
+    workbook.set('a', 'b+1')
+    assert workbook.get('a', 2) == ('b+1', 'Invalid: Undefined cell reference')
+    assert workbook.set('b', '2') == ['b', 'a']
+    assert workbook.get('a', 2) == ('3', '')
+    workbook.set('c', 'a*2')
+
+    for name, formula in [('a', 'a+1'), ('b', 'c-1'), ('b', 'a')]:
+        with pytest.raises(CircularReferenceError):
+            workbook.set(name, formula)
+    assert workbook.formula('b') == '2' and workbook.get('c', 2) == ('6', '')
+
+    assert workbook.set('a', '10') == ['a', 'c']
+    assert workbook.dependents('b') == frozenset()
+    assert workbook.remove('a') == ['c']
+    assert workbook.get('c', 2) == ('a*2', 'Invalid: Undefined cell reference')
+    assert workbook.set('b', 'c') == ['b']
+
+    with pytest.raises(ValueError):
+        workbook.set('1a', '2')